@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+    Script that creates the indexes of the database that do not exist yet. The tables of a new database are created
+    with their indexes, this is used to migrate a database created by a previous version. It can be run several
+    times, it uses the same configuration file as the app:
+    CONFIG_FILE_PATH=<Path to your configuration file> python3 -m admin_tasks.create_db_indexes
+    In PostgreSQL, creating an index blocks the writes to its table while it is created, with a large table it is
+    better to run it when the system is not receiving jobs.
+"""
+from app import create_app
+from app.models import delayed_job_models
+
+
+def run():
+    """
+    Runs the script
+    """
+    flask_app = create_app()
+    with flask_app.app_context():
+        indexes_created = delayed_job_models.create_missing_indexes()
+
+    if len(indexes_created) == 0:
+        print('All the indexes already exist')
+    for index_name in indexes_created:
+        print(f'Created index {index_name}')
+
+if __name__ == "__main__":
+    run()
@@ -10,17 +10,26 @@ from app.blueprints.job_status.controllers.job_status_controller import JOB_STAT
 from app.blueprints.job_submission.controllers.job_submissions_controller import SUBMISSION_BLUEPRINT
 from app.blueprints.custom_statistics.controllers.custom_statistics_controller import CUSTOM_STATISTICS_BLUEPRINT
 from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import submission_queue
+from app.blueprints.job_submission.services import requirements_calculation_service
 from app.blueprints.swagger_description.swagger_description_blueprint import SWAGGER_BLUEPRINT
 from app.config import RUN_CONFIG
 from app.config import RunEnvs
 from app.db import DB
 from app.models import delayed_job_models
+from app.models import job_configs_cache
 from app.cache import CACHE
 from app.rate_limiter import RATE_LIMITER
+from app import script_templates
+from app import executors
+from app.executors import lsf_executor
+from app.executors import local_executor
 
-def create_app():
+
+def create_app(is_submission_worker=False):
     """
     Creates the flask app
+    :param is_submission_worker: True if the app is created for a process of the submission queue
     :return: Delayed jobs flask app
     """
 
@@ -35,6 +44,12 @@ def create_app():
     flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = RUN_CONFIG.get('sql_alchemy').get('track_modifications')
     flask_app.config['SECRET_KEY'] = RUN_CONFIG.get('server_secret_key')
 
+    # The templates are validated when starting so a broken template is noticed before submitting any job
+    script_templates.load_templates()
+
+    executors.register_backend(executors.LSF_EXECUTOR, lsf_executor)
+    executors.register_backend(executors.LOCAL_EXECUTOR, local_executor)
+
     enable_cors = RUN_CONFIG.get('enable_cors', False)
 
     if enable_cors:
@@ -52,10 +67,19 @@ def create_app():
         if create_tables:
             DB.create_all()
 
+        # The configs cached belong to the database of a previous app, if any
+        job_configs_cache.clear()
+        requirements_calculation_service.clear_cache()
+
         generate_default_config = RUN_CONFIG.get('generate_default_config', False)
         if generate_default_config:
             delayed_job_models.generate_default_job_configs()
 
+        if submission_queue.QUEUE_ENABLED and not is_submission_worker:
+            # All the server processes try to recover the jobs after a restart, each job is claimed in the database
+            # by only one of them
+            job_submission_service.recover_unsubmitted_jobs()
+
         flask_app.register_blueprint(SWAGGER_BLUEPRINT, url_prefix=f'{base_path}/swagger')
         flask_app.register_blueprint(SUBMISSION_BLUEPRINT, url_prefix=f'{base_path}/submit')
         flask_app.register_blueprint(JOB_STATUS_BLUEPRINT, url_prefix=f'{base_path}/status')
@@ -33,4 +33,20 @@ def delete_output_files_for_job(job_id):
 def delete_expired_jobs():
 
     operation_result = admin_tasks_service.delete_expired_jobs()
-    return jsonify({'operation_result': operation_result})
\ No newline at end of file
+    return jsonify({'operation_result': operation_result})
+
+@ADMIN_TASKS_BLUEPRINT.route('/job_configs_cache/invalidate', methods = ['POST'])
+@admin_token_required
+@validate_form_with(marshmallow_schemas.InvalidateJobConfigsCacheOperation)
+def invalidate_job_configs_cache():
+
+    form_data = request.form
+    job_type = form_data.get('job_type')
+    operation_result = admin_tasks_service.invalidate_job_configs_cache(job_type)
+    return jsonify({'operation_result': operation_result})
+
+@ADMIN_TASKS_BLUEPRINT.route('/job_configs_cache/stats', methods = ['GET'])
+@admin_token_required
+def get_job_configs_cache_stats():
+
+    return jsonify(admin_tasks_service.get_job_configs_cache_stats())
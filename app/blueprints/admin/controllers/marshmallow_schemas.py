@@ -13,4 +13,10 @@ class DeleteAllOutputsOfJobOperation(Schema):
     """
     Class that defines the schema of the operation that deletes the outputs of a job by id
     """
-    job_id = fields.String(required=True)
\ No newline at end of file
+    job_id = fields.String(required=True)
+
+class InvalidateJobConfigsCacheOperation(Schema):
+    """
+    Class that defines the schema of the operation that invalidates the cached configurations of the job types
+    """
+    job_type = fields.String()
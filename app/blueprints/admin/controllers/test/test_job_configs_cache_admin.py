@@ -0,0 +1,59 @@
+"""
+Tests for the administration of the cache of the configurations of the job types
+"""
+import unittest
+
+from app import create_app
+from app.authorisation import token_generator
+from app.models import delayed_job_models
+from app.models import job_configs_cache
+
+
+class TestJobConfigsCacheAdmin(unittest.TestCase):
+    """
+    Class to test the administration of the cache of the configurations of the job types
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+
+    def test_invalidates_the_configs_of_a_job_type(self):
+        """
+        Tests that the configs of a job type can be invalidated with the admin endpoint
+        """
+        with self.flask_app.app_context():
+            delayed_job_models.get_job_config('DOWNLOAD')
+            delayed_job_models.get_job_config('TEST')
+
+            admin_token = token_generator.generate_admin_token()
+            response = self.client.post('/admin/job_configs_cache/invalidate', data={'job_type': 'DOWNLOAD'},
+                                        headers={'X-Admin-Key': admin_token})
+            self.assertEqual(response.status_code, 200, msg='The configs were not invalidated!')
+
+            stats_got = job_configs_cache.get_stats()
+            self.assertEqual(stats_got['num_cached_values'], 1, msg='Only the configs of the type given must be removed!')
+            self.assertEqual(stats_got['invalidations'], 1, msg='The invalidation was not counted!')
+
+    def test_returns_the_stats_of_the_cache(self):
+        """
+        Tests that the counters of the cache are returned by the admin endpoint
+        """
+        with self.flask_app.app_context():
+            delayed_job_models.get_job_config('DOWNLOAD')
+            delayed_job_models.get_job_config('DOWNLOAD')
+
+            admin_token = token_generator.generate_admin_token()
+            response = self.client.get('/admin/job_configs_cache/stats', headers={'X-Admin-Key': admin_token})
+            self.assertEqual(response.status_code, 200, msg='The stats were not returned!')
+
+            stats_got = response.json
+            self.assertEqual(stats_got['hits'], 1, msg='The hits were not returned correctly!')
+            self.assertEqual(stats_got['misses'], 1, msg='The misses were not returned correctly!')
+
+    def test_requires_an_admin_token(self):
+        """
+        Tests that the cache can not be administered without an admin token
+        """
+        response = self.client.get('/admin/job_configs_cache/stats')
+        self.assertEqual(response.status_code, 403, msg='The stats must require an admin token!')
@@ -8,6 +8,7 @@ import shutil
 from flask import abort
 
 from app.models import delayed_job_models
+from app.models import job_configs_cache
 
 
 class JobNotFoundError(Exception):
@@ -51,3 +52,23 @@ def delete_expired_jobs():
     """
     num_deleted = delayed_job_models.delete_all_expired_jobs()
     return f'Deleted {num_deleted} expired jobs'
+
+def invalidate_job_configs_cache(job_type):
+    """
+    Invalidates the cached configurations of the job type given, or all of them. The other server processes see the
+    invalidation only if the app cache is shared by all of them (redis or memcached), otherwise they see the changes
+    when their cached values expire.
+    :param job_type: type of the job for which to invalidate the configurations, None to invalidate all of them
+    :return: a message (string) with the result of the operation
+    """
+    num_invalidated = delayed_job_models.invalidate_job_configs_cache(job_type)
+    job_types_desc = 'all job types' if job_type is None else f'jobs of type {job_type}'
+    processes_desc = 'all the server processes' if job_configs_cache.GENERATIONS_ARE_SHARED else \
+        'this server process only, the others see the changes when their cached values expire'
+    return f'Invalidated {num_invalidated} cached configurations for {job_types_desc} in {processes_desc}'
+
+def get_job_configs_cache_stats():
+    """
+    :return: a dict with the counters of the job configs cache
+    """
+    return job_configs_cache.get_stats()
@@ -3,27 +3,89 @@ The blueprint used for handling the jobs status
 """
 import re
 
-from flask import Blueprint, jsonify, abort, request, send_file
+from flask import Blueprint, jsonify, abort, request, send_file, make_response
 
 from app.authorisation.decorators import token_required_for_job_id
 from app.blueprints.job_status.services import job_status_service
 from app.blueprints.job_status.controllers import marshmallow_schemas
-from app.request_validation.decorators import validate_form_with, validate_url_params_with
+from app.request_validation.decorators import validate_form_with, validate_url_params_with, validate_args_with, \
+    validate_json_with
 from app.rate_limiter import RATE_LIMITER
 from app.config import RUN_CONFIG
 
 JOB_STATUS_BLUEPRINT = Blueprint('job_status', __name__)
 
+STATUS_VERSION_HEADER = 'X-Job-Status-Version'
+
 
 @JOB_STATUS_BLUEPRINT.route('/<job_id>', methods=['GET'])
 @validate_url_params_with(marshmallow_schemas.JobStatus)
 def get_job_status(job_id):
+    try:
+        # The version is read before the status, so the client never gets a version newer than the status
+        status_version = job_status_service.get_job_status_version(job_id)
+    except job_status_service.JobNotFoundError:
+        abort(404)
+    return get_job_status_response(job_id, status_version)
+
+
+@JOB_STATUS_BLUEPRINT.route('/<job_id>/changes', methods=['GET'])
+@validate_url_params_with(marshmallow_schemas.JobStatus)
+@validate_args_with(marshmallow_schemas.JobStatusChanges)
+def wait_for_job_status_change(job_id):
+    """
+    Long polling of the status of a job. It waits until the status changes from the version given in the parameter
+    since, the version is in the header X-Job-Status-Version of the status responses. If it changes before the time
+    given in the parameter wait, it returns the new status, otherwise it returns 304 Not Modified. If the job does not
+    exist it returns 404 without waiting.
+    """
+    since_version = request.args.get('since')
+    wait_seconds = request.args.get('wait', type=float)
+    try:
+        if since_version is None:
+            return get_job_status_response(job_id, job_status_service.get_job_status_version(job_id))
+
+        status_version = job_status_service.wait_for_job_status_change(job_id, since_version, wait_seconds)
+    except job_status_service.JobNotFoundError:
+        abort(404)
+
+    if status_version == since_version:
+        response = make_response('', 304)
+        response.headers[STATUS_VERSION_HEADER] = status_version
+        return response
+
+    return get_job_status_response(job_id, status_version)
+
+
+@JOB_STATUS_BLUEPRINT.route('/bulk', methods=['POST'])
+@RATE_LIMITER.limit(RUN_CONFIG.get('rate_limit').get('rates').get('bulk_job_status'))
+@validate_json_with(marshmallow_schemas.BulkJobStatus)
+def get_jobs_statuses():
+    # remove scheme so client can decide which one to use
+    raw_host_url = request.host_url
+    server_base_url = re.sub(r'^https?://', '', raw_host_url)
+
+    job_ids = request.get_json()['job_ids']
+    return jsonify(job_status_service.get_jobs_statuses(job_ids, server_base_url))
+
+
+def get_job_status_response(job_id, status_version):
+    """
+    :param job_id: id of the job
+    :param status_version: version of the status of the job, read before the status
+    :return: the response with the status of the job
+    """
     try:
         # remove scheme so client can decide which one to use
         raw_host_url = request.host_url
         server_base_url = re.sub(r'^https?://', '', raw_host_url)
 
-        return jsonify(job_status_service.get_job_status(job_id, server_base_url))
+        job_status, etag = job_status_service.get_job_status_and_etag(job_id, server_base_url)
+        response = jsonify(job_status)
+        response.set_etag(etag)
+        response.headers[STATUS_VERSION_HEADER] = status_version
+        # Answers 304 Not Modified if the client sent the same etag in If-None-Match
+        return response.make_conditional(request)
     except job_status_service.JobNotFoundError:
         abort(404)
 
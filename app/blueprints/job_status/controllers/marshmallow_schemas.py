@@ -3,12 +3,29 @@ Schemas to validate the input of job status Endpoint
 """
 from marshmallow import Schema, fields, validate
 
+MAX_JOBS_PER_BULK_STATUS = 100
+
 class JobStatus(Schema):
     """
     Class that the schema for getting a job status job by id
     """
     job_id = fields.String(required=True)
 
+class JobStatusChanges(Schema):
+    """
+    Class that the schema for waiting for the changes of a job status
+    """
+    since = fields.String()
+    wait = fields.Number(validate=validate.Range(min=0))
+
+class BulkJobStatus(Schema):
+    """
+    Class that the schema for getting the status of several jobs at once
+    """
+    job_ids = fields.List(fields.String(), required=True,
+                          validate=validate.Length(min=1, max=MAX_JOBS_PER_BULK_STATUS))
+
+
 class JobInputFileRequest(Schema):
     """
     Class that the schema for getting a the input file of a job
@@ -23,4 +40,3 @@ class JobStatusUpdate(Schema):
     progress = fields.Number(required=True, validate=validate.Range(min=0, max=100))
     status_log = fields.String()
     status_description = fields.String()
-
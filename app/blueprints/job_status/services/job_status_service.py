@@ -2,6 +2,8 @@
 Module that provides a service to get or modify the status or jobs
 """
 from app.models import delayed_job_models
+from app.models import job_status_cache
+from app.models import job_status_broker
 
 class JobNotFoundError(Exception):
     """Base class for exceptions."""
@@ -17,14 +19,100 @@ def get_job_status(job_id, server_base_url='http://0.0.0.0:5000'):
     :param server_base_url: url to use as base for building the output files urls
     :return: a dict with the public properties of a job.
     """
+    job_status, _ = get_job_status_and_etag(job_id, server_base_url)
+    return job_status
 
-    try:
 
-        job = delayed_job_models.get_job_by_id(job_id, force_refresh=True)
-        return job.public_dict(server_base_url)
+def get_job_status_and_etag(job_id, server_base_url='http://0.0.0.0:5000'):
+    """
+    Returns a dict representation of the job with the id given as parameter and its entity tag. The statuses of the
+    jobs that finished or failed are taken from the cache if possible.
+    :param job_id: the id of the job for which the status is required
+    :param server_base_url: url to use as base for building the output files urls
+    :return: a tuple with a dict with the public properties of a job and the entity tag of the dict
+    """
+    cached_status = job_status_cache.get(job_id, server_base_url)
+    if cached_status is not None:
+        return cached_status
+
+    version = job_status_cache.get_versions([job_id]).get(job_id)
+    try:
+        job_status = delayed_job_models.get_job_public_dict(job_id, server_base_url)
     except delayed_job_models.JobNotFoundError:
         raise JobNotFoundError()
 
+    etag = job_status_cache.get_etag(job_status)
+    job_status_cache.save(job_id, server_base_url, job_status, etag, version)
+    return job_status, etag
+
+
+def get_jobs_statuses(job_ids, server_base_url='http://0.0.0.0:5000'):
+    """
+    Returns the dict representations of the jobs with the ids given. The statuses that are not cached are read with
+    only one query.
+    :param job_ids: list of the ids of the jobs for which the status is required
+    :param server_base_url: url to use as base for building the output files urls
+    :return: a dict with the public properties of the jobs found by their id, and a list with the ids of the jobs that
+    were not found
+    """
+    unique_job_ids = list(dict.fromkeys(job_ids))
+    jobs_statuses = {job_id: job_status
+                     for job_id, (job_status, _) in job_status_cache.get_many(unique_job_ids, server_base_url).items()}
+
+    job_ids_to_read = [job_id for job_id in unique_job_ids if job_id not in jobs_statuses]
+    if len(job_ids_to_read) > 0:
+        versions = job_status_cache.get_versions(job_ids_to_read)
+        statuses_read = delayed_job_models.get_jobs_public_dicts(job_ids_to_read, server_base_url)
+        for job_id, job_status in statuses_read.items():
+            job_status_cache.save(job_id, server_base_url, job_status, job_status_cache.get_etag(job_status),
+                                  versions.get(job_id))
+            jobs_statuses[job_id] = job_status
+
+    return {
+        'jobs': jobs_statuses,
+        'not_found': [job_id for job_id in unique_job_ids if job_id not in jobs_statuses]
+    }
+
+
+def get_job_status_version(job_id):
+    """
+    :param job_id: the id of the job
+    :return: the current version of the status of the job, it changes every time that the job changes. If the app
+    cache is not shared by all the processes, it is read from the database and raises JobNotFoundError if the job does
+    not exist
+    """
+    if job_status_broker.VERSIONS_ARE_SHARED:
+        return job_status_broker.get_version(job_id)
+
+    try:
+        return delayed_job_models.get_job_status_version(job_id)
+    except delayed_job_models.JobNotFoundError as error:
+        raise JobNotFoundError() from error
+
+
+def wait_for_job_status_change(job_id, since_version, wait_seconds=None):
+    """
+    Waits until the status of the job changes from the version given. If the app cache is shared by all the
+    processes, the database is only queried to check that the job exists, otherwise the version is read from the
+    database periodically (see job_status_broker).
+    :param job_id: the id of the job
+    :param since_version: version of the status that the client has
+    :param wait_seconds: maximum time to wait, None to wait the maximum time allowed
+    :return: the current version of the status of the job, it is the same as since_version if it did not change.
+    Raises JobNotFoundError if the job does not exist or it is deleted while waiting
+    """
+    if job_status_broker.VERSIONS_ARE_SHARED:
+        if not delayed_job_models.job_exists(job_id):
+            raise JobNotFoundError()
+        return job_status_broker.wait_for_change(job_id, since_version, wait_seconds)
+
+    try:
+        return job_status_broker.wait_for_change(job_id, since_version, wait_seconds,
+                                                 read_version=delayed_job_models.get_job_status_version)
+    except delayed_job_models.JobNotFoundError as error:
+        raise JobNotFoundError() from error
+
+
 def get_input_file_path(job_id, input_key):
     """
     :param job_id: the id of the job for which the status is required
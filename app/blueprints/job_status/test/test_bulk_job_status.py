@@ -0,0 +1,108 @@
+"""
+Tests for the bulk status endpoint
+"""
+import datetime
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from app.db import DB
+from app.models import delayed_job_models
+from app.rate_limiter import RATE_LIMITER
+
+
+class TestBulkJobStatus(unittest.TestCase):
+    """
+    Class to test the bulk status endpoint
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        # The tests do several bulk requests in less time than the one allowed between them
+        self.rate_limiter_was_enabled = RATE_LIMITER.enabled
+        RATE_LIMITER.enabled = False
+
+    def tearDown(self):
+        RATE_LIMITER.enabled = self.rate_limiter_was_enabled
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+
+    def create_test_jobs(self, num_jobs):
+        """
+        Creates running jobs with an input and an output file each
+        :param num_jobs: number of jobs to create
+        :return: the list of jobs created
+        """
+        jobs = []
+        for job_number in range(num_jobs):
+            job = delayed_job_models.get_or_create('TEST', {'job_number': job_number}, 'some url')
+            delayed_job_models.add_input_file_to_job(job, delayed_job_models.InputFile(
+                input_key='input1', internal_path='/tmp/input1.txt', public_url=f'/status/inputs/{job.id}/input1'))
+            delayed_job_models.add_output_to_job(job, '/tmp/output.txt', f'/outputs/{job.id}/output.txt')
+            job.status = delayed_job_models.JobStatuses.RUNNING
+            delayed_job_models.save_job(job)
+            jobs.append(job)
+
+        return jobs
+
+    def test_statuses_of_several_jobs_are_read_with_one_query(self):
+        """
+        Tests that the statuses of several jobs are returned correctly and are read with only one query
+        """
+        with self.flask_app.app_context():
+            jobs = self.create_test_jobs(5)
+            job_ids = [job.id for job in jobs]
+            statuses_must_be = {job.id: job.public_dict('localhost/') for job in jobs}
+
+            queries_done = []
+
+            def register_query(*args):
+                queries_done.append(args)
+
+            event.listen(DB.engine, 'before_cursor_execute', register_query)
+            try:
+                response = self.client.post('/status/bulk', json={'job_ids': job_ids + ['some_id']})
+            finally:
+                event.remove(DB.engine, 'before_cursor_execute', register_query)
+
+            self.assertEqual(response.status_code, 200, msg='The statuses must be returned!')
+            self.assertEqual(response.json['jobs'], statuses_must_be, msg='The statuses are not correct!')
+            self.assertEqual(response.json['not_found'], ['some_id'], msg='The missing jobs must be returned!')
+            self.assertEqual(len(queries_done), 1, msg='The statuses must be read with only one query!')
+
+    def test_expired_jobs_are_not_returned(self):
+        """
+        Tests that the jobs that expired are reported as not found and that reading them does not delete them
+        """
+        with self.flask_app.app_context():
+            jobs = self.create_test_jobs(3)
+            expired_job_ids = [jobs[0].id, jobs[1].id]
+            for job in jobs[:2]:
+                job.expires_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+                delayed_job_models.save_job(job)
+
+            response = self.client.post('/status/bulk', json={'job_ids': [job.id for job in jobs]})
+
+            self.assertEqual(list(response.json['jobs'].keys()), [jobs[2].id],
+                             msg='Only the valid job must be returned!')
+            self.assertEqual(sorted(response.json['not_found']), sorted(expired_job_ids),
+                             msg='The expired jobs must be reported as not found!')
+            for job_id in expired_job_ids:
+                self.assertIsNotNone(delayed_job_models.DelayedJob.query.get(job_id),
+                                     msg='Reading the statuses must not delete the expired jobs!')
+
+    def test_the_list_of_job_ids_is_validated(self):
+        """
+        Tests that the list of job ids must not be empty nor too long
+        """
+        response = self.client.post('/status/bulk', json={'job_ids': []})
+        self.assertEqual(response.status_code, 400, msg='An empty list must not be accepted!')
+
+        response = self.client.post('/status/bulk', json={'job_ids': [f'job_{number}' for number in range(101)]})
+        self.assertEqual(response.status_code, 400, msg='Too many job ids must not be accepted!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""
+Tests for the cache of the status responses of the jobs and the conditional status requests
+"""
+import unittest
+
+from sqlalchemy import event
+
+from app import cache
+from app import create_app
+from app.authorisation import token_generator
+from app.db import DB
+from app.models import delayed_job_models
+from app.models import job_status_broker
+from app.models import job_status_cache
+
+
+class TestJobStatusCache(unittest.TestCase):
+    """
+    Class to test the cache of the status responses of the jobs
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        # The tests use the cache of each process, it is enough as they run in only one
+        self.enabled_before = job_status_cache.ENABLED
+        self.versions_are_shared_before = job_status_broker.VERSIONS_ARE_SHARED
+        job_status_cache.ENABLED = True
+        job_status_broker.VERSIONS_ARE_SHARED = True
+
+    def tearDown(self):
+        job_status_cache.ENABLED = self.enabled_before
+        job_status_broker.VERSIONS_ARE_SHARED = self.versions_are_shared_before
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+
+    def create_test_job(self, status):
+        """
+        Creates a job with an output file and the status given
+        :param status: status of the job
+        :return: the id of the job created
+        """
+        job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some url')
+        delayed_job_models.add_output_to_job(job, '/tmp/output.txt', f'/outputs/{job.id}/output.txt')
+        job.status = status
+        delayed_job_models.save_job(job)
+        return job.id
+
+    def count_queries(self, func):
+        """
+        Runs the function given and counts the queries done to the database while it runs
+        :param func: function to run
+        :return: a tuple with the result of the function and the number of queries done
+        """
+        queries_done = []
+
+        def register_query(*args):
+            queries_done.append(args)
+
+        event.listen(DB.engine, 'before_cursor_execute', register_query)
+        try:
+            result = func()
+        finally:
+            event.remove(DB.engine, 'before_cursor_execute', register_query)
+
+        return result, len(queries_done)
+
+    def test_status_of_finished_jobs_is_cached(self):
+        """
+        Tests that the status of a finished job is read from the database only the first time
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.FINISHED)
+
+            first_response, num_queries_first_time = self.count_queries(lambda: self.client.get(f'/status/{job_id}'))
+            second_response, num_queries_second_time = self.count_queries(
+                lambda: self.client.get(f'/status/{job_id}'))
+
+            self.assertEqual(num_queries_first_time, 1, msg='The status must be read the first time!')
+            self.assertEqual(num_queries_second_time, 0, msg='The cached status must not be read again!')
+            self.assertEqual(first_response.json, second_response.json, msg='The cached status is not correct!')
+
+    def test_status_of_running_jobs_is_not_cached(self):
+        """
+        Tests that the status of a job that can still change is always read from the database
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.RUNNING)
+
+            self.client.get(f'/status/{job_id}')
+            _, num_queries_got = self.count_queries(lambda: self.client.get(f'/status/{job_id}'))
+            self.assertEqual(num_queries_got, 1, msg='The status of a running job must not be cached!')
+
+    def test_not_modified_is_returned_for_the_same_etag(self):
+        """
+        Tests that when the client sends the etag of the current status, a 304 response without body is returned
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.FINISHED)
+
+            response = self.client.get(f'/status/{job_id}')
+            etag = response.headers.get('ETag')
+            self.assertIsNotNone(etag, msg='The status response must have an ETag!')
+
+            response = self.client.get(f'/status/{job_id}', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, msg='The status has not changed, it must not be sent again!')
+            self.assertEqual(response.data, b'', msg='A not modified response must not have a body!')
+
+            response = self.client.get(f'/status/{job_id}', headers={'If-None-Match': '"another_etag"'})
+            self.assertEqual(response.status_code, 200, msg='The status must be sent for a different etag!')
+
+    def test_cached_status_is_invalidated_when_the_progress_is_updated(self):
+        """
+        Tests that when a job updates its progress, the new status is returned
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.FINISHED)
+            etag_before = self.client.get(f'/status/{job_id}').headers.get('ETag')
+
+            headers = {'X-Job-Key': token_generator.generate_job_token(job_id)}
+            self.client.patch(f'/status/{job_id}', data={'progress': 100, 'status_log': 'Done'}, headers=headers)
+
+            response = self.client.get(f'/status/{job_id}', headers={'If-None-Match': etag_before})
+            self.assertEqual(response.status_code, 200, msg='The status changed, it must be sent again!')
+            self.assertIn('Done', response.json['status_log'], msg='The cached status was not invalidated!')
+
+    def test_cached_status_is_invalidated_when_the_job_is_deleted(self):
+        """
+        Tests that the status of a deleted job is not returned from the cache
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.ERROR)
+            self.client.get(f'/status/{job_id}')
+
+            delayed_job_models.delete_job(delayed_job_models.get_job_by_id(job_id))
+            response = self.client.get(f'/status/{job_id}')
+            self.assertEqual(response.status_code, 404, msg='The status of a deleted job must not be returned!')
+
+    def test_cached_status_is_invalidated_when_the_unit_of_work_is_committed(self):
+        """
+        Tests that the changes done in a unit of work invalidate the cached status only when they are committed
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.ERROR)
+            self.client.get(f'/status/{job_id}')
+
+            with delayed_job_models.unit_of_work():
+                job = delayed_job_models.get_job_by_id(job_id)
+                job.status = delayed_job_models.JobStatuses.CREATED
+                delayed_job_models.save_job(job)
+                self.assertIsNotNone(job_status_cache.get(job_id, 'localhost/'),
+                                     msg='The status must be invalidated only when the changes are committed!')
+
+            self.assertIsNone(job_status_cache.get(job_id, 'localhost/'), msg='The status was not invalidated!')
+            response = self.client.get(f'/status/{job_id}')
+            self.assertEqual(response.json['status'], 'CREATED', msg='The new status must be returned!')
+
+    def test_status_read_before_a_change_is_not_served_after_it(self):
+        """
+        Tests that a status read from the database before the job changed is not used, even if it is saved after the
+        change was committed
+        """
+        with self.flask_app.app_context():
+            job_id = self.create_test_job(delayed_job_models.JobStatuses.ERROR)
+            version_before = job_status_cache.get_versions([job_id])[job_id]
+            old_status = delayed_job_models.get_job_public_dict(job_id, 'localhost/')
+
+            job = delayed_job_models.get_job_by_id(job_id)
+            job.status = delayed_job_models.JobStatuses.CREATED
+            delayed_job_models.save_job(job)
+
+            job_status_cache.save(job_id, 'localhost/', old_status, job_status_cache.get_etag(old_status),
+                                  version_before)
+            self.assertIsNone(job_status_cache.get(job_id, 'localhost/'),
+                              msg='A status read before the job changed must not be cached!')
+
+            # Even if it was saved before the change, it is not used after it
+            version_before = job_status_cache.get_versions([job_id])[job_id]
+            job_status_cache.save(job_id, 'localhost/', old_status, job_status_cache.get_etag(old_status),
+                                  version_before)
+            self.assertIsNotNone(job_status_cache.get(job_id, 'localhost/'), msg='The status was not cached!')
+            job_status_broker.publish_changes([job_id])
+            self.assertIsNone(job_status_cache.get(job_id, 'localhost/'),
+                              msg='A status cached before the job changed must not be used!')
+
+    def test_cache_is_only_enabled_with_a_shared_app_cache(self):
+        """
+        Tests that the cache is only used when the app cache is shared by all the processes
+        """
+        cache_config = cache.RUN_CONFIG.setdefault('cache_config', {})
+        cache_type_before = cache_config.get('CACHE_TYPE')
+        try:
+            cache_config['CACHE_TYPE'] = 'simple'
+            self.assertFalse(cache.app_cache_is_shared(), msg='A cache of each process is not shared!')
+            cache_config['CACHE_TYPE'] = 'redis'
+            self.assertTrue(cache.app_cache_is_shared(), msg='A redis cache is shared!')
+        finally:
+            cache_config['CACHE_TYPE'] = cache_type_before
+
+
+if __name__ == '__main__':
+    unittest.main()
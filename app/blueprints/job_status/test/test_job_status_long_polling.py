@@ -0,0 +1,175 @@
+"""
+Tests for the long polling of the status of the jobs
+"""
+import threading
+import time
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from app.cache import CACHE
+from app.db import DB
+from app.models import delayed_job_models
+from app.models import job_status_broker
+
+STATUS_VERSION_HEADER = 'X-Job-Status-Version'
+
+
+class TestJobStatusLongPolling(unittest.TestCase):
+    """
+    Class to test the long polling of the status of the jobs
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        self.check_interval_seconds_was = job_status_broker.CHECK_INTERVAL_SECONDS
+        self.versions_are_shared_was = job_status_broker.VERSIONS_ARE_SHARED
+        # The tests use the cache of each process as if it was shared, it is enough as they run in only one
+        job_status_broker.VERSIONS_ARE_SHARED = True
+
+    def tearDown(self):
+        job_status_broker.CHECK_INTERVAL_SECONDS = self.check_interval_seconds_was
+        job_status_broker.VERSIONS_ARE_SHARED = self.versions_are_shared_was
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+
+    def create_test_job(self):
+        """
+        Creates a running job
+        :return: the id of the job and the version of its status
+        """
+        job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some url')
+        job.status = delayed_job_models.JobStatuses.RUNNING
+        delayed_job_models.save_job(job)
+
+        response = self.client.get(f'/status/{job.id}/changes')
+        self.assertEqual(response.status_code, 200, msg='The current status must be returned without since!')
+        return job.id, response.headers.get(STATUS_VERSION_HEADER)
+
+    def wait_in_thread(self, job_id, since_version, wait_seconds, results):
+        """
+        Does a long polling request in a thread
+        :return: the thread started
+        """
+        def wait_for_change():
+            start_time = time.monotonic()
+            response = self.client.get(f'/status/{job_id}/changes?since={since_version}&wait={wait_seconds}')
+            results.append((response, time.monotonic() - start_time))
+
+        thread = threading.Thread(target=wait_for_change)
+        thread.start()
+        return thread
+
+    def test_not_modified_is_returned_if_the_job_does_not_change(self):
+        """
+        Tests that when the job does not change while waiting, 304 is returned and the database is only queried to
+        check that the job exists
+        """
+        with self.flask_app.app_context():
+            job_id, status_version = self.create_test_job()
+
+            queries_done = []
+
+            def register_query(*args):
+                queries_done.append(args)
+
+            event.listen(DB.engine, 'before_cursor_execute', register_query)
+            try:
+                response = self.client.get(f'/status/{job_id}/changes?since={status_version}&wait=0.2')
+            finally:
+                event.remove(DB.engine, 'before_cursor_execute', register_query)
+
+            self.assertEqual(response.status_code, 304, msg='The status did not change!')
+            self.assertEqual(response.headers.get(STATUS_VERSION_HEADER), status_version,
+                             msg='The version must be returned!')
+            self.assertEqual(len(queries_done), 1, msg='Waiting must not query the database!')
+
+    def test_waiting_request_is_woken_up_when_the_job_changes(self):
+        """
+        Tests that a waiting request returns the new status as soon as the job is changed in the same process
+        """
+        with self.flask_app.app_context():
+            job_id, status_version = self.create_test_job()
+
+            results = []
+            thread = self.wait_in_thread(job_id, status_version, 10, results)
+            time.sleep(0.2)
+            delayed_job_models.update_job_progress(job_id, 50, 'Half way there', None)
+            thread.join(10)
+
+            response, seconds_waited = results[0]
+            self.assertEqual(response.status_code, 200, msg='The new status must be returned!')
+            self.assertEqual(response.json['progress'], '50', msg='The new status was not returned!')
+            self.assertNotEqual(response.headers.get(STATUS_VERSION_HEADER), status_version,
+                                msg='The new version must be returned!')
+            self.assertLess(seconds_waited, 5, msg='The request must be woken up when the job changes!')
+
+    def test_changes_done_by_other_processes_are_seen(self):
+        """
+        Tests that a waiting request sees the changes published by other processes in the app cache
+        """
+        with self.flask_app.app_context():
+            job_id, status_version = self.create_test_job()
+            job_status_broker.CHECK_INTERVAL_SECONDS = 0.05
+
+            results = []
+            thread = self.wait_in_thread(job_id, status_version, 10, results)
+            time.sleep(0.2)
+            # What the status daemon does in its own process, there are no local waiters to notify there
+            CACHE.set(job_status_broker.get_key(job_id), 'version_set_by_the_daemon')
+            thread.join(10)
+
+            response, seconds_waited = results[0]
+            self.assertEqual(response.status_code, 200, msg='The change done by another process must be seen!')
+            self.assertEqual(response.headers.get(STATUS_VERSION_HEADER), 'version_set_by_the_daemon',
+                             msg='The version set by the other process must be returned!')
+            self.assertLess(seconds_waited, 5, msg='The change must be seen while waiting!')
+
+    def test_changes_are_read_from_the_database_if_the_app_cache_is_not_shared(self):
+        """
+        Tests that when the app cache is not shared, a waiting request sees the changes done by other processes in the
+        database
+        """
+        with self.flask_app.app_context():
+            job_status_broker.VERSIONS_ARE_SHARED = False
+            job_id, status_version = self.create_test_job()
+            job_status_broker.CHECK_INTERVAL_SECONDS = 0.05
+
+            results = []
+            thread = self.wait_in_thread(job_id, status_version, 10, results)
+            time.sleep(0.2)
+            # What the status daemon does in its own process, the versions in the app cache of this one do not change
+            jobs_table = delayed_job_models.DelayedJob.__table__
+            DB.session.execute(jobs_table.update().where(jobs_table.c.id == job_id).values(
+                status=delayed_job_models.JobStatuses.FINISHED))
+            DB.session.commit()
+            thread.join(10)
+
+            response, seconds_waited = results[0]
+            self.assertEqual(response.status_code, 200, msg='The change done by another process must be seen!')
+            self.assertEqual(response.json['status'], 'FINISHED', msg='The new status was not returned!')
+            self.assertLess(seconds_waited, 5, msg='The change must be seen while waiting!')
+
+    def test_not_found_is_returned_right_away_for_an_unknown_job(self):
+        """
+        Tests that waiting for a job that does not exist returns 404 without waiting
+        """
+        for versions_are_shared in [True, False]:
+            job_status_broker.VERSIONS_ARE_SHARED = versions_are_shared
+            start_time = time.monotonic()
+            response = self.client.get('/status/some_id/changes?since=1&wait=10')
+            self.assertEqual(response.status_code, 404, msg='The job does not exist!')
+            self.assertLess(time.monotonic() - start_time, 5, msg='The request must not wait for an unknown job!')
+
+    def test_wait_time_must_be_a_positive_number(self):
+        """
+        Tests that the wait time is validated
+        """
+        response = self.client.get('/status/some_id/changes?since=1&wait=-1')
+        self.assertEqual(response.status_code, 400, msg='A negative wait time must not be accepted!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 """
 Tests for the status namespace
 """
+import datetime
 import json
 import unittest
 
+from sqlalchemy import event
+
 from app import create_app
 from app.authorisation import token_generator
 from app.db import DB
@@ -52,6 +55,53 @@ class TestStatus(unittest.TestCase):
                 type_got = resp_data[prop]
                 self.assertEqual(type_must_be, type_got, msg=f'The returned job {prop} is not correct.')
 
+    def test_job_status_with_files_is_read_in_one_query(self):
+        """
+        Tests that the status of a job with input and output files is the same as its public dict, and that it is read
+        with only one query
+        """
+        with self.flask_app.app_context():
+            job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some url')
+            for input_key in ['input1', 'input2']:
+                delayed_job_models.add_input_file_to_job(job, delayed_job_models.InputFile(
+                    input_key=input_key, internal_path=f'/tmp/{input_key}.txt',
+                    public_url=f'/status/inputs/{job.id}/{input_key}'))
+            for output_name in ['output.txt', 'output.txt', 'summary.json']:
+                delayed_job_models.add_output_to_job(job, f'/tmp/{output_name}', f'/outputs/{job.id}/{output_name}')
+            job.status = delayed_job_models.JobStatuses.FINISHED
+            job.finished_at = datetime.datetime.utcnow()
+            delayed_job_models.save_job(job)
+            status_must_be = job.public_dict('some_server')
+
+            queries_done = []
+
+            def register_query(*args):
+                queries_done.append(args)
+
+            event.listen(DB.engine, 'before_cursor_execute', register_query)
+            try:
+                status_got = delayed_job_models.get_job_public_dict(job.id, 'some_server')
+            finally:
+                event.remove(DB.engine, 'before_cursor_execute', register_query)
+
+            self.assertEqual(status_got, status_must_be, msg='The status of the job is not correct!')
+            self.assertEqual(len(queries_done), 1, msg='The status must be read with only one query!')
+
+    def test_expired_job_status_is_not_returned(self):
+        """
+        Tests that the status of a job that expired is not returned and that reading it does not delete the job
+        """
+        with self.flask_app.app_context():
+            job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some url')
+            job.expires_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            delayed_job_models.save_job(job)
+            job_id = job.id
+
+            response = self.client.get(f'/status/{job_id}')
+            self.assertEqual(response.status_code, 404, msg='The status of an expired job must not be returned!')
+            self.assertIsNotNone(delayed_job_models.DelayedJob.query.get(job_id),
+                                 msg='Reading the status must not delete the expired job!')
+
     def test_get_non_existing_job_status(self):
         """
         Tests that when the status of a non existing job a 404 error is produced.
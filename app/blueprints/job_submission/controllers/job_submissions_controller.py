@@ -4,8 +4,9 @@ The blueprint used in job submission
 from flask import Blueprint, jsonify, request, abort
 
 from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import batch_submission_service
 from app.blueprints.job_submission.controllers import marshmallow_schemas
-from app.request_validation.decorators import validate_form_with
+from app.request_validation.decorators import validate_form_with, validate_json_with
 from app.rate_limiter import RATE_LIMITER
 from app.config import RUN_CONFIG
 
@@ -80,3 +81,15 @@ def submit_download_job():
     form_files = request.files
 
     return submit_job(job_type, form_data, form_files)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Batch submission
+# ----------------------------------------------------------------------------------------------------------------------
+@SUBMISSION_BLUEPRINT.route('/batch', methods=['POST'])
+@validate_json_with(marshmallow_schemas.BatchJobSubmissionSchema)
+@RATE_LIMITER.limit(RUN_CONFIG.get('rate_limit').get('rates').get('job_submission'))
+def submit_jobs_batch():
+    job_specs = request.get_json()['jobs']
+    jobs_submitted = batch_submission_service.submit_jobs_batch(job_specs)
+    return jsonify({'jobs': jobs_submitted})
@@ -1,7 +1,9 @@
 """
 This module defines the schemas to validate the inputs of the submissions controller
 """
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
+
+MAX_JOBS_PER_BATCH = 100
 
 
 class TestJobSchema(Schema):
@@ -65,3 +67,42 @@ class DownloadJobSchema(Schema):
     context_obj = fields.String()
     download_columns_group = fields.String()
     dl__ignore_cache = fields.Boolean(required=True)
+
+
+# Only the job types that do not need input files, a batch can not carry them
+BATCH_JOB_SCHEMAS = {
+    'TEST': TestJobSchema,
+    'STRUCTURE_SEARCH': StructureSearchJobSchema,
+    'BIOLOGICAL_SEQUENCE_SEARCH': BiologicalSequenceSearchJobSchema,
+    'DOWNLOAD': DownloadJobSchema
+}
+
+
+class BatchJobSpecSchema(Schema):
+    """
+    Class that defines the schema for each of the jobs of a batch submission. The params are validated with the schema
+    of the job type.
+    """
+    job_type = fields.String(required=True, validate=validate.OneOf(list(BATCH_JOB_SCHEMAS.keys())))
+    params = fields.Dict(keys=fields.String(), values=fields.String(), required=True)
+
+    @validates_schema
+    def validate_job_params(self, data, **kwargs):
+        job_type = data['job_type']
+        job_params = data['params']
+
+        params_errors = BATCH_JOB_SCHEMAS[job_type]().validate(job_params)
+        if params_errors:
+            raise ValidationError(params_errors, 'params')
+
+        if job_type == 'STRUCTURE_SEARCH':
+            if job_params.get('search_type') == 'SIMILARITY' and job_params.get('threshold') is None:
+                raise ValidationError('When the search type is similarity, you must provide a threshold!', 'params')
+
+
+class BatchJobSubmissionSchema(Schema):
+    """
+    Class that defines the schema for the batch submission of jobs
+    """
+    jobs = fields.List(fields.Nested(BatchJobSpecSchema), required=True,
+                       validate=validate.Length(min=1, max=MAX_JOBS_PER_BATCH))
@@ -0,0 +1,313 @@
+"""
+This module submits several jobs at once to the EBI queue. The cache hits are resolved with one query, the new jobs
+are created with their run folders in one transaction, and all of them are sent to LSF in one ssh session, in the
+submission queue if it is enabled. Only the job types that do not need input files can be submitted in a batch.
+"""
+import datetime
+import os
+import re
+import uuid
+from pathlib import Path
+
+import app.app_logging as app_logging
+from app import ssh_connections
+from app import script_templates
+from app import executors
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import submission_queue
+from app.job_statistics import statistics_saver
+
+BATCH_SUBMISSIONS_DIR = Path(job_submission_service.JOBS_RUN_DIR).joinpath('.batch_submissions')
+# Line printed in the remote host before submitting each job, to identify the output of each one
+JOB_SUBMISSION_MARKER = 'DELAYED_JOB_SUBMISSION'
+REMOTE_COMMANDS_START = '<<ENDSSH'
+REMOTE_COMMANDS_END = 'ENDSSH'
+
+
+def submit_jobs_batch(job_specs):
+    """
+    Submits the jobs described by the specs given. The jobs that exist are taken from the cache following the same
+    rules as when they are submitted one by one (see job_submission_service.submit_job)
+    :param job_specs: list of dicts with the job_type and the params of each job
+    :return: a list with a dict with the id, the status and if it was cached for each of the jobs, in the same order
+    of the specs.
+    """
+    docker_image_urls = {}
+    jobs_desc = []
+    for job_spec in job_specs:
+        job_type = job_spec['job_type']
+        job_params = dict(job_spec['params'])
+        if job_type not in docker_image_urls:
+            docker_image_urls[job_type] = delayed_job_models.get_docker_image_url(job_type)
+        docker_image_url = docker_image_urls[job_type]
+        job_id = delayed_job_models.generate_job_id(job_type, job_params, docker_image_url)
+        jobs_desc.append({
+            'job_id': job_id,
+            'job_type': job_type,
+            'job_params': job_params,
+            'docker_image_url': docker_image_url
+        })
+
+    unique_job_ids = list(dict.fromkeys(job_desc['job_id'] for job_desc in jobs_desc))
+    # The expired jobs are deleted with their files before they are created again
+    delayed_job_models.delete_expired_jobs_by_ids(unique_job_ids)
+    existing_jobs = delayed_job_models.get_jobs_by_ids(unique_job_ids)
+
+    jobs_to_submit = {}
+    was_cached = {}
+    # The jobs are created and claimed with the same functions used when they are submitted one by one, so the jobs
+    # submitted at the same time by other requests are created and submitted only once. Their run folders are prepared
+    # in the same transaction, so the jobs can be submitted or recovered later by the submission queue.
+    with delayed_job_models.unit_of_work():
+        for job_desc in jobs_desc:
+            job_id = job_desc['job_id']
+            if job_id in was_cached:
+                # the same job was requested twice in the batch
+                continue
+
+            job = existing_jobs.get(job_id)
+            was_cached[job_id] = job is not None
+            if job is not None:
+                action = job_submission_service.get_action_for_existing_job(job, job_desc['job_params'])
+                if action == job_submission_service.USE_CACHED_JOB:
+                    continue
+
+                if not delayed_job_models.claim_job_for_resubmission(job):
+                    app_logging.debug(f'Job {job_id} is being submitted again by another worker')
+                    continue
+
+                if action == job_submission_service.DELETE_AND_RESUBMIT_JOB:
+                    delayed_job_models.delete_job(job)
+                    job = None
+
+            if job is None:
+                job, job_was_created = delayed_job_models.create_job_if_not_exists(
+                    job_desc['job_type'], job_desc['job_params'], job_desc['docker_image_url'])
+                if not job_was_created:
+                    app_logging.debug(f'Job {job_id} was created at the same time by another worker')
+                    existing_jobs[job_id] = job
+                    was_cached[job_id] = True
+                    continue
+
+            job.progress = 0
+            job.started_at = None
+            job.finished_at = None
+            delayed_job_models.save_job(job)
+            job_submission_service.prepare_run_folder(job, {}, {})
+            jobs_to_submit[job_id] = job
+
+    app_logging.debug(f'Batch submission: {len(jobs_to_submit)} jobs to submit out of {len(jobs_desc)} requested')
+
+    if len(jobs_to_submit) > 0:
+        if submission_queue.QUEUE_ENABLED:
+            app_logging.debug(f'Adding a batch of {len(jobs_to_submit)} jobs to the submission queue')
+            submission_queue.enqueue(submit_created_jobs, list(jobs_to_submit.keys()))
+        else:
+            submit_prepared_jobs(list(jobs_to_submit.values()))
+
+    for job_desc in jobs_desc:
+        statistics_saver.save_job_cache_record(
+            job_type=str(job_desc['job_type']),
+            run_env_type=RUN_CONFIG.get('run_env'),
+            was_cached=was_cached[job_desc['job_id']],
+            request_date=datetime.datetime.utcnow().timestamp() * 1000
+        )
+
+    all_jobs = {**existing_jobs, **jobs_to_submit}
+    return [get_batch_job_submission_response(all_jobs[job_desc['job_id']], was_cached[job_desc['job_id']])
+            for job_desc in jobs_desc]
+
+
+def get_batch_job_submission_response(job, was_cached):
+    """
+    :param job: the job object for which get the submission response
+    :param was_cached: whether the job was taken from the cache
+    :return: a dict with the response of the submission of one job of the batch
+    """
+    return {
+        **job_submission_service.get_job_submission_response(job),
+        'status': str(job.status),
+        'was_cached': was_cached
+    }
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Submission of the prepared jobs
+# ----------------------------------------------------------------------------------------------------------------------
+def submit_prepared_jobs(jobs):
+    """
+    Submits the jobs of a batch whose run folders are already prepared to the executor set in the configuration. If
+    the submission fails, the jobs that were not submitted are marked as failed, so they are submitted again the next
+    time that they are requested.
+    :param jobs: list of job objects to submit
+    """
+    if executors.EXECUTOR_TYPE != executors.LSF_EXECUTOR:
+        # The other executors do not have a round trip to save, the jobs are submitted one by one
+        for job in jobs:
+            try:
+                job_submission_service.submit_prepared_job(job)
+            except Exception:  # pylint: disable=broad-except
+                # The job was already marked as failed, the rest of the batch is submitted anyway
+                continue
+        return
+
+    try:
+        submit_jobs_to_lsf(jobs)
+    except Exception as error:  # pylint: disable=broad-except
+        # The changes done to the jobs were rolled back, none of them was saved as submitted
+        with delayed_job_models.unit_of_work():
+            for job in jobs:
+                job_submission_service.mark_job_submission_as_failed(job, error)
+
+
+def submit_created_jobs(job_ids):
+    """
+    Submits the jobs of a batch that were created and whose run folders were prepared in the request. It is run by the
+    workers of the submission queue. The jobs that are no longer in CREATED status are not submitted again.
+    :param job_ids: list of the ids of the jobs to submit
+    """
+    jobs = delayed_job_models.get_jobs_by_ids(job_ids)
+    jobs_to_submit = [job for job in jobs.values() if job.status == delayed_job_models.JobStatuses.CREATED]
+    if len(jobs_to_submit) < len(job_ids):
+        app_logging.debug(f'{len(job_ids) - len(jobs_to_submit)} jobs of the batch are no longer CREATED, they are '
+                          'not submitted again')
+
+    if len(jobs_to_submit) > 0:
+        submit_prepared_jobs(jobs_to_submit)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Submission to LSF
+# ----------------------------------------------------------------------------------------------------------------------
+def submit_jobs_to_lsf(jobs):
+    """
+    Submits to LSF in one ssh session the jobs given, whose run folders are already prepared. The changes to the jobs
+    are committed once when they are submitted. If there is an error, they are rolled back and the error is raised
+    again.
+    :param jobs: list of job objects to submit
+    """
+    with delayed_job_models.unit_of_work():
+        jobs_script_params = []
+        for job in jobs:
+            job_submission_service.prepare_output_dir(job)
+            jobs_script_params.append(job_submission_service.get_job_submission_script_params(job))
+
+        batch_script = get_batch_submission_script(job_submission_service.get_job_submission_template(),
+                                                   jobs_script_params)
+
+        must_run_jobs = RUN_CONFIG.get('run_jobs', True)
+        if not must_run_jobs:
+            app_logging.debug('Not submitting jobs because run_jobs is False')
+            delayed_job_models.save_jobs_in_one_transaction(jobs)
+            return
+
+        submission_output = run_batch_submission_script(batch_script)
+        lsf_job_ids = get_lsf_job_ids_from_batch_output(submission_output)
+
+        for job in jobs:
+            lsf_job_id = lsf_job_ids.get(job.id)
+            if lsf_job_id is None:
+                app_logging.error(f'Job {job.id} could not be submitted in the batch')
+                job.status = delayed_job_models.JobStatuses.ERROR
+                job.status_description = 'The job could not be submitted to LSF'
+                job.num_failures = (job.num_failures or 0) + 1
+            else:
+                job.lsf_job_id = lsf_job_id
+                job.status = delayed_job_models.JobStatuses.QUEUED
+                app_logging.debug(f'Job {job.id} LSF Job ID is: {lsf_job_id}')
+
+        delayed_job_models.save_jobs_in_one_transaction(jobs)
+
+
+def split_submission_template(submit_job_template):
+    """
+    Splits the job submission template in the part that runs locally before opening the ssh session, the commands that
+    run in the remote host, and the part that runs after closing the ssh session.
+    :param submit_job_template: text of the job submission template
+    :return: a tuple (head, remote_commands, tail)
+    """
+    lines = submit_job_template.splitlines(keepends=True)
+    start_index = next(i for i, line in enumerate(lines) if REMOTE_COMMANDS_START in line)
+    end_index = next(i for i, line in enumerate(lines) if line.strip() == REMOTE_COMMANDS_END and i > start_index)
+
+    head = ''.join(lines[:start_index + 1])
+    remote_commands = ''.join(lines[start_index + 1:end_index])
+    tail = ''.join(lines[end_index:])
+
+    return head, remote_commands, tail
+
+
+def get_batch_submission_script(submit_job_template, jobs_script_params):
+    """
+    Generates a script that submits all the jobs in one ssh session from the job submission template. The remote
+    commands of each job run in a subshell, so the environment variables of one job do not leak into the others.
+    :param submit_job_template: text of the job submission template
+    :param jobs_script_params: list with the template parameters of each job
+    :return: the text of the batch submission script
+    """
+    head, remote_commands, tail = split_submission_template(submit_job_template)
+    batch_params = {
+        **jobs_script_params[0],
+        'JOB_ID': ' '.join(params['JOB_ID'] for params in jobs_script_params)
+    }
+
+    batch_script = head.format(**batch_params)
+    for job_script_params in jobs_script_params:
+        batch_script += f'echo "{JOB_SUBMISSION_MARKER} {job_script_params["JOB_ID"]}"\n'
+        batch_script += f'(\n{remote_commands.format(**job_script_params)})\n'
+    batch_script += tail.format(**batch_params)
+
+    return batch_script
+
+
+def run_batch_submission_script(batch_script):
+    """
+    Runs the batch submission script and returns its standard output. The output is saved in a file only if there was
+    an error.
+    :param batch_script: text of the script
+    :return: the text of the standard output of the script
+    """
+    lsf_config = RUN_CONFIG.get('lsf_submission')
+    id_rsa_path = lsf_config['id_rsa_file']
+    app_logging.debug('Going to run batch submission script')
+
+    ssh_connections.ensure_lsf_master_connection()
+    submission_process = script_templates.run_script(batch_script, [id_rsa_path])
+
+    app_logging.debug(f'Batch submission STD Output: \n {submission_process.stdout}')
+    app_logging.debug(f'Batch submission STD Error: \n {submission_process.stderr}')
+
+    return_code = submission_process.returncode
+    app_logging.debug(f'batch submission return code was: {return_code}')
+    ssh_connections.react_to_lsf_script_return_code(return_code)
+    if return_code != 0:
+        # Some of the jobs could have been submitted anyway, the output is parsed to know which ones
+        os.makedirs(BATCH_SUBMISSIONS_DIR, exist_ok=True)
+        output_name = f'{datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}_{uuid.uuid4().hex}_submit_jobs'
+        output_path = BATCH_SUBMISSIONS_DIR.joinpath(output_name)
+        with open(f'{output_path}.out', 'wb') as submission_out_file:
+            submission_out_file.write(submission_process.stdout)
+        with open(f'{output_path}.err', 'wb') as submission_err_file:
+            submission_err_file.write(submission_process.stderr)
+
+    return submission_process.stdout.decode()
+
+
+def get_lsf_job_ids_from_batch_output(submission_output):
+    """
+    Reads the output of the batch submission script and returns the lsf job id assigned to each job
+    :param submission_output: text of the output of the batch submission script
+    :return: a dict with the lsf job ids by job id, the jobs that could not be submitted are not included
+    """
+    lsf_job_ids = {}
+    markers = list(re.finditer(rf'^{JOB_SUBMISSION_MARKER} (\S+)$', submission_output, flags=re.MULTILINE))
+    for i, marker in enumerate(markers):
+        job_id = marker.group(1)
+        segment_end = markers[i + 1].start() if i + 1 < len(markers) else len(submission_output)
+        job_output = submission_output[marker.end():segment_end]
+        if re.search(r'Job <\d+>', job_output) is not None:
+            lsf_job_ids[job_id] = job_submission_service.get_lsf_job_id(job_output)
+
+    return lsf_job_ids
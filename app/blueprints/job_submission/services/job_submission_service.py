@@ -4,14 +4,13 @@ This module submits jobs to the EBI queue
 import hashlib
 import json
 import os
-import random
+import errno
 import shutil
-import stat
-import subprocess
+import tempfile
 from pathlib import Path
 import re
 import os.path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import yaml
 
@@ -20,7 +19,13 @@ from app.authorisation import token_generator
 from app.config import RUN_CONFIG
 from app.models import delayed_job_models
 from app import utils
+from app import ssh_connections
+from app import executors
+from app import script_templates
 from app.job_statistics import statistics_saver
+from app.blueprints.job_submission.services import submission_queue
+from app.blueprints.job_submission.services import requirements_calculation_service
+from app.blueprints.job_submission.services import single_flight
 
 JOBS_RUN_DIR = RUN_CONFIG.get('jobs_run_dir', str(Path().absolute()) + '/jobs_run')
 if not os.path.isabs(JOBS_RUN_DIR):
@@ -32,6 +37,20 @@ if not os.path.isabs(JOBS_TMP_DIR):
     JOBS_TMP_DIR = Path(JOBS_TMP_DIR).resolve()
 os.makedirs(JOBS_TMP_DIR, exist_ok=True)
 
+# The uploaded input files are staged in a directory in the same filesystem as the run dir, so they can be published
+# to the run dir of the job with an atomic rename, instead of copying them.
+JOBS_STAGING_DIR = RUN_CONFIG.get('jobs_staging_dir', str(Path(JOBS_RUN_DIR).joinpath('.staging')))
+if not os.path.isabs(JOBS_STAGING_DIR):
+    JOBS_STAGING_DIR = Path(JOBS_STAGING_DIR).resolve()
+os.makedirs(JOBS_STAGING_DIR, exist_ok=True)
+
+# Content addressed store for the input files, they are saved by their sha256 hash, so the jobs that have the same input
+# file share the same copy of it.
+INPUT_FILES_STORE_DIR = RUN_CONFIG.get('input_files_store_dir', str(Path(JOBS_RUN_DIR).joinpath('.input_files_store')))
+if not os.path.isabs(INPUT_FILES_STORE_DIR):
+    INPUT_FILES_STORE_DIR = Path(INPUT_FILES_STORE_DIR).resolve()
+os.makedirs(INPUT_FILES_STORE_DIR, exist_ok=True)
+
 JOBS_OUTPUT_DIR = RUN_CONFIG.get('jobs_output_dir', str(Path().absolute()) + '/jobs_output')
 if not os.path.isabs(JOBS_OUTPUT_DIR):
     JOBS_OUTPUT_DIR = Path(JOBS_OUTPUT_DIR).resolve()
@@ -45,61 +64,150 @@ app_logging.info('--------------------------------------------------------------
 app_logging.info(f'JOBS_OUTPUT_DIR: {JOBS_OUTPUT_DIR}')
 app_logging.info('------------------------------------------------------------------------------')
 
+app_logging.info('------------------------------------------------------------------------------')
+app_logging.info(f'JOBS_STAGING_DIR: {JOBS_STAGING_DIR}')
+app_logging.info('------------------------------------------------------------------------------')
+
+app_logging.info('------------------------------------------------------------------------------')
+app_logging.info(f'INPUT_FILES_STORE_DIR: {INPUT_FILES_STORE_DIR}')
+app_logging.info('------------------------------------------------------------------------------')
+
 JOBS_SCRIPTS_DIR = str(Path().absolute()) + '/jobs_scripts'
 
 INPUT_FILES_DIR_NAME = 'input_files'
 RUN_PARAMS_FILENAME = 'run_params.yml'
 COMMON_PACKAGE_NAME = 'common'
-SUBMISSION_FILE_NAME = 'submit_job.sh'
 
 MAX_RETRIES = 6
+INPUT_FILES_CHUNK_SIZE = 1024 * 1024  # Bytes read at a time when saving or hashing the input files
+
+# Possible actions when a job that is submitted already exists
+USE_CACHED_JOB = 'USE_CACHED_JOB'
+RESUBMIT_JOB = 'RESUBMIT_JOB'
+DELETE_AND_RESUBMIT_JOB = 'DELETE_AND_RESUBMIT_JOB'
 
 
 class JobSubmissionError(Exception):
     """Base class for exceptions in this module."""
 
 
+def get_file_hash(file_path):
+    """
+    Calculates the sha256 hash of a file reading it in chunks, so the memory used does not depend on the file size
+    :param file_path: path of the file for which to calculate the hash
+    :return: the hexadecimal digest of the contents of the file
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(INPUT_FILES_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
 def get_input_files_hashes(input_files_desc):
     """
-    :param input_files_desc: args sent to the endpoint from flask rest-plus
+    :param input_files_desc: dict with the paths of the input files
     :return: dict with the hashes of each of the files uploaded as an input
     """
 
     input_files_hashes = {}
     for input_key, input_path in input_files_desc.items():
-        with open(input_path, 'rb') as input_file:
-            file_bytes = input_file.read()
-            file_hash = hashlib.sha256(file_bytes).hexdigest()
-            input_files_hashes[input_key] = file_hash
+        input_files_hashes[input_key] = get_file_hash(input_path)
 
     return input_files_hashes
 
 
+def get_uploaded_file_hash(parameter):
+    """
+    Calculates the sha256 hash of an uploaded file reading its stream in chunks, without saving it. The stream is
+    rewound afterwards so the file can be saved later if needed.
+    :param parameter: the file sent to the endpoint from flask
+    :return: the hexadecimal digest of the contents of the file
+    """
+    file_hash = hashlib.sha256()
+    stream = parameter.stream
+    start_position = stream.tell()
+    for chunk in iter(lambda: stream.read(INPUT_FILES_CHUNK_SIZE), b''):
+        file_hash.update(chunk)
+    stream.seek(start_position)
+
+    return file_hash.hexdigest()
+
+
+def upload_is_seekable(parameter):
+    """
+    :param parameter: the file sent to the endpoint from flask
+    :return: True if the stream of the uploaded file can be read again after hashing it, False otherwise
+    """
+    stream = parameter.stream
+    return hasattr(stream, 'seekable') and stream.seekable()
+
+
+def save_input_file_and_get_hash(parameter, dest_path):
+    """
+    Saves an uploaded file to the path given, while it is saved it calculates its sha256 hash. The file is read in
+    chunks so the memory used does not depend on the size of the upload.
+    :param parameter: the file sent to the endpoint from flask
+    :param dest_path: path where to save the file
+    :return: the hexadecimal digest of the contents of the file
+    """
+    file_hash = hashlib.sha256()
+    with open(dest_path, 'wb') as dest_file:
+        for chunk in iter(lambda: parameter.stream.read(INPUT_FILES_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+            dest_file.write(chunk)
+
+    return file_hash.hexdigest()
+
+
 def get_job_input_files_desc(args):
     """
-    Saves the input files to a temporary directory to not depend from flask-respx implementation, then returns a
-    structure describing them.
+    Saves the input files to the staging directory to not depend from flask-respx implementation, then returns a
+    structure describing them. The hashes of the files are calculated while they are saved, so each byte of the
+    uploads is written only once and it is not read again.
     :param args: files sent to the endpoint from flask
-    :return: dict with the input files and their temporary location
+    :return: a tuple with a dict with the input files and their staging location, and a dict with the hashes of
+    each of the files
     """
 
     input_files_desc = {}
+    input_files_hashes = {}
+    os.makedirs(JOBS_STAGING_DIR, exist_ok=True)
     for param_key, parameter in args.items():
-        tmp_dir = Path.joinpath(Path(JOBS_TMP_DIR), f'{random.randint(1, 1000000)}')
-        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=JOBS_STAGING_DIR)
         tmp_path = Path.joinpath(Path(tmp_dir), parameter.filename)
-        parameter.save(str(tmp_path))
+        input_files_hashes[param_key] = save_input_file_and_get_hash(parameter, tmp_path)
         input_files_desc[param_key] = str(tmp_path)
 
-    return input_files_desc
+    return input_files_desc, input_files_hashes
+
+
+def get_uploaded_input_files_desc(args):
+    """
+    Calculates the hashes of the input files from the request streams, without saving them to disk. They will be saved
+    only if the job needs to be run (see prepare_job_inputs). If a stream can not be read twice, the files are saved
+    to the staging directory while they are hashed.
+    :param args: files sent to the endpoint from flask
+    :return: a tuple with a dict with the input files, and a dict with the hashes of each of the files
+    """
+    if not all(upload_is_seekable(parameter) for parameter in args.values()):
+        return get_job_input_files_desc(args)
+
+    input_files_desc = {}
+    input_files_hashes = {}
+    for param_key, parameter in args.items():
+        input_files_hashes[param_key] = get_uploaded_file_hash(parameter)
+        input_files_desc[param_key] = parameter
+
+    return input_files_desc, input_files_hashes
 
 
 def parse_args_and_submit_job(job_type, form_args, file_args):
     app_logging.debug(f'args received: {json.dumps(form_args)}')
     docker_image_url = delayed_job_models.get_docker_image_url(job_type)
     job_params_only = {param_key: parameter for (param_key, parameter) in form_args.items()}
-    job_inputs_only = get_job_input_files_desc(file_args)
-    input_files_hashes = get_input_files_hashes(job_inputs_only)
+    job_inputs_only, input_files_hashes = get_uploaded_input_files_desc(file_args)
 
     return submit_job(job_type, job_inputs_only, input_files_hashes, docker_image_url, job_params_only)
 
@@ -135,11 +243,82 @@ def job_output_was_lost(job):
     return False
 
 
+def get_action_for_existing_job(job, job_params):
+    """
+    Decides what to do when a job that is submitted already exists
+    :param job: the existing job
+    :param job_params: dict with the parameters of the job submitted
+    :return: USE_CACHED_JOB, RESUBMIT_JOB or DELETE_AND_RESUBMIT_JOB
+    """
+    if job.status in [delayed_job_models.JobStatuses.CREATED, delayed_job_models.JobStatuses.QUEUED,
+                      delayed_job_models.JobStatuses.RUNNING, delayed_job_models.JobStatuses.UNKNOWN]:
+
+        return USE_CACHED_JOB
+
+    if job.status == delayed_job_models.JobStatuses.ERROR:
+
+        if job.num_failures <= MAX_RETRIES:
+            app_logging.debug(f'{job.id} has failed {job.num_failures}. Max retries is {MAX_RETRIES}. '
+                              f'I will submit it again')
+            return RESUBMIT_JOB
+
+        app_logging.debug(f'{job.id} has failed {job.num_failures} times. Max retries is {MAX_RETRIES}. '
+                          f'NOT submitting it again')
+        return USE_CACHED_JOB
+
+    if job.status == delayed_job_models.JobStatuses.FINISHED:
+
+        must_ignore_cache = parse_ignore_cache_param(job_params)
+        output_was_lost = job_output_was_lost(job)
+
+        app_logging.debug(f'{job.id}: must_ignore_cache: {must_ignore_cache}')
+        app_logging.debug(f'{job.id}: output_was_lost: {output_was_lost}')
+
+        must_resubmit = must_ignore_cache or output_was_lost
+        app_logging.debug(f'{job.id}: must_resubmit: {must_resubmit}')
+
+        if must_resubmit:
+            return DELETE_AND_RESUBMIT_JOB
+
+    return USE_CACHED_JOB
+
+
 def submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url, job_params):
     """
-    Submits job to the queue, and runs it in background
+    Submits job to the queue, and runs it in background. The input files are saved only when the job needs to be run,
+    if the job is already in the cache, they are discarded. When the same job is submitted several times at the same
+    time, only one of the submissions prepares and submits it, the others return its id.
+    :param job_type: type of job to submit
+    :param input_files_desc: dict describing the input files, the values are either the uploaded files or the paths
+    where they were staged
+    :param input_files_hashes: dict with the hashes of the input files
+    :param docker_image_url: image of the container to use
+    :param job_params: dict with the job parameters
+    """
+    job_id = delayed_job_models.generate_job_id(job_type, job_params, docker_image_url, input_files_hashes)
+
+    # The submissions done in this process while the same job is being submitted wait for it, the ones done in other
+    # processes are coalesced in the database (see create_and_submit_job)
+    submission_response, was_coalesced = single_flight.run(
+        job_id,
+        lambda: submit_job_once(job_type, input_files_desc, input_files_hashes, docker_image_url, job_params)
+    )
+    if was_coalesced:
+        app_logging.debug(f'Job {job_id} was being submitted at the same time, returning its id')
+        discard_staged_input_files(input_files_desc)
+
+    return submission_response
+
+
+def submit_job_once(job_type, input_files_desc, input_files_hashes, docker_image_url, job_params):
+    """
+    Submits the job if it does not exist, or if it exists and it must be submitted again
     :param job_type: type of job to submit
+    :param input_files_desc: dict describing the input files
+    :param input_files_hashes: dict with the hashes of the input files
+    :param docker_image_url: image of the container to use
     :param job_params: dict with the job parameters
+    :return: a dict with the response of the submission
     """
 
     try:
@@ -157,42 +336,24 @@ def submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url,
 
         app_logging.debug(f'Job {job.id} already exists, status: {job.status}')
 
-        if job.status in [delayed_job_models.JobStatuses.CREATED, delayed_job_models.JobStatuses.QUEUED,
-                          delayed_job_models.JobStatuses.RUNNING, delayed_job_models.JobStatuses.UNKNOWN]:
-
-            return get_job_submission_response(job)
-
-        elif job.status == delayed_job_models.JobStatuses.ERROR:
-
-            if job.num_failures <= MAX_RETRIES:
-                app_logging.debug(f'{job.id} has failed {job.num_failures}. Max retries is {MAX_RETRIES}. '
-                                  f'I will submit it again')
-                job = create_and_submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url,
-                                            job_params)
-                return get_job_submission_response(job)
-            else:
-                app_logging.debug(f'{job.id} has failed {job.num_failures} times. Max retries is {MAX_RETRIES}. '
-                                  f'NOT submitting it again')
+        action = get_action_for_existing_job(job, job_params)
+        if action in [RESUBMIT_JOB, DELETE_AND_RESUBMIT_JOB]:
+            if not delayed_job_models.claim_job_for_resubmission(job):
+                app_logging.debug(f'Job {job.id} is being submitted again by another worker')
+                discard_staged_input_files(input_files_desc)
                 return get_job_submission_response(job)
 
-        elif job.status == delayed_job_models.JobStatuses.FINISHED:
-
-            must_ignore_cache = parse_ignore_cache_param(job_params)
-            output_was_lost = job_output_was_lost(job)
-
-            app_logging.debug(f'{job.id}: must_ignore_cache: {must_ignore_cache}')
-            app_logging.debug(f'{job.id}: output_was_lost: {output_was_lost}')
-
-            must_resubmit = must_ignore_cache or output_was_lost
-            app_logging.debug(f'{job.id}: must_resubmit: {must_resubmit}')
-
-            if must_resubmit:
+            claimed_job = job
+            if action == DELETE_AND_RESUBMIT_JOB:
                 app_logging.debug(f'I will delete and submit again {job.id}')
                 delayed_job_models.delete_job(job)
-                job = create_and_submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url,
-                                            job_params)
-                return get_job_submission_response(job)
+                claimed_job = None
+
+            job = create_and_submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url,
+                                        job_params, claimed_job=claimed_job)
+            return get_job_submission_response(job)
 
+        discard_staged_input_files(input_files_desc)
         return get_job_submission_response(job)
 
     except delayed_job_models.JobNotFoundError:
@@ -207,23 +368,47 @@ def submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url,
         return get_job_submission_response(job)
 
 
-def create_and_submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url, job_params):
+def create_and_submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url, job_params,
+                          claimed_job=None):
     """
-    Creates a job and submits if to LSF
+    Creates a job and submits if to LSF. The creation of the job and of its run folder is committed in one transaction,
+    and the submission in another one. If the job was created at the same time by another worker, that worker submits
+    it, and this one only returns it without touching its run folder.
     :param job_type: type of job to submit
     :param input_files_desc: dict with the paths of the input files
     :param input_files_hashes: dict with the hashes of the input files
     :param docker_image_url: image of the container to use
     :param job_params: parameters of the job
+    :param claimed_job: existing job that was claimed to be submitted again (see
+    delayed_job_models.claim_job_for_resubmission), None to create the job
     :return: the job object created
     """
-    job = delayed_job_models.get_or_create(job_type, job_params, docker_image_url, input_files_hashes)
-    job.progress = 0
-    job.started_at = None
-    job.finished_at = None
-    delayed_job_models.save_job(job)
-    app_logging.debug(f'Submitting Job: {job.id}')
-    prepare_job_and_submit(job, input_files_desc)
+    with delayed_job_models.unit_of_work():
+        if claimed_job is None:
+            job, job_was_created = delayed_job_models.create_job_if_not_exists(job_type, job_params, docker_image_url,
+                                                                              input_files_hashes)
+            if not job_was_created:
+                app_logging.debug(f'Job {job.id} was created at the same time by another worker')
+                discard_staged_input_files(input_files_desc)
+                return job
+        else:
+            job = claimed_job
+
+        job.status = delayed_job_models.JobStatuses.CREATED
+        job.progress = 0
+        job.started_at = None
+        job.finished_at = None
+        delayed_job_models.save_job(job)
+        # The input files are persisted now because the uploads are not available after the request finishes
+        prepare_run_folder(job, input_files_desc, input_files_hashes)
+
+    if submission_queue.QUEUE_ENABLED:
+        app_logging.debug(f'Adding Job to the submission queue: {job.id}')
+        submission_queue.enqueue(submit_created_job, job.id)
+    else:
+        app_logging.debug(f'Submitting Job: {job.id}')
+        submit_prepared_job(job)
+
     return job
 
 
@@ -253,14 +438,6 @@ def get_job_input_files_dir(job):
     return os.path.join(get_job_run_dir(job), INPUT_FILES_DIR_NAME)
 
 
-def get_job_submission_script_file_path(job):
-    """
-    :param job: DelayedJob object
-    :return: local path of the job results file
-    """
-    return os.path.join(get_job_run_dir(job), SUBMISSION_FILE_NAME)
-
-
 def get_job_run_params_file_path(job):
     """
     :param job: DelayedJob object
@@ -277,31 +454,118 @@ def get_job_output_dir_path(job):
     return os.path.join(JOBS_OUTPUT_DIR, job.id)
 
 
-def prepare_job_and_submit(job, input_files_desc):
+def prepare_job_and_submit(job, input_files_desc, input_files_hashes):
     """
     prepares the run directory of the job, then executes the job script as a suprpocess
     :param job: DelayedJob object
     :param input_files_desc: a dict describing the input files and their temporary location
+    :param input_files_hashes: dict with the hashes of the input files
     """
+    with delayed_job_models.unit_of_work():
+        prepare_run_folder(job, input_files_desc, input_files_hashes)
+    submit_prepared_job(job)
 
-    prepare_run_folder(job, input_files_desc)
-    prepare_output_dir(job)
-    prepare_job_submission_script(job)
-    submit_job_to_lsf(job)
+
+def submit_prepared_job(job):
+    """
+    Submits a job for which the run folder is already prepared to the executor set in the configuration. The changes
+    to the job are committed once when it is submitted. If the submission fails, they are rolled back and the job is
+    marked as failed, so it can be submitted again, and the error is raised again.
+    :param job: DelayedJob object
+    """
+    try:
+        with delayed_job_models.unit_of_work():
+            prepare_output_dir(job)
+            executors.get_executor().submit_job(job)
+    except Exception as error:
+        mark_job_submission_as_failed(job, error)
+        raise
+
+
+def mark_job_submission_as_failed(job, error):
+    """
+    Marks a job whose submission failed as failed, so it is submitted again the next time it is requested
+    :param job: DelayedJob object
+    :param error: the error produced when submitting the job
+    """
+    app_logging.error(f'Job {job.id} could not be submitted: {repr(error)}')
+    job.status = delayed_job_models.JobStatuses.ERROR
+    job.status_description = f'The job could not be submitted to LSF: {repr(error)}'
+    job.num_failures = (job.num_failures or 0) + 1
+    delayed_job_models.save_job(job)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Submission queue
+# ----------------------------------------------------------------------------------------------------------------------
+def submit_created_job(job_id):
+    """
+    Submits to LSF a job that was created and whose run folder was prepared in the request. It is run by the workers of
+    the submission queue. If the submission fails, the job is marked as failed so it can be submitted again.
+    :param job_id: id of the job to submit
+    """
+    job = delayed_job_models.get_job_by_id(job_id)
+    if job.status != delayed_job_models.JobStatuses.CREATED:
+        app_logging.debug(f'Job {job_id} is {job.status}, it is not submitted again')
+        return
+
+    try:
+        submit_prepared_job(job)
+    except Exception:  # pylint: disable=broad-except
+        # The job was already marked as failed, nobody waits for the error in the queue
+        pass
+
+
+def recover_unsubmitted_jobs():
+    """
+    Adds again to the submission queue the jobs that were created but whose submission never finished, for example
+    because the server restarted. If the run folder of a job was lost, it can not be submitted again and it is marked
+    as failed. Each job is claimed in the database first, so when several server processes recover the jobs at the
+    same time, each job is recovered by only one of them.
+    :return: the number of jobs added to the queue
+    """
+    created_before = datetime.utcnow() - timedelta(seconds=submission_queue.RECOVERY_MIN_AGE_SECONDS)
+    jobs_to_recover = delayed_job_models.get_jobs_pending_submission(created_before)
+
+    jobs_to_submit = []
+    for job in jobs_to_recover:
+        if not delayed_job_models.claim_job_for_recovery(job.id, created_before):
+            app_logging.debug(f'Job {job.id} is being recovered or submitted by another worker')
+            continue
+
+        if not os.path.isfile(get_job_run_params_file_path(job)):
+            app_logging.error(f'Job {job.id} can not be submitted again, its run folder was lost')
+            job.status = delayed_job_models.JobStatuses.ERROR
+            job.status_description = 'The submission of the job did not finish and its run folder was lost'
+            job.num_failures = (job.num_failures or 0) + 1
+            delayed_job_models.save_job(job)
+            continue
+
+        jobs_to_submit.append(job)
+
+    # The jobs are queued once all of them are claimed, so the claims are not delayed by the submissions
+    for job in jobs_to_submit:
+        submission_queue.enqueue(submit_created_job, job.id)
+    num_recovered = len(jobs_to_submit)
+
+    app_logging.info(f'{num_recovered} jobs were added again to the submission queue')
+    return num_recovered
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Preparation of run folder
 # ----------------------------------------------------------------------------------------------------------------------
 # pylint: disable=too-many-locals
-def prepare_run_folder(job, input_files_desc):
+def prepare_run_folder(job, input_files_desc, input_files_hashes):
     """
     Prepares the folder where the job will run
     :param job: DelayedJob object
+    :param input_files_desc: a dict describing the input files and their temporary location
+    :param input_files_hashes: dict with the hashes of the input files
     """
 
     create_job_run_dir(job)
-    create_params_file(job, input_files_desc)
+    create_params_file(job, input_files_desc, input_files_hashes)
 
 
 def create_job_run_dir(job):
@@ -323,17 +587,19 @@ def create_job_run_dir(job):
     app_logging.debug(f'Job run dir is {job_run_dir}')
 
 
-def create_params_file(job, input_files_desc):
+def create_params_file(job, input_files_desc, input_files_hashes):
     """
     Creates the parameters file for the job
     :param job: job oject for which the parmeters file will be created
+    :param input_files_desc: a dict describing the input files and their temporary location
+    :param input_files_hashes: dict with the hashes of the input files
     """
     job_token = token_generator.generate_job_token(job.id)
 
     run_params = {
         'job_id': job.id,
         'job_token': job_token,
-        'inputs': prepare_job_inputs(job, input_files_desc),
+        'inputs': prepare_job_inputs(job, input_files_desc, input_files_hashes),
         'output_dir': get_job_output_dir_path(job),
         'custom_job_config': get_custom_job_config_repo_params(job),
         'status_update_endpoint': {
@@ -373,32 +639,157 @@ def get_custom_job_config_repo_params(job):
     return custom_config
 
 
-def prepare_job_inputs(job, tmp_input_files_desc):
+def get_input_file_store_path(file_hash):
+    """
+    :param file_hash: sha256 hash of the contents of the input file
+    :return: the path of the input file in the content addressed store
+    """
+    return Path(INPUT_FILES_STORE_DIR).joinpath(file_hash[:2], file_hash)
+
+
+def move_file(source_path, dest_path):
+    """
+    Moves a file. When both paths are in the same filesystem (the normal case, see JOBS_STAGING_DIR) this is an atomic
+    rename, otherwise it falls back to copying the file.
+    :param source_path: current path of the file
+    :param dest_path: final path of the file
+    """
+    try:
+        os.replace(source_path, dest_path)
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+        app_logging.debug(f'{source_path} is in a different filesystem than {dest_path}, moving it instead')
+        shutil.move(source_path, dest_path)
+
+
+def link_file(source_path, link_path):
+    """
+    Creates a hard link to a file, if the filesystem does not allow it, it creates a symbolic link
+    :param source_path: path of the file to link
+    :param link_path: path of the link
+    """
+    try:
+        os.link(source_path, link_path)
+    except FileNotFoundError:
+        raise
+    except OSError as error:
+        app_logging.debug(f'Could not create a hard link to {source_path} ({error}), creating a symbolic link')
+        os.symlink(source_path, link_path)
+
+
+def link_stored_input_file(store_path, input_run_path):
+    """
+    Links a file that is already in the input files store from the run dir of a job. Its modification time is updated
+    first, so the maintenance task that deletes the files of the store that are not used by any job does not delete it
+    while the job that reuses it is being created (see maintenance.delete_unreferenced_input_files).
+    :param store_path: path of the file in the store, raises FileNotFoundError if it is not there
+    :param input_run_path: path of the file in the run dir of the job
+    """
+    os.utime(store_path)
+    link_file(store_path, input_run_path)
+
+
+def get_input_file_name(input_file_source):
     """
-    Moves the input files from the temporary folder to its proper run folder. Deletes the temporary files. Returns a
-    dictionary describing the input files.
+    :param input_file_source: the uploaded file or the path where it was staged
+    :return: the name of the input file
+    """
+    if isinstance(input_file_source, (str, Path)):
+        return Path(input_file_source).name
+    return input_file_source.filename
+
+
+def discard_staged_input_files(input_files_desc):
+    """
+    Deletes the staging directories of the input files that were staged. Used when the job does not need to be run,
+    the uploaded files that were not staged do not need to be deleted.
+    :param input_files_desc: dict describing the input files
+    """
+    for input_file_source in input_files_desc.values():
+        if isinstance(input_file_source, (str, Path)):
+            utils.delete_directory_robustly(Path(input_file_source).parent)
+
+
+def publish_uploaded_input_file(parameter, file_hash, input_run_path):
+    """
+    Places an uploaded input file in the content addressed store and links it from the run dir of the job. If a file
+    with the same contents is already in the store, the upload is not written to disk at all.
+    :param parameter: the file sent to the endpoint from flask
+    :param file_hash: sha256 hash of the contents of the file
+    :param input_run_path: path of the file in the run dir of the job
+    :return: the path of the file in the store
+    """
+    store_path = get_input_file_store_path(file_hash)
+    try:
+        link_stored_input_file(store_path, input_run_path)
+        app_logging.debug(f'{store_path} was already in the input files store, reusing it')
+    except FileNotFoundError:
+        os.makedirs(JOBS_STAGING_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=JOBS_STAGING_DIR)
+        tmp_path = Path(tmp_dir).joinpath(parameter.filename)
+        save_input_file_and_get_hash(parameter, tmp_path)
+        os.makedirs(store_path.parent, exist_ok=True)
+        move_file(tmp_path, store_path)
+        utils.delete_directory_robustly(tmp_dir)
+        link_file(store_path, input_run_path)
+
+    return store_path
+
+
+def publish_input_file(tmp_path, file_hash, input_run_path):
+    """
+    Places an input file in the content addressed store and links it from the run dir of the job. If a file with the
+    same contents is already in the store, the staged file is discarded and the existing one is reused.
+    :param tmp_path: path where the file was staged
+    :param file_hash: sha256 hash of the contents of the file
+    :param input_run_path: path of the file in the run dir of the job
+    :return: the path of the file in the store
+    """
+    store_path = get_input_file_store_path(file_hash)
+    try:
+        link_stored_input_file(store_path, input_run_path)
+        os.remove(tmp_path)
+        app_logging.debug(f'{store_path} was already in the input files store, reusing it')
+    except FileNotFoundError:
+        os.makedirs(store_path.parent, exist_ok=True)
+        move_file(tmp_path, store_path)
+        link_file(store_path, input_run_path)
+
+    return store_path
+
+
+def prepare_job_inputs(job, tmp_input_files_desc, input_files_hashes):
+    """
+    Publishes the input files to the input files store, and links them from the run folder. Deletes the staging
+    directories. Returns a dictionary describing the input files.
     :param job: job object for which the input files are prepared
-    :param tmp_input_files_desc: dict describing the temporary path
+    :param tmp_input_files_desc: dict describing the input files, the values are either the uploaded files or the
+    paths where they were staged
+    :param input_files_hashes: dict with the hashes of the input files
     """
     input_files_desc = {}
-    tmp_parent_dir = None
+    tmp_parent_dirs = set()
 
-    for key, tmp_path in tmp_input_files_desc.items():
-        filename = Path(tmp_path).name
+    for key, input_file_source in tmp_input_files_desc.items():
+        filename = get_input_file_name(input_file_source)
         input_run_path = Path(get_job_input_files_dir(job)).joinpath(filename)
-        shutil.move(tmp_path, input_run_path)
-        tmp_parent_dir = Path(tmp_path).parent
+        if isinstance(input_file_source, (str, Path)):
+            store_path = publish_input_file(input_file_source, input_files_hashes[key], input_run_path)
+            tmp_parent_dirs.add(Path(input_file_source).parent)
+        else:
+            store_path = publish_uploaded_input_file(input_file_source, input_files_hashes[key], input_run_path)
         input_files_desc[key] = str(input_run_path)
 
         input_key = f'{key}'
         job_input_file = delayed_job_models.InputFile(
             input_key=input_key,
-            internal_path=str(input_run_path),
+            internal_path=str(store_path),
             public_url=f'/status/inputs/{job.id}/{input_key}'
         )
         delayed_job_models.add_input_file_to_job(job, job_input_file)
 
-    if tmp_parent_dir is not None:
+    for tmp_parent_dir in tmp_parent_dirs:
         utils.delete_directory_robustly(tmp_parent_dir)
 
     return input_files_desc
@@ -428,125 +819,106 @@ def get_job_resources_params(job):
     :param job: job object for which to generate the parameters string
     :return: the parameters if that is the case, empty string if the default settings must be used.
     """
-    job_config = delayed_job_models.get_job_config(job.type)
-    source_requirements_script_path = job_config.requirements_script_path
+    return requirements_calculation_service.get_job_resources_params(job, get_job_run_params_file_path(job))
 
-    if source_requirements_script_path is None:
-        return ''
 
-    dest_requirements_script_path = Path(job.run_dir_path).joinpath('requirements_calculation.py')
-    shutil.copyfile(source_requirements_script_path, dest_requirements_script_path)
+def get_job_submission_template():
+    """
+    :return: the text of the template used to create the job submission scripts
+    """
+    return script_templates.get_template(script_templates.SUBMIT_JOB_TEMPLATE)
 
-    file_stats = os.stat(source_requirements_script_path)
-    os.chmod(dest_requirements_script_path, file_stats.st_mode | stat.S_IEXEC)
 
+def get_job_submission_script_params(job):
+    """
+    Calculates the values of the placeholders of the job submission template for the job given. It also sets the
+    requirements parameters string and the lsf host of the job, the job is not saved.
+    :param job: job object for which to calculate the parameters
+    :return: a dict with the values to use in the job submission template
+    """
+    lsf_config = RUN_CONFIG.get('lsf_submission')
+    lsf_user = lsf_config['lsf_user']
+    lsf_host = lsf_config['lsf_host']
     run_params_path = get_job_run_params_file_path(job)
-    run_command = f'{dest_requirements_script_path} {run_params_path}'
 
-    requirements_params_process = subprocess.run(run_command.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    job_config = delayed_job_models.get_job_config(job.type)
 
-    return_code = requirements_params_process.returncode
-    app_logging.debug(f'requirements return code was: {return_code}')
-    if return_code != 0:
-        raise JobSubmissionError('There was an error when running the job submission script! Please check the logs')
+    if (job_config.docker_registry_username is not None) and (job_config.docker_registry_password is not None):
+        set_username = f"export SINGULARITY_DOCKER_USERNAME='{job_config.docker_registry_username}'"
+        set_password = f"export SINGULARITY_DOCKER_PASSWORD='{job_config.docker_registry_password}'"
+        set_docker_registry_credentials = f'{set_username}\n{set_password}\n'
+    else:
+        set_docker_registry_credentials = ''
 
-    app_logging.debug(f'Run params Output: \n {requirements_params_process.stdout}')
-    app_logging.debug(f'Run params Error: \n {requirements_params_process.stderr}')
+    resources_params = get_job_resources_params(job)
 
-    params_ouput_str = requirements_params_process.stdout.decode().rstrip()
-    if params_ouput_str == 'DEFAULT':
-        return ''
+    job.requirements_parameters_string = resources_params
+    job.lsf_host = lsf_host
 
-    return params_ouput_str
+    return {
+        'JOB_ID': job.id,
+        'LSF_USER': lsf_user,
+        'LSF_HOST': lsf_host,
+        'SSH_CONNECTION_OPTIONS': ssh_connections.get_ssh_connection_options(lsf_user, lsf_host),
+        'RUN_PARAMS_FILE': run_params_path,
+        'DOCKER_IMAGE_URL': job.docker_image_url,
+        'SET_DOCKER_REGISTRY_CREDENTIALS': set_docker_registry_credentials,
+        'RUN_DIR': get_job_run_dir(job),
+        'RESOURCES_PARAMS': resources_params
+    }
 
 
 def prepare_job_submission_script(job):
     """
-    Prepares the script that will submit the job to LSF
+    Generates the script that will submit the job to LSF
     :param job: job object for which prepare the job submission script
+    :return: the text of the script
     """
-
-    job_submission_script_template_path = os.path.join(Path().absolute(), 'templates', SUBMISSION_FILE_NAME)
-    with open(job_submission_script_template_path, 'r') as template_file:
-        submit_job_template = template_file.read()
-
-        lsf_config = RUN_CONFIG.get('lsf_submission')
-        lsf_user = lsf_config['lsf_user']
-        lsf_host = lsf_config['lsf_host']
-        run_params_path = get_job_run_params_file_path(job)
-
-        job_config = delayed_job_models.get_job_config(job.type)
-
-        if (job_config.docker_registry_username is not None) and (job_config.docker_registry_password is not None):
-            set_username = f"export SINGULARITY_DOCKER_USERNAME='{job_config.docker_registry_username}'"
-            set_password = f"export SINGULARITY_DOCKER_PASSWORD='{job_config.docker_registry_password}'"
-            set_docker_registry_credentials = f'{set_username}\n{set_password}\n'
-        else:
-            set_docker_registry_credentials = ''
-
-        resources_params = get_job_resources_params(job)
-
-        job_submission_script = submit_job_template.format(
-            JOB_ID=job.id,
-            LSF_USER=lsf_user,
-            LSF_HOST=lsf_host,
-            RUN_PARAMS_FILE=run_params_path,
-            DOCKER_IMAGE_URL=job.docker_image_url,
-            SET_DOCKER_REGISTRY_CREDENTIALS=set_docker_registry_credentials,
-            RUN_DIR=get_job_run_dir(job),
-            RESOURCES_PARAMS=resources_params
-
-        )
-        job.requirements_parameters_string = resources_params
-        job.lsf_host = lsf_host
-        delayed_job_models.save_job(job)
-
-        submit_file_path = get_job_submission_script_file_path(job)
-        with open(submit_file_path, 'w') as submission_script_file:
-            submission_script_file.write(job_submission_script)
-
-        # make sure file is executable
-        file_stats = os.stat(submit_file_path)
-        os.chmod(submit_file_path, file_stats.st_mode | stat.S_IEXEC)
+    job_submission_script = script_templates.render(script_templates.SUBMIT_JOB_TEMPLATE,
+                                                    **get_job_submission_script_params(job))
+    delayed_job_models.save_job(job)
+    return job_submission_script
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Job submission
 # ----------------------------------------------------------------------------------------------------------------------
-def submit_job_to_lsf(job):
+def submit_job_to_lsf(job, job_submission_script):
     """
-    Runs a script that submits the job to LSF
+    Runs the script that submits the job to LSF. The output of the script is saved in the run dir of the job only if
+    there was an error.
     :param job: DelayedJob object
+    :param job_submission_script: text of the job submission script
     """
-    submit_file_path = get_job_submission_script_file_path(job)
-    submission_output_path = Path(submit_file_path).parent.joinpath('submission.out')
-    submission_error_path = Path(submit_file_path).parent.joinpath('submission.err')
-
     lsf_config = RUN_CONFIG.get('lsf_submission')
     id_rsa_path = lsf_config['id_rsa_file']
 
-    run_command = f'{submit_file_path} {id_rsa_path}'
-    app_logging.debug(f'Going to run job submission script, command: {run_command}')
+    app_logging.debug(f'Going to run job submission script for job {job.id}')
 
     must_run_jobs = RUN_CONFIG.get('run_jobs', True)
     if not must_run_jobs:
         app_logging.debug(f'Not submitting jobs because run_jobs is False')
         return
 
-    submission_process = subprocess.run(run_command.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    ssh_connections.ensure_lsf_master_connection()
+    submission_process = script_templates.run_script(job_submission_script, [id_rsa_path])
 
     app_logging.debug(f'Submission STD Output: \n {submission_process.stdout}')
     app_logging.debug(f'Submission STD Error: \n {submission_process.stderr}')
 
-    with open(submission_output_path, 'wb') as submission_out_file:
-        submission_out_file.write(submission_process.stdout)
-
-    with open(submission_error_path, 'wb') as submission_err_file:
-        submission_err_file.write(submission_process.stderr)
-
     return_code = submission_process.returncode
     app_logging.debug(f'submission return code was: {return_code}')
+    ssh_connections.react_to_lsf_script_return_code(return_code)
     if return_code != 0:
+        submission_output_path = Path(get_job_run_dir(job)).joinpath('submission.out')
+        submission_error_path = Path(get_job_run_dir(job)).joinpath('submission.err')
+
+        with open(submission_output_path, 'wb') as submission_out_file:
+            submission_out_file.write(submission_process.stdout)
+
+        with open(submission_error_path, 'wb') as submission_err_file:
+            submission_err_file.write(submission_process.stderr)
+
         raise JobSubmissionError('There was an error when running the job submission script! Please check the logs')
 
     lsf_job_id = get_lsf_job_id(str(submission_process.stdout))
@@ -0,0 +1,251 @@
+"""
+Module that calculates the parameters for bsub with the resources that a job requires. The calculation is done by the
+requirements script of the job type, or by a plugin function configured for the job type that runs in the same
+process. The results are kept in memory, so jobs with the same type, parameters and input file sizes do not run the
+calculation again.
+The calculations must depend only on the job type, the job parameters, the custom config of the job type and the
+sizes of the input files. The parameters that the calculation of a job type uses can be configured, so jobs that only
+differ in other parameters share the result. The parameters of the system (dl__*) are never used.
+"""
+import base64
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+import app.app_logging as app_logging
+
+REQUIREMENTS_CALCULATION_CONFIG = RUN_CONFIG.get('requirements_calculation', {})
+CACHE_MAX_SIZE = REQUIREMENTS_CALCULATION_CONFIG.get('cache_max_size', 1000)
+CACHE_TTL_SECONDS = REQUIREMENTS_CALCULATION_CONFIG.get('cache_ttl_seconds', 3600)
+# Job type -> 'package.module:function'. The function receives the path of the run params file of the job and returns
+# the same text that a requirements script prints.
+PLUGINS = REQUIREMENTS_CALCULATION_CONFIG.get('plugins', {})
+# Job type -> list of the names of the job params that the calculation uses. All the params if the type is not here.
+KEY_PARAMS = REQUIREMENTS_CALCULATION_CONFIG.get('key_params', {})
+SYSTEM_PARAMS_PREFIX = 'dl__'
+
+DEFAULT_REQUIREMENTS = 'DEFAULT'
+REQUIREMENTS_SCRIPT_FILENAME = 'requirements_calculation.py'
+
+# Key -> (expiration_time, parameters), the least recently used ones are evicted first
+CACHED_REQUIREMENTS = OrderedDict()
+CACHE_STATS = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0
+}
+CACHE_LOCK = threading.Lock()
+LOADED_PLUGINS = {}
+
+
+class RequirementsCalculationError(Exception):
+    """Base class for exceptions in this module."""
+
+
+def get_job_resources_params(job, run_params_path):
+    """
+    Gets the string with the parameters for bsub for the job requirements parameters
+    :param job: job object for which to generate the parameters string, its run folder must be prepared
+    :param run_params_path: path of the run params file of the job
+    :return: the parameters if that is the case, empty string if the default settings must be used.
+    """
+    plugin_path = PLUGINS.get(job.type)
+    source_requirements_script_path = delayed_job_models.get_job_config(job.type).requirements_script_path
+
+    if plugin_path is not None:
+        calculation_source = f'plugin:{plugin_path}'
+    elif source_requirements_script_path is not None:
+        script_stats = os.stat(source_requirements_script_path)
+        # If the script changes, its results are not used anymore
+        calculation_source = f'script:{source_requirements_script_path}:{script_stats.st_mtime_ns}:' \
+                             f'{script_stats.st_size}'
+    else:
+        return ''
+
+    requirements_key = get_requirements_key(job, calculation_source)
+    requirements_output = get_cached_requirements(requirements_key)
+    if requirements_output is None:
+        if plugin_path is not None:
+            requirements_output = calculate_requirements_with_plugin(plugin_path, run_params_path)
+        else:
+            requirements_output = calculate_requirements_with_script(job, source_requirements_script_path,
+                                                                     run_params_path)
+        save_requirements_in_cache(requirements_key, requirements_output)
+
+    if requirements_output == DEFAULT_REQUIREMENTS:
+        return ''
+
+    return requirements_output
+
+
+def get_requirements_key(job, calculation_source):
+    """
+    :param job: job object for which to get the key
+    :param calculation_source: text that identifies the script or plugin that does the calculation
+    :return: the key that identifies the result of the calculation for the job
+    """
+    custom_config = {config.key: config.value for config in delayed_job_models.get_custom_config_values(job.type)}
+    key_data = {
+        'job_type': job.type,
+        'calculation_source': calculation_source,
+        'job_params': get_key_params(job),
+        'custom_job_config': custom_config,
+        'input_files_sizes': get_input_files_sizes(job)
+    }
+    key_digest = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).digest()
+    return base64.b64encode(key_digest).decode('utf-8')
+
+
+def get_key_params(job):
+    """
+    :param job: job object for which to get the params
+    :return: a dict with the params of the job that the calculation uses, by name
+    """
+    job_params = json.loads(job.raw_params)
+    key_param_names = KEY_PARAMS.get(job.type)
+    return {param_name: param_value for param_name, param_value in job_params.items()
+            if not param_name.startswith(SYSTEM_PARAMS_PREFIX)
+            and (key_param_names is None or param_name in key_param_names)}
+
+
+def get_input_files_sizes(job):
+    """
+    :param job: job object for which to get the sizes
+    :return: a dict with the size in bytes of each input file of the job, by input key
+    """
+    return {input_file.input_key: os.path.getsize(input_file.internal_path) for input_file in job.input_files}
+
+
+def calculate_requirements_with_script(job, source_requirements_script_path, run_params_path):
+    """
+    Runs the requirements script of the job type in the run dir of the job
+    :param job: job object for which to calculate the requirements
+    :param source_requirements_script_path: path of the requirements script of the job type
+    :param run_params_path: path of the run params file of the job
+    :return: the text printed by the script
+    """
+    dest_requirements_script_path = Path(job.run_dir_path).joinpath(REQUIREMENTS_SCRIPT_FILENAME)
+    shutil.copyfile(source_requirements_script_path, dest_requirements_script_path)
+
+    file_stats = os.stat(source_requirements_script_path)
+    os.chmod(dest_requirements_script_path, file_stats.st_mode | stat.S_IEXEC)
+
+    run_command = f'{dest_requirements_script_path} {run_params_path}'
+
+    requirements_params_process = subprocess.run(run_command.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    return_code = requirements_params_process.returncode
+    app_logging.debug(f'requirements return code was: {return_code}')
+    if return_code != 0:
+        raise RequirementsCalculationError('There was an error when running the requirements script! '
+                                           'Please check the logs')
+
+    app_logging.debug(f'Run params Output: \n {requirements_params_process.stdout}')
+    app_logging.debug(f'Run params Error: \n {requirements_params_process.stderr}')
+
+    return requirements_params_process.stdout.decode().rstrip()
+
+
+def calculate_requirements_with_plugin(plugin_path, run_params_path):
+    """
+    Calculates the requirements with the plugin function given, in this process
+    :param plugin_path: path of the function in the form 'package.module:function'
+    :param run_params_path: path of the run params file of the job
+    :return: the text returned by the function
+    """
+    plugin_function = load_plugin(plugin_path)
+    try:
+        requirements_output = plugin_function(run_params_path)
+    except Exception as error:
+        raise RequirementsCalculationError(f'There was an error when running the requirements plugin {plugin_path}: '
+                                           f'{repr(error)}') from error
+
+    return str(requirements_output).rstrip()
+
+
+def load_plugin(plugin_path):
+    """
+    Imports the plugin function given, it is imported only the first time
+    :param plugin_path: path of the function in the form 'package.module:function'
+    :return: the function
+    """
+    plugin_function = LOADED_PLUGINS.get(plugin_path)
+    if plugin_function is not None:
+        return plugin_function
+
+    module_name, separator, function_name = plugin_path.partition(':')
+    if separator == '' or function_name == '':
+        raise RequirementsCalculationError(f'The requirements plugin {plugin_path} must be in the form '
+                                           'package.module:function')
+    try:
+        plugin_function = getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError) as error:
+        raise RequirementsCalculationError(f'The requirements plugin {plugin_path} could not be loaded: '
+                                           f'{repr(error)}') from error
+
+    LOADED_PLUGINS[plugin_path] = plugin_function
+    return plugin_function
+
+
+def get_cached_requirements(requirements_key):
+    """
+    :param requirements_key: key of the calculation
+    :return: the result of the calculation if it is in the cache and has not expired, None otherwise
+    """
+    now = time.monotonic()
+    with CACHE_LOCK:
+        cached_requirements = CACHED_REQUIREMENTS.get(requirements_key)
+        if cached_requirements is None or cached_requirements[0] <= now:
+            CACHE_STATS['misses'] += 1
+            return None
+
+        CACHED_REQUIREMENTS.move_to_end(requirements_key)
+        CACHE_STATS['hits'] += 1
+        return cached_requirements[1]
+
+
+def save_requirements_in_cache(requirements_key, requirements_output):
+    """
+    Saves the result of a calculation, the least recently used ones are evicted when the cache is full
+    :param requirements_key: key of the calculation
+    :param requirements_output: result of the calculation
+    """
+    with CACHE_LOCK:
+        CACHED_REQUIREMENTS[requirements_key] = (time.monotonic() + CACHE_TTL_SECONDS, requirements_output)
+        CACHED_REQUIREMENTS.move_to_end(requirements_key)
+        while len(CACHED_REQUIREMENTS) > CACHE_MAX_SIZE:
+            CACHED_REQUIREMENTS.popitem(last=False)
+            CACHE_STATS['evictions'] += 1
+
+
+def clear_cache():
+    """
+    Removes all the results and resets the counters, it is called when the app is created
+    """
+    with CACHE_LOCK:
+        CACHED_REQUIREMENTS.clear()
+        for stat_name in CACHE_STATS:
+            CACHE_STATS[stat_name] = 0
+
+
+def get_cache_stats():
+    """
+    :return: a dict with the counters of the cache and the number of results saved
+    """
+    with CACHE_LOCK:
+        return {
+            **CACHE_STATS,
+            'num_cached_results': len(CACHED_REQUIREMENTS),
+            'max_size': CACHE_MAX_SIZE,
+            'ttl_seconds': CACHE_TTL_SECONDS
+        }
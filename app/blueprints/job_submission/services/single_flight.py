@@ -0,0 +1,63 @@
+"""
+Module that coalesces the calls that are done at the same time with the same key in this process. The first call runs
+the function, and the calls with the same key that arrive while it is running wait for it and get its result, instead
+of running the function again. It is used so when the same job is submitted several times at the same time, only one
+of the submissions prepares and submits it.
+"""
+import threading
+
+# Key -> dict with the state of the call that is running for that key
+CALLS_IN_FLIGHT = {}
+CALLS_IN_FLIGHT_LOCK = threading.Lock()
+
+
+def run(key, func):
+    """
+    Runs the function given, unless a call with the same key is already running. In that case it waits for it and
+    returns its result, or raises its error.
+    :param key: key that identifies the call
+    :param func: function to run, without parameters
+    :return: a tuple with the result of the function and a boolean that is True if the result was produced by another
+    call that was running with the same key
+    """
+    with CALLS_IN_FLIGHT_LOCK:
+        call = CALLS_IN_FLIGHT.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = {
+                'done': threading.Event(),
+                'result': None,
+                'error': None,
+                'num_waiting': 0
+            }
+            CALLS_IN_FLIGHT[key] = call
+        else:
+            call['num_waiting'] += 1
+
+    if not is_leader:
+        call['done'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return call['result'], True
+
+    try:
+        call['result'] = func()
+    except Exception as error:
+        call['error'] = error
+        raise
+    finally:
+        with CALLS_IN_FLIGHT_LOCK:
+            del CALLS_IN_FLIGHT[key]
+        call['done'].set()
+
+    return call['result'], False
+
+
+def get_num_waiting(key):
+    """
+    :param key: key that identifies the call
+    :return: the number of calls that are waiting for the call running with the key given, 0 if there is none
+    """
+    with CALLS_IN_FLIGHT_LOCK:
+        call = CALLS_IN_FLIGHT.get(key)
+        return 0 if call is None else call['num_waiting']
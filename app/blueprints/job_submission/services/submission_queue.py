@@ -0,0 +1,116 @@
+"""
+Module that runs the submission of the jobs to LSF in a pool of workers, so the requests do not have to wait for the
+ssh connection to the LSF head node.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from flask import current_app
+
+from app.config import RUN_CONFIG
+import app.app_logging as app_logging
+
+SUBMISSION_QUEUE_CONFIG = RUN_CONFIG.get('job_submission_queue', {})
+QUEUE_ENABLED = SUBMISSION_QUEUE_CONFIG.get('enabled', False)
+THREAD_WORKERS = 'thread'
+PROCESS_WORKERS = 'process'
+WORKERS_TYPE = SUBMISSION_QUEUE_CONFIG.get('workers_type', THREAD_WORKERS)
+NUM_WORKERS = SUBMISSION_QUEUE_CONFIG.get('num_workers', 4)
+# Jobs that are still CREATED after this time are considered as not submitted when the app starts again.
+RECOVERY_MIN_AGE_SECONDS = SUBMISSION_QUEUE_CONFIG.get('recovery_min_age_seconds', 300)
+
+EXECUTOR = None
+# App used by the workers when they are processes, it is created when each process starts.
+WORKER_APP = None
+
+
+class SubmissionQueueError(Exception):
+    """Base class for exceptions in this module."""
+
+
+def init_worker_process():
+    """
+    Creates the app that is used by a worker process to run the submissions
+    """
+    global WORKER_APP
+    from app import create_app
+    WORKER_APP = create_app(is_submission_worker=True)
+
+
+def get_executor():
+    """
+    :return: the pool of workers used to run the submissions, it is created the first time it is requested
+    """
+    global EXECUTOR
+    if EXECUTOR is not None:
+        return EXECUTOR
+
+    if WORKERS_TYPE == THREAD_WORKERS:
+        EXECUTOR = ThreadPoolExecutor(max_workers=NUM_WORKERS, thread_name_prefix='job_submission')
+    elif WORKERS_TYPE == PROCESS_WORKERS:
+        EXECUTOR = ProcessPoolExecutor(max_workers=NUM_WORKERS, initializer=init_worker_process)
+    else:
+        raise SubmissionQueueError(f'job_submission_queue.workers_type must be {THREAD_WORKERS} or '
+                                   f'{PROCESS_WORKERS}, got {WORKERS_TYPE}')
+
+    app_logging.debug(f'Started a pool of {NUM_WORKERS} {WORKERS_TYPE} workers for the job submissions')
+    return EXECUTOR
+
+
+def run_in_app_context(flask_app, func, *args):
+    """
+    Runs the function given in the context of the app given, used by the thread workers
+    :param flask_app: app in which context to run the function
+    :param func: function to run
+    :param args: arguments for the function
+    """
+    with flask_app.app_context():
+        return func(*args)
+
+
+def run_in_worker_app_context(func, *args):
+    """
+    Runs the function given in the context of the app of the worker process
+    :param func: function to run
+    :param args: arguments for the function
+    """
+    with WORKER_APP.app_context():
+        return func(*args)
+
+
+def log_failed_submission(future):
+    """
+    Logs the errors that were not handled by the submission function
+    :param future: future of the submission that finished
+    """
+    error = future.exception()
+    if error is not None:
+        app_logging.error(f'A job submission in the queue failed: {repr(error)}')
+
+
+def enqueue(func, *args):
+    """
+    Adds a submission to the queue. It must be called in the app context.
+    :param func: function that does the submission, it must be a module level function so it can be sent to the
+    process workers
+    :param args: arguments for the function
+    :return: the future of the submission
+    """
+    executor = get_executor()
+    if WORKERS_TYPE == PROCESS_WORKERS:
+        future = executor.submit(run_in_worker_app_context, func, *args)
+    else:
+        future = executor.submit(run_in_app_context, current_app._get_current_object(), func, *args)
+
+    future.add_done_callback(log_failed_submission)
+    return future
+
+
+def shutdown(wait=True):
+    """
+    Stops the pool of workers, the next submission starts a new one
+    :param wait: if True, waits for the pending submissions to finish
+    """
+    global EXECUTOR
+    if EXECUTOR is not None:
+        EXECUTOR.shutdown(wait=wait)
+        EXECUTOR = None
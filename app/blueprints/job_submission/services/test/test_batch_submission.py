@@ -0,0 +1,266 @@
+"""
+This Module tests the batch submission of jobs
+"""
+import datetime
+import json
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from app import create_app
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import batch_submission_service
+
+
+class TestBatchSubmission(unittest.TestCase):
+    """
+    Class to test the batch submission of jobs
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+
+    def tearDown(self):
+
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+            for dir_path in [job_submission_service.JOBS_RUN_DIR, job_submission_service.JOBS_TMP_DIR,
+                             job_submission_service.JOBS_OUTPUT_DIR]:
+                shutil.rmtree(dir_path, ignore_errors=True)
+
+    @staticmethod
+    def get_test_job_specs(num_jobs):
+        """
+        :param num_jobs: number of specs to generate
+        :return: a list of specs of test jobs that are all different
+        """
+        return [{
+            'job_type': 'TEST',
+            'params': {
+                'instruction': 'RUN_NORMALLY',
+                'seconds': str(i + 1),
+                'api_url': 'https://www.ebi.ac.uk/chembl/api/data/similarity/CCCC/80.json',
+                'dl__ignore_cache': 'false'
+            }
+        } for i in range(num_jobs)]
+
+    def test_jobs_can_be_submitted_in_a_batch(self):
+        """
+        Test that several jobs can be submitted in a batch, and that the ones that already exist are taken from the
+        cache
+        """
+        with self.flask_app.app_context():
+            job_specs = self.get_test_job_specs(3)
+
+            first_response = batch_submission_service.submit_jobs_batch(job_specs[:2])
+            self.assertEqual([False, False], [job['was_cached'] for job in first_response],
+                             msg='The new jobs must not be marked as cached')
+
+            for job_response in first_response:
+                job = delayed_job_models.get_job_by_id(job_response['job_id'])
+                run_dir = job_submission_service.get_job_run_dir(job)
+                params_file_path = job_submission_service.get_job_run_params_file_path(job)
+                self.assertTrue(os.path.isfile(params_file_path),
+                                msg=f'The run params file was not created in {run_dir}')
+
+            # the same job twice in the batch must be submitted only once
+            second_specs = job_specs + [job_specs[2]]
+            second_response = batch_submission_service.submit_jobs_batch(second_specs)
+            self.assertEqual([True, True, False, False], [job['was_cached'] for job in second_response],
+                             msg='The jobs that already existed must be taken from the cache')
+            self.assertEqual(first_response[0]['job_id'], second_response[0]['job_id'],
+                             msg='The id of the job must be the same when it is taken from the cache')
+            self.assertEqual(second_response[2]['job_id'], second_response[3]['job_id'],
+                             msg='The same job must have the same id in the batch')
+            self.assertEqual(3, delayed_job_models.DelayedJob.query.count(),
+                             msg='Each job must be created only once')
+
+    def test_expired_jobs_are_deleted_with_their_files_and_submitted_again(self):
+        """
+        Test that the jobs of the batch that expired are deleted with their files, and created again
+        """
+        with self.flask_app.app_context():
+            job_specs = self.get_test_job_specs(1)
+            job_id = batch_submission_service.submit_jobs_batch(job_specs)[0]['job_id']
+
+            job = delayed_job_models.get_job_by_id(job_id)
+            job.status = delayed_job_models.JobStatuses.FINISHED
+            job.expires_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            delayed_job_models.save_job(job)
+            old_file_path = Path(job_submission_service.get_job_run_dir(job)).joinpath('old_output.txt')
+            old_file_path.touch()
+
+            response = batch_submission_service.submit_jobs_batch(job_specs)
+            self.assertFalse(response[0]['was_cached'], msg='An expired job must not be taken from the cache')
+            self.assertFalse(os.path.isfile(old_file_path), msg='The files of the expired job must be deleted')
+
+            job = delayed_job_models.get_job_by_id(job_id, force_refresh=True)
+            self.assertIsNone(job.expires_at, msg='The job must have been created again')
+
+    def test_jobs_created_at_the_same_time_by_another_worker_are_not_created_again(self):
+        """
+        Test that when a job of the batch is created by another worker after the batch read the existing jobs, the
+        batch returns it instead of failing to create it
+        """
+        with self.flask_app.app_context():
+            job_specs = self.get_test_job_specs(2)
+            get_jobs_by_ids_was = delayed_job_models.get_jobs_by_ids
+
+            def get_jobs_and_create_one_of_them(job_ids):
+                jobs = get_jobs_by_ids_was(job_ids)
+                # another worker submits the first job right after the batch reads the existing ones
+                job_submission_service.submit_job('TEST', {}, {}, delayed_job_models.get_docker_image_url('TEST'),
+                                                  dict(job_specs[0]['params']))
+                return jobs
+
+            delayed_job_models.get_jobs_by_ids = get_jobs_and_create_one_of_them
+            try:
+                response = batch_submission_service.submit_jobs_batch(job_specs)
+            finally:
+                delayed_job_models.get_jobs_by_ids = get_jobs_by_ids_was
+
+            self.assertEqual([True, False], [job['was_cached'] for job in response],
+                             msg='The job created by the other worker must be returned as cached')
+            self.assertEqual(2, delayed_job_models.DelayedJob.query.count(), msg='Each job must be created only once')
+
+    def test_failed_jobs_claimed_by_another_worker_are_not_submitted_again(self):
+        """
+        Test that a failed job is submitted again by the batch only if no other worker claimed it before
+        """
+        with self.flask_app.app_context():
+            job_specs = self.get_test_job_specs(1)
+            job_id = batch_submission_service.submit_jobs_batch(job_specs)[0]['job_id']
+            job = delayed_job_models.get_job_by_id(job_id)
+            job.status = delayed_job_models.JobStatuses.ERROR
+            job.num_failures = 1
+            delayed_job_models.save_job(job)
+
+            get_jobs_by_ids_was = delayed_job_models.get_jobs_by_ids
+            submit_jobs_to_lsf_was = batch_submission_service.submit_jobs_to_lsf
+            jobs_submitted = []
+
+            def get_jobs_and_claim_them(job_ids):
+                jobs = get_jobs_by_ids_was(job_ids)
+                # another worker claims the jobs right after the batch reads them
+                delayed_job_models.DelayedJob.query.filter(delayed_job_models.DelayedJob.id.in_(job_ids)).update(
+                    {delayed_job_models.DelayedJob.status: delayed_job_models.JobStatuses.CREATED},
+                    synchronize_session=False)
+                return jobs
+
+            delayed_job_models.get_jobs_by_ids = get_jobs_and_claim_them
+            batch_submission_service.submit_jobs_to_lsf = jobs_submitted.extend
+            try:
+                response = batch_submission_service.submit_jobs_batch(job_specs)
+            finally:
+                delayed_job_models.get_jobs_by_ids = get_jobs_by_ids_was
+                batch_submission_service.submit_jobs_to_lsf = submit_jobs_to_lsf_was
+
+            self.assertTrue(response[0]['was_cached'], msg='The job must be returned as cached')
+            self.assertEqual(jobs_submitted, [], msg='The job claimed by another worker must not be submitted again')
+
+    def test_jobs_are_marked_as_failed_when_the_batch_can_not_be_submitted(self):
+        """
+        Test that when the batch submission script fails, all the jobs of the batch are marked as failed, so they are
+        not taken from the cache as if they were being submitted
+        """
+        with self.flask_app.app_context():
+            job_specs = self.get_test_job_specs(2)
+            run_jobs_was = RUN_CONFIG.get('run_jobs')
+            run_batch_submission_script_was = batch_submission_service.run_batch_submission_script
+
+            def fail_submission(batch_script):
+                raise OSError('The lsf host is not reachable')
+
+            RUN_CONFIG['run_jobs'] = True
+            batch_submission_service.run_batch_submission_script = fail_submission
+            try:
+                response = batch_submission_service.submit_jobs_batch(job_specs)
+            finally:
+                RUN_CONFIG['run_jobs'] = run_jobs_was
+                batch_submission_service.run_batch_submission_script = run_batch_submission_script_was
+
+            self.assertEqual(['ERROR', 'ERROR'], [job['status'] for job in response],
+                             msg='The jobs that could not be submitted must be returned as failed')
+            for job_response in response:
+                job = delayed_job_models.get_job_by_id(job_response['job_id'], force_refresh=True)
+                self.assertEqual(job.status, delayed_job_models.JobStatuses.ERROR,
+                                 msg='The jobs that could not be submitted must be marked as failed')
+                self.assertEqual(job.num_failures, 1, msg='The failure must be counted')
+                self.assertIsNone(job.lsf_job_id, msg='The changes of the failed submission must be rolled back')
+
+            response = batch_submission_service.submit_jobs_batch(job_specs)
+            self.assertEqual(['CREATED', 'CREATED'], [job['status'] for job in response],
+                             msg='The failed jobs must be submitted again')
+
+    def test_batch_submission_endpoint_validates_the_jobs(self):
+        """
+        Test that the batch submission endpoint validates the params of each job with the schema of its type
+        """
+        with self.flask_app.app_context():
+            valid_specs = self.get_test_job_specs(2)
+            response = self.client.post('/submit/batch', data=json.dumps({'jobs': valid_specs}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200, msg='The batch should have been accepted')
+            self.assertEqual(2, len(response.json['jobs']), msg='There must be a response for each job')
+
+            invalid_specs = self.get_test_job_specs(1)
+            invalid_specs[0]['params']['instruction'] = 'DO_SOMETHING_ELSE'
+            response = self.client.post('/submit/batch', data=json.dumps({'jobs': invalid_specs}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, msg='The params of the job must be validated')
+
+            response = self.client.post('/submit/batch', data=json.dumps({'jobs': []}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, msg='An empty batch must not be accepted')
+
+            mmv_specs = [{'job_type': 'MMV', 'params': {'standardise': 'true', 'dl__ignore_cache': 'false'}}]
+            response = self.client.post('/submit/batch', data=json.dumps({'jobs': mmv_specs}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, msg='The jobs that need input files must not be accepted')
+
+    def test_batch_submission_script_uses_one_ssh_session(self):
+        """
+        Test that the batch submission script submits all the jobs in one ssh session
+        """
+        template = job_submission_service.get_job_submission_template()
+        jobs_script_params = [{
+            'JOB_ID': f'TEST-{i}',
+            'LSF_USER': 'lsf_user',
+            'LSF_HOST': 'lsf_host',
+            'SSH_CONNECTION_OPTIONS': '',
+            'SET_DOCKER_REGISTRY_CREDENTIALS': '',
+            'RESOURCES_PARAMS': '',
+            'RUN_DIR': f'/jobs/TEST-{i}',
+            'DOCKER_IMAGE_URL': 'some_url',
+            'RUN_PARAMS_FILE': f'/jobs/TEST-{i}/run_params.yml'
+        } for i in range(3)]
+
+        batch_script = batch_submission_service.get_batch_submission_script(template, jobs_script_params)
+
+        self.assertEqual(1, batch_script.count('ssh '), msg='All the jobs must be submitted in one ssh session')
+        self.assertEqual(3, batch_script.count('bsub '), msg='There must be a bsub command for each job')
+        for params in jobs_script_params:
+            marker = f'{batch_submission_service.JOB_SUBMISSION_MARKER} {params["JOB_ID"]}'
+            self.assertIn(marker, batch_script, msg='The output of each job must be identified')
+            self.assertIn(params['RUN_PARAMS_FILE'], batch_script, msg='Each job must use its own params')
+
+    def test_lsf_job_ids_are_parsed_from_batch_output(self):
+        """
+        Test that the lsf job id of each job is read from the output of the batch submission script
+        """
+        marker = batch_submission_service.JOB_SUBMISSION_MARKER
+        sample_output = f'I am going to submit the job TEST-0 TEST-1 TEST-2\n' \
+                        f'{marker} TEST-0\n' \
+                        f'Job <2010993> is submitted to default queue <normal>.\n' \
+                        f'{marker} TEST-1\n' \
+                        f'Request aborted by esub. Job not submitted.\n' \
+                        f'{marker} TEST-2\n' \
+                        f'Job <2010995> is submitted to default queue <normal>.\n'
+
+        lsf_job_ids_got = batch_submission_service.get_lsf_job_ids_from_batch_output(sample_output)
+        lsf_job_ids_must_be = {'TEST-0': 2010993, 'TEST-2': 2010995}
+        self.assertEqual(lsf_job_ids_must_be, lsf_job_ids_got, msg='The lsf job ids were not parsed correctly')
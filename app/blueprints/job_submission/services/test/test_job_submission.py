@@ -1,6 +1,9 @@
 """
 This module tests jobs submission to the EBI queue
 """
+import datetime
+import hashlib
+import io
 import json
 import os
 import random
@@ -10,12 +13,16 @@ from pathlib import Path
 
 import jwt
 import yaml
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
 
 from app import create_app
 from app.authorisation import token_generator
 from app.config import RUN_CONFIG
+from app.db import DB
 from app.models import delayed_job_models
 from app.blueprints.job_submission.services import job_submission_service
+from app.job_status_daemon import maintenance
 
 
 class TestJobSubmitter(unittest.TestCase):
@@ -170,7 +177,7 @@ class TestJobSubmitter(unittest.TestCase):
             # Test Input Files
             # -----------------------------------------------
             job_input_files_desc_got = params_got.get('inputs')
-            for key, tmp_path in input_files_desc.items():
+            for key in input_files_desc:
                 run_path_must_be = job_input_files_desc_got[key]
                 self.assertTrue(os.path.isfile(run_path_must_be),
                                 msg=f'The input file for the job ({run_path_must_be}) has not been created!')
@@ -198,17 +205,14 @@ class TestJobSubmitter(unittest.TestCase):
                             msg=f'The output dir for the job ({output_dir_must_be}) has not been created!')
 
             # -----------------------------------------------
-            # Submission script file
+            # Submission script
             # -----------------------------------------------
-            submission_script_file_must_be = \
-                os.path.join(job_run_dir_must_be, job_submission_service.SUBMISSION_FILE_NAME)
+            self.assertFalse(os.path.isfile(os.path.join(job_run_dir_must_be, 'submit_job.sh')),
+                             msg='The submission script must not be written to the run dir!')
 
-            self.assertTrue(os.path.isfile(submission_script_file_must_be),
-                            msg=f'The script file for submitting the job ({submission_script_file_must_be}) '
-                                f'has not been created!')
-
-            self.assertTrue(os.access(submission_script_file_must_be, os.X_OK),
-                            msg=f'The script file for the job ({submission_script_file_must_be}) is not executable!')
+            job_submission_script_got = job_submission_service.prepare_job_submission_script(job_got)
+            self.assertIn(f'-J {job_id}', job_submission_script_got,
+                          msg='The submission script was not generated correctly!')
 
     def test_job_with_custom_config_can_be_submitted(self):
         """
@@ -240,6 +244,58 @@ class TestJobSubmitter(unittest.TestCase):
                 value_got = custom_config_got.get(key)
                 self.assertEqual(value_got, value_must_be, msg=f'{key} was not set up correctly!')
 
+    def test_job_submission_is_committed_in_two_transactions(self):
+        """
+        Tests that the creation of a job with its input files and its submission are committed in two transactions
+        """
+        with self.flask_app.app_context():
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            commits_done = []
+
+            def register_commit(*args):
+                commits_done.append(args)
+
+            event.listen(DB.session, 'after_commit', register_commit)
+            try:
+                job_submission_service.create_and_submit_job('TEST', input_files_desc, input_files_hashes, 'some_url',
+                                                             params)
+            finally:
+                event.remove(DB.session, 'after_commit', register_commit)
+
+            self.assertEqual(len(commits_done), 2, msg='The submission of the job must be committed only twice!')
+
+    def test_job_is_rolled_back_and_marked_as_failed_when_the_submission_fails(self):
+        """
+        Tests that when the submission to LSF fails, the changes of the submission are rolled back and the job is
+        marked as failed, so it is submitted again the next time
+        """
+        with self.flask_app.app_context():
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            original_submit_job_to_lsf = job_submission_service.submit_job_to_lsf
+
+            def fail_submission(job, job_submission_script):
+                raise job_submission_service.JobSubmissionError('LSF is not available')
+
+            job_submission_service.submit_job_to_lsf = fail_submission
+            try:
+                with self.assertRaises(job_submission_service.JobSubmissionError,
+                                       msg='The submission error must be raised!'):
+                    job_submission_service.submit_job('TEST', input_files_desc, input_files_hashes, 'some_url',
+                                                      params)
+            finally:
+                job_submission_service.submit_job_to_lsf = original_submit_job_to_lsf
+
+            job_id = delayed_job_models.generate_job_id('TEST', params, 'some_url', input_files_hashes)
+            job_got = delayed_job_models.get_job_by_id(job_id, force_refresh=True)
+            self.assertEqual(job_got.status, delayed_job_models.JobStatuses.ERROR, msg='The job must be failed!')
+            self.assertEqual(job_got.num_failures, 1, msg='The failure must be counted!')
+            self.assertIsNone(job_got.lsf_host, msg='The changes of the failed submission must be rolled back!')
+            self.assertEqual(len(job_got.input_files), 2, msg='The input files of the job must be kept!')
+
+            action_got = job_submission_service.get_action_for_existing_job(job_got, params)
+            self.assertEqual(action_got, job_submission_service.RESUBMIT_JOB,
+                             msg='The failed job must be submitted again!')
+
     def test_lsf_job_id_is_parsed_correctly_after_submission(self):
 
         lsf_id_must_be = 2010993
@@ -257,7 +313,7 @@ class TestJobSubmitter(unittest.TestCase):
             job_type = 'TEST'
             docker_image_url = 'some_url'
 
-            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            _, input_files_hashes, params = self.prepare_mock_job_args()
             job = delayed_job_models.get_or_create(job_type, params, docker_image_url, input_files_hashes)
 
             resources_params_got = job_submission_service.get_job_resources_params(job)
@@ -266,6 +322,17 @@ class TestJobSubmitter(unittest.TestCase):
             self.assertEqual(resources_params_got, resources_params_must_be,
                              msg='The resources params were not calculated correctly!')
 
+    def set_requirements_script_path(self, job_type, requirements_script_path):
+        """
+        Sets the requirements script of the job type given in the database and invalidates its cached config
+        :param job_type: type of the job
+        :param requirements_script_path: path of the requirements script
+        """
+        job_config = delayed_job_models.DefaultJobConfig.query.filter_by(job_type=job_type).first()
+        job_config.requirements_script_path = requirements_script_path
+        DB.session.commit()
+        delayed_job_models.invalidate_job_configs_cache(job_type)
+
     def test_gets_lsf_job_resources_params_correctly_when_script_returns_default(self):
         """
         Tests that if can get the parameters string for the bsub command correctly when script returns default
@@ -274,18 +341,16 @@ class TestJobSubmitter(unittest.TestCase):
             job_type = 'TEST'
             docker_image_url = 'some_url'
 
-            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            _, input_files_hashes, params = self.prepare_mock_job_args()
             job = delayed_job_models.get_or_create(job_type, params, docker_image_url, input_files_hashes)
             job_submission_service.create_job_run_dir(job)
 
-            test_job_config = delayed_job_models.get_job_config(job_type)
-
             source_requirements_script_path = 'requirements.py'
             with open(source_requirements_script_path, 'wt') as requirements_script:
                 requirements_script.write('#!/usr/bin/env python3\n')
                 requirements_script.write('print("DEFAULT")\n')
 
-            test_job_config.requirements_script_path = source_requirements_script_path
+            self.set_requirements_script_path(job_type, source_requirements_script_path)
 
             resources_params_got = job_submission_service.get_job_resources_params(job)
             resources_params_must_be = ''
@@ -308,12 +373,10 @@ class TestJobSubmitter(unittest.TestCase):
             job_type = 'TEST'
             docker_image_url = 'some_url'
 
-            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            _, input_files_hashes, params = self.prepare_mock_job_args()
             job = delayed_job_models.get_or_create(job_type, params, docker_image_url, input_files_hashes)
             job_submission_service.create_job_run_dir(job)
 
-            test_job_config = delayed_job_models.get_job_config(job_type)
-
             print('job.run_dir_path: ', job.run_dir_path)
             resources_params_must_be = '-n 2 -M 8192 -R "rusage[mem=8192]"'
             source_requirements_script_path = 'requirements.py'
@@ -321,7 +384,7 @@ class TestJobSubmitter(unittest.TestCase):
                 requirements_script.write('#!/usr/bin/env python3\n')
                 requirements_script.write(f'print(\'{resources_params_must_be}\')\n')
 
-            test_job_config.requirements_script_path = source_requirements_script_path
+            self.set_requirements_script_path(job_type, source_requirements_script_path)
 
             resources_params_got = job_submission_service.get_job_resources_params(job)
 
@@ -335,3 +398,248 @@ class TestJobSubmitter(unittest.TestCase):
                             msg='The requirements script was not created!')
 
             os.remove(source_requirements_script_path)
+
+    def test_input_files_are_saved_and_hashed_in_one_pass(self):
+        """
+        Tests that the uploaded input files are saved and their hashes are calculated while they are saved
+        """
+        with self.flask_app.app_context():
+            # make sure the file spans several chunks
+            file_contents = b'C1=CC=CC=C1\n' * job_submission_service.INPUT_FILES_CHUNK_SIZE
+            uploaded_file = FileStorage(stream=io.BytesIO(file_contents), filename='input1.smi')
+
+            input_files_desc, input_files_hashes = job_submission_service.get_job_input_files_desc(
+                {'input1': uploaded_file})
+
+            saved_path = input_files_desc['input1']
+            self.assertTrue(os.path.isfile(saved_path), msg='The input file was not saved!')
+
+            with open(saved_path, 'rb') as saved_file:
+                self.assertEqual(saved_file.read(), file_contents, msg='The input file was not saved correctly!')
+
+            hash_must_be = hashlib.sha256(file_contents).hexdigest()
+            self.assertEqual(input_files_hashes['input1'], hash_must_be,
+                             msg='The hash of the input file was not calculated correctly!')
+            self.assertEqual(job_submission_service.get_file_hash(saved_path), hash_must_be,
+                             msg='The hash of the saved file was not calculated correctly!')
+
+    def test_input_files_are_published_to_the_store_without_copying_them(self):
+        """
+        Tests that the staged input files are renamed into the input files store, not copied, that they are linked
+        from the run dir of the job, and that the staging directories are deleted
+        """
+        with self.flask_app.app_context():
+            job_type = 'TEST'
+            docker_image_url = 'some_url'
+            uploaded_file = FileStorage(stream=io.BytesIO(b'This is input file input1'), filename='input1.txt')
+
+            input_files_desc, input_files_hashes = job_submission_service.get_job_input_files_desc(
+                {'input1': uploaded_file})
+            staged_path = input_files_desc['input1']
+            staged_inode = os.stat(staged_path).st_ino
+
+            _, _, params = self.prepare_mock_job_args()
+            submission_result = job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes,
+                                                                  docker_image_url, params)
+
+            job = delayed_job_models.get_job_by_id(submission_result.get('job_id'))
+            store_path_got = job.input_files[0].internal_path
+            store_path_must_be = job_submission_service.get_input_file_store_path(input_files_hashes['input1'])
+            self.assertEqual(store_path_got, str(store_path_must_be),
+                             msg='The input file must be saved in the input files store!')
+            self.assertEqual(os.stat(store_path_got).st_ino, staged_inode,
+                             msg='The input file must be renamed into the input files store, not copied!')
+
+            input_run_path = Path(job_submission_service.get_job_input_files_dir(job)).joinpath('input1.txt')
+            self.assertTrue(os.path.samefile(input_run_path, store_path_got),
+                            msg='The input file in the run dir must be a link to the one in the store!')
+            self.assertFalse(os.path.exists(Path(staged_path).parent),
+                             msg='The staging directory of the input file was not deleted!')
+
+    def submit_job_with_input_contents(self, file_contents, params):
+        """
+        Submits a test job with one input file with the contents given
+        :param file_contents: bytes of the input file
+        :param params: parameters of the job
+        :return: the job that was submitted
+        """
+        uploaded_file = FileStorage(stream=io.BytesIO(file_contents), filename='input1.txt')
+        input_files_desc, input_files_hashes = job_submission_service.get_job_input_files_desc(
+            {'input1': uploaded_file})
+        submission_result = job_submission_service.submit_job('TEST', input_files_desc, input_files_hashes,
+                                                              'some_url', params)
+        return delayed_job_models.get_job_by_id(submission_result.get('job_id'))
+
+    def test_input_files_are_shared_between_jobs_and_deleted_after_the_last_one(self):
+        """
+        Tests that two jobs with the same input file share the copy in the input files store, and that the file is only
+        deleted from the store by the maintenance task after the last job that uses it is deleted
+        """
+        with self.flask_app.app_context():
+            _, _, params = self.prepare_mock_job_args()
+            file_contents = b'This is an input file used by several jobs'
+
+            job_1 = self.submit_job_with_input_contents(file_contents, {**params, 'seconds': 1})
+            job_2 = self.submit_job_with_input_contents(file_contents, {**params, 'seconds': 2})
+            self.assertNotEqual(job_1.id, job_2.id, msg='The jobs must be different!')
+
+            store_path = job_1.input_files[0].internal_path
+            self.assertEqual(store_path, job_2.input_files[0].internal_path,
+                             msg='The jobs with the same input file must share the same file in the store!')
+
+            expired_time = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            job_1.expires_at = expired_time
+            delayed_job_models.save_job(job_1)
+            delayed_job_models.delete_all_expired_jobs()
+            maintenance.delete_unreferenced_input_files({'max_age_seconds': 0})
+            self.assertTrue(os.path.isfile(store_path),
+                            msg='The input file was deleted from the store while another job still uses it!')
+
+            job_2.expires_at = expired_time
+            delayed_job_models.save_job(job_2)
+            delayed_job_models.delete_all_expired_jobs()
+            self.assertTrue(os.path.isfile(store_path),
+                            msg='The input file must only be deleted from the store by the maintenance task!')
+            maintenance.delete_unreferenced_input_files({'max_age_seconds': 0})
+            self.assertFalse(os.path.exists(store_path),
+                             msg='The input file was not deleted from the store after its last job was deleted!')
+
+    def test_cache_hits_do_not_write_the_input_files(self):
+        """
+        Tests that when a job is already in the cache, the uploaded input files are not written to disk, and that no
+        temporary files are left behind
+        """
+        with self.flask_app.app_context():
+            _, _, params = self.prepare_mock_job_args()
+            file_contents = b'This is an input file of a popular job'
+
+            def submit_job_with_upload():
+                uploaded_file = FileStorage(stream=io.BytesIO(file_contents), filename='input1.txt')
+                return job_submission_service.parse_args_and_submit_job('TEST', params, {'input1': uploaded_file})
+
+            job_id = submit_job_with_upload().get('job_id')
+            store_path = delayed_job_models.get_job_by_id(job_id).input_files[0].internal_path
+            store_file_stats_before = os.stat(store_path)
+
+            cached_job_id = submit_job_with_upload().get('job_id')
+            self.assertEqual(job_id, cached_job_id, msg='The job must have been taken from the cache!')
+
+            store_file_stats_after = os.stat(store_path)
+            self.assertEqual(store_file_stats_before.st_ino, store_file_stats_after.st_ino,
+                             msg='The input file must not be written again on a cache hit!')
+            self.assertEqual(store_file_stats_before.st_mtime, store_file_stats_after.st_mtime,
+                             msg='The input file must not be written again on a cache hit!')
+            self.assertEqual(os.listdir(job_submission_service.JOBS_STAGING_DIR), [],
+                             msg='Some temporary files were left in the staging dir!')
+
+    def test_staged_input_files_are_deleted_on_cache_hits(self):
+        """
+        Tests that when the input files were staged and the job is already in the cache, the staging directories are
+        deleted
+        """
+        with self.flask_app.app_context():
+            job_type = 'TEST'
+            docker_image_url = 'some_url'
+
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url, params)
+
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes, docker_image_url, params)
+
+            for staged_path in input_files_desc.values():
+                self.assertFalse(os.path.exists(Path(staged_path).parent),
+                                 msg='The staging directory of an input file was left behind on a cache hit!')
+
+    def test_a_job_created_at_the_same_time_by_another_worker_is_not_prepared_again(self):
+        """
+        Tests that when another worker created the same job at the same time, the submission returns the job without
+        preparing its run folder and discards the staged input files
+        """
+        with self.flask_app.app_context():
+            job_type = 'TEST'
+            docker_image_url = 'some_url'
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+
+            # The other worker inserted the job, but it has not prepared it yet
+            job_of_other_worker, _ = delayed_job_models.create_job_if_not_exists(job_type, params, docker_image_url,
+                                                                                 input_files_hashes)
+
+            job_got = job_submission_service.create_and_submit_job(job_type, input_files_desc, input_files_hashes,
+                                                                   docker_image_url, params)
+
+            self.assertEqual(job_got.id, job_of_other_worker.id, msg='The existing job must be returned!')
+            self.assertFalse(os.path.exists(job_submission_service.get_job_run_dir(job_got)),
+                             msg='The run folder of the job must be prepared only by the worker that created it!')
+            self.assertEqual(len(job_got.input_files), 0, msg='The input files must not be added again!')
+            for staged_path in input_files_desc.values():
+                self.assertFalse(os.path.exists(Path(staged_path).parent),
+                                 msg='The staged input files must be discarded!')
+
+    def test_a_failed_job_is_submitted_again_only_by_the_worker_that_claims_it(self):
+        """
+        Tests that when a failed job was already claimed to be submitted again by another worker, the submission
+        returns its id without submitting it
+        """
+        with self.flask_app.app_context():
+            job_type = 'TEST'
+            docker_image_url = 'some_url'
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            job_id = job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes,
+                                                       docker_image_url, params).get('job_id')
+
+            job = delayed_job_models.get_job_by_id(job_id)
+            job.status = delayed_job_models.JobStatuses.ERROR
+            job.num_failures = 1
+            delayed_job_models.save_job(job)
+
+            original_claim = delayed_job_models.claim_job_for_resubmission
+            original_create_and_submit_job = job_submission_service.create_and_submit_job
+            jobs_submitted = []
+
+            def claim_before_other_worker(job_to_claim):
+                delayed_job_models.DelayedJob.query.filter_by(id=job_to_claim.id).update(
+                    {delayed_job_models.DelayedJob.status: delayed_job_models.JobStatuses.CREATED},
+                    synchronize_session=False)
+                return original_claim(job_to_claim)
+
+            delayed_job_models.claim_job_for_resubmission = claim_before_other_worker
+            job_submission_service.create_and_submit_job = lambda *args, **kwargs: jobs_submitted.append(args)
+            try:
+                input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+                response_got = job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes,
+                                                                 docker_image_url, params)
+            finally:
+                delayed_job_models.claim_job_for_resubmission = original_claim
+                job_submission_service.create_and_submit_job = original_create_and_submit_job
+
+            self.assertEqual(response_got.get('job_id'), job_id, msg='The id of the job must be returned!')
+            self.assertEqual(jobs_submitted, [], msg='The job must be submitted only by the worker that claims it!')
+
+    def test_an_expired_job_that_was_not_deleted_yet_is_replaced_when_submitted_again(self):
+        """
+        Tests that when a job expired but the status daemons have not deleted it yet, submitting it again replaces
+        it with a new job
+        """
+        with self.flask_app.app_context():
+            job_type = 'TEST'
+            docker_image_url = 'some_url'
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            job_id = job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes,
+                                                       docker_image_url, params).get('job_id')
+
+            job = delayed_job_models.get_job_by_id(job_id)
+            job.status = delayed_job_models.JobStatuses.FINISHED
+            job.expires_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            delayed_job_models.save_job(job)
+
+            input_files_desc, input_files_hashes, params = self.prepare_mock_job_args()
+            response_got = job_submission_service.submit_job(job_type, input_files_desc, input_files_hashes,
+                                                             docker_image_url, params)
+            self.assertEqual(response_got.get('job_id'), job_id, msg='The job must have the same id!')
+
+            job_got = delayed_job_models.get_job_by_id(job_id, force_refresh=True)
+            self.assertEqual(job_got.status, delayed_job_models.JobStatuses.CREATED,
+                             msg='The expired job must have been replaced by a new one!')
+            self.assertEqual(len(job_got.input_files), len(input_files_desc),
+                             msg='The input files of the new job must be saved!')
@@ -0,0 +1,204 @@
+"""
+This Module tests the calculation of the resources required by the jobs
+"""
+import json
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from app import create_app
+from app.db import DB
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import requirements_calculation_service
+
+PLUGIN_RESOURCES_PARAMS = '-n 4 -M 4096 -R "rusage[mem=4096]"'
+PLUGIN_CALLS = []
+
+
+def calculate_test_requirements(run_params_path):
+    """
+    Requirements plugin used in the tests
+    :param run_params_path: path of the run params file of the job
+    :return: the resources params for the job
+    """
+    PLUGIN_CALLS.append(run_params_path)
+    return PLUGIN_RESOURCES_PARAMS
+
+
+class TestRequirementsCalculation(unittest.TestCase):
+    """
+    Class to test the calculation of the resources required by the jobs
+    """
+    SOURCE_REQUIREMENTS_SCRIPT_PATH = 'requirements.py'
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        self.plugins_were = dict(requirements_calculation_service.PLUGINS)
+        self.key_params_were = dict(requirements_calculation_service.KEY_PARAMS)
+        PLUGIN_CALLS.clear()
+
+    def tearDown(self):
+        requirements_calculation_service.PLUGINS.clear()
+        requirements_calculation_service.PLUGINS.update(self.plugins_were)
+        requirements_calculation_service.KEY_PARAMS.clear()
+        requirements_calculation_service.KEY_PARAMS.update(self.key_params_were)
+
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+
+        shutil.rmtree(job_submission_service.JOBS_RUN_DIR, ignore_errors=True)
+        if os.path.isfile(self.SOURCE_REQUIREMENTS_SCRIPT_PATH):
+            os.remove(self.SOURCE_REQUIREMENTS_SCRIPT_PATH)
+
+    def create_test_job(self, seconds=1):
+        """
+        Creates a test job with its run folder prepared
+        :param seconds: parameter of the job, jobs with different values have different requirements keys
+        :return: the job created
+        """
+        params = {
+            'instruction': 'RUN_NORMALLY',
+            'seconds': seconds,
+            'api_url': 'https://www.ebi.ac.uk/chembl/api/data/similarity/CCCC/80.json'
+        }
+        job = delayed_job_models.get_or_create('TEST', params, 'some_url')
+        job_submission_service.prepare_run_folder(job, {}, {})
+        return job
+
+    def set_requirements_script(self, resources_params):
+        """
+        Creates a requirements script for the TEST jobs that prints the params given
+        :param resources_params: text that the script prints
+        """
+        with open(self.SOURCE_REQUIREMENTS_SCRIPT_PATH, 'wt') as requirements_script:
+            requirements_script.write('#!/usr/bin/env python3\n')
+            requirements_script.write(f'print(\'{resources_params}\')\n')
+
+        job_config = delayed_job_models.DefaultJobConfig.query.filter_by(job_type='TEST').first()
+        job_config.requirements_script_path = self.SOURCE_REQUIREMENTS_SCRIPT_PATH
+        DB.session.commit()
+        delayed_job_models.invalidate_job_configs_cache('TEST')
+
+    def test_script_result_is_reused_for_jobs_with_the_same_key(self):
+        """
+        Tests that the requirements script runs only once for the same job type, parameters and input sizes
+        """
+        with self.flask_app.app_context():
+            resources_params_must_be = '-n 2 -M 8192 -R "rusage[mem=8192]"'
+            self.set_requirements_script(resources_params_must_be)
+            job = self.create_test_job()
+
+            resources_params_got = job_submission_service.get_job_resources_params(job)
+            self.assertEqual(resources_params_got, resources_params_must_be,
+                             msg='The resources params were not calculated correctly!')
+
+            job_requirements_script_path = Path(job.run_dir_path).joinpath(
+                requirements_calculation_service.REQUIREMENTS_SCRIPT_FILENAME)
+            os.remove(job_requirements_script_path)
+
+            resources_params_got = job_submission_service.get_job_resources_params(job)
+            self.assertEqual(resources_params_got, resources_params_must_be,
+                             msg='The cached resources params were not returned correctly!')
+            self.assertFalse(os.path.isfile(job_requirements_script_path),
+                             msg='The requirements script must not run again for the same key!')
+
+            stats_got = requirements_calculation_service.get_cache_stats()
+            self.assertEqual(stats_got['hits'], 1, msg='The hits were not counted correctly!')
+            self.assertEqual(stats_got['misses'], 1, msg='The misses were not counted correctly!')
+
+    def test_script_runs_again_for_different_params(self):
+        """
+        Tests that the requirements script runs again for jobs with different parameters
+        """
+        with self.flask_app.app_context():
+            self.set_requirements_script('DEFAULT')
+            job_submission_service.get_job_resources_params(self.create_test_job(seconds=1))
+            job_submission_service.get_job_resources_params(self.create_test_job(seconds=2))
+
+            stats_got = requirements_calculation_service.get_cache_stats()
+            self.assertEqual(stats_got['misses'], 2, msg='Jobs with different params must have different keys!')
+
+    def test_jobs_that_differ_in_params_not_used_share_the_result(self):
+        """
+        Tests that jobs with different ids share the result when they only differ in params that the calculation does
+        not use
+        """
+        with self.flask_app.app_context():
+            requirements_calculation_service.KEY_PARAMS['TEST'] = ['instruction']
+            self.set_requirements_script('DEFAULT')
+            job_1 = self.create_test_job(seconds=1)
+            job_2 = self.create_test_job(seconds=2)
+            self.assertNotEqual(job_1.id, job_2.id, msg='The jobs must be different!')
+
+            job_submission_service.get_job_resources_params(job_1)
+            job_submission_service.get_job_resources_params(job_2)
+
+            stats_got = requirements_calculation_service.get_cache_stats()
+            self.assertEqual(stats_got['misses'], 1, msg='The calculation must run only for the first job!')
+            self.assertEqual(stats_got['hits'], 1, msg='The second job must use the result of the first one!')
+
+    def test_system_params_are_not_part_of_the_key(self):
+        """
+        Tests that the dl__* params are not used to build the key of the calculation
+        """
+        with self.flask_app.app_context():
+            job = self.create_test_job()
+            key_params_got = requirements_calculation_service.get_key_params(job)
+            job.raw_params = json.dumps({**key_params_got, 'dl__ignore_cache': True})
+            self.assertEqual(requirements_calculation_service.get_key_params(job), key_params_got,
+                             msg='The dl__* params must not be part of the key!')
+
+    def test_least_recently_used_results_are_evicted(self):
+        """
+        Tests that when the cache is full, the least recently used result is evicted
+        """
+        requirements_calculation_service.save_requirements_in_cache('key1', 'params1')
+        requirements_calculation_service.save_requirements_in_cache('key2', 'params2')
+        requirements_calculation_service.get_cached_requirements('key1')
+
+        max_size_was = requirements_calculation_service.CACHE_MAX_SIZE
+        requirements_calculation_service.CACHE_MAX_SIZE = 2
+        try:
+            requirements_calculation_service.save_requirements_in_cache('key3', 'params3')
+        finally:
+            requirements_calculation_service.CACHE_MAX_SIZE = max_size_was
+
+        self.assertIsNone(requirements_calculation_service.get_cached_requirements('key2'),
+                          msg='The least recently used result must be evicted!')
+        self.assertEqual(requirements_calculation_service.get_cached_requirements('key1'), 'params1',
+                         msg='The recently used result must be kept!')
+
+    def test_requirements_can_be_calculated_by_a_plugin(self):
+        """
+        Tests that the requirements can be calculated by a function in the same process instead of a script
+        """
+        with self.flask_app.app_context():
+            requirements_calculation_service.PLUGINS['TEST'] = f'{__name__}:calculate_test_requirements'
+            job = self.create_test_job()
+
+            resources_params_got = job_submission_service.get_job_resources_params(job)
+            self.assertEqual(resources_params_got, PLUGIN_RESOURCES_PARAMS,
+                             msg='The resources params were not calculated by the plugin!')
+            self.assertEqual(PLUGIN_CALLS, [job_submission_service.get_job_run_params_file_path(job)],
+                             msg='The plugin must receive the run params file of the job!')
+
+            job_submission_service.get_job_resources_params(job)
+            self.assertEqual(len(PLUGIN_CALLS), 1, msg='The result of the plugin must be reused!')
+
+    def test_fails_when_the_plugin_can_not_be_loaded(self):
+        """
+        Tests that a plugin that does not exist produces an error
+        """
+        with self.flask_app.app_context():
+            requirements_calculation_service.PLUGINS['TEST'] = f'{__name__}:function_that_does_not_exist'
+            job = self.create_test_job()
+
+            with self.assertRaises(requirements_calculation_service.RequirementsCalculationError,
+                                   msg='A plugin that does not exist must produce an error!') as raised:
+                job_submission_service.get_job_resources_params(job)
+
+            self.assertIsInstance(raised.exception.__cause__, AttributeError,
+                                  msg='The error of the plugin must be kept as the cause!')
@@ -0,0 +1,108 @@
+"""
+This Module tests the coalescing of the calls done at the same time with the same key
+"""
+import threading
+import time
+import unittest
+
+from app.blueprints.job_submission.services import single_flight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Class to test the coalescing of the calls done at the same time with the same key
+    """
+
+    def wait_until_waiting(self, key, num_waiting):
+        """
+        Waits until the number of calls given are waiting for the call with the key given
+        :param key: key of the call
+        :param num_waiting: number of calls that must be waiting
+        """
+        for _ in range(500):
+            if single_flight.get_num_waiting(key) == num_waiting:
+                return
+            time.sleep(0.01)
+        self.fail(f'There are not {num_waiting} calls waiting for {key}!')
+
+    def run_in_thread(self, key, func, results):
+        """
+        Runs the function in a thread with the key given, the results are added to the list given
+        :return: the thread started
+        """
+        thread = threading.Thread(target=lambda: results.append(single_flight.run(key, func)))
+        thread.start()
+        return thread
+
+    def test_calls_with_the_same_key_run_only_once(self):
+        """
+        Tests that the calls done while a call with the same key is running get its result without running again
+        """
+        can_finish = threading.Event()
+        calls_done = []
+
+        def submit():
+            calls_done.append(1)
+            can_finish.wait(5)
+            return {'job_id': 'some_job'}
+
+        results = []
+        threads = [self.run_in_thread('some_job', submit, results)]
+        while not calls_done:
+            time.sleep(0.01)
+        threads += [self.run_in_thread('some_job', submit, results) for _ in range(3)]
+        self.wait_until_waiting('some_job', 3)
+        can_finish.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls_done), 1, msg='The function must run only once!')
+        self.assertEqual(sorted(was_coalesced for _, was_coalesced in results), [False, True, True, True],
+                         msg='The other calls must be coalesced!')
+        for result, _ in results:
+            self.assertEqual(result, {'job_id': 'some_job'}, msg='All the calls must get the same result!')
+
+    def test_the_error_is_raised_to_all_the_calls(self):
+        """
+        Tests that if the call that runs fails, the error is raised to the calls that were waiting for it
+        """
+        can_finish = threading.Event()
+        errors_got = []
+
+        def fail():
+            can_finish.wait(5)
+            raise RuntimeError('The submission failed')
+
+        def run_and_save_error():
+            try:
+                single_flight.run('failing_job', fail)
+            except RuntimeError as error:
+                errors_got.append(error)
+
+        threads = [threading.Thread(target=run_and_save_error) for _ in range(2)]
+        threads[0].start()
+        while 'failing_job' not in single_flight.CALLS_IN_FLIGHT:
+            time.sleep(0.01)
+        threads[1].start()
+        self.wait_until_waiting('failing_job', 1)
+        can_finish.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors_got), 2, msg='The error must be raised to all the calls!')
+        self.assertNotIn('failing_job', single_flight.CALLS_IN_FLIGHT, msg='The call must be removed when it fails!')
+
+    def test_calls_after_the_first_one_finishes_run_again(self):
+        """
+        Tests that the calls done after the call with the same key finished run the function again
+        """
+        calls_done = []
+        single_flight.run('some_job', lambda: calls_done.append(1))
+        _, was_coalesced = single_flight.run('some_job', lambda: calls_done.append(1))
+
+        self.assertEqual(len(calls_done), 2, msg='The function must run again after the first call finished!')
+        self.assertFalse(was_coalesced, msg='The call must not be coalesced!')
+
+
+if __name__ == '__main__':
+    unittest.main()
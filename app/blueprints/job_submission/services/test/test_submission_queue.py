@@ -0,0 +1,179 @@
+"""
+This Module tests the submission of the jobs to LSF in the submission queue
+"""
+import datetime
+import os
+import shutil
+import unittest
+
+from app import create_app
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import batch_submission_service
+from app.blueprints.job_submission.services import submission_queue
+
+
+class TestSubmissionQueue(unittest.TestCase):
+    """
+    Class to test the submission queue
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        self.queue_was_enabled = submission_queue.QUEUE_ENABLED
+        submission_queue.QUEUE_ENABLED = True
+
+    def tearDown(self):
+
+        submission_queue.shutdown(wait=True)
+        submission_queue.QUEUE_ENABLED = self.queue_was_enabled
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+            for dir_path in [job_submission_service.JOBS_RUN_DIR, job_submission_service.JOBS_TMP_DIR,
+                             job_submission_service.JOBS_OUTPUT_DIR]:
+                shutil.rmtree(dir_path, ignore_errors=True)
+
+    @staticmethod
+    def get_test_job_params():
+        """
+        :return: the params of a test job
+        """
+        return {
+            'instruction': 'RUN_NORMALLY',
+            'seconds': 1,
+            'api_url': 'https://www.ebi.ac.uk/chembl/api/data/similarity/CCCC/80.json'
+        }
+
+    def test_job_is_submitted_by_the_queue(self):
+        """
+        Tests that when the queue is enabled, the request creates the job and prepares its run folder, and the queue
+        submits it
+        """
+        with self.flask_app.app_context():
+            submission_result = job_submission_service.submit_job('TEST', {}, {}, 'some_url',
+                                                                  self.get_test_job_params())
+            job = delayed_job_models.get_job_by_id(submission_result['job_id'])
+            self.assertEqual(job.status, delayed_job_models.JobStatuses.CREATED,
+                             msg='The job must be created when the request finishes')
+            self.assertTrue(os.path.isfile(job_submission_service.get_job_run_params_file_path(job)),
+                            msg='The run folder must be prepared in the request')
+
+            submission_queue.shutdown(wait=True)
+            job = delayed_job_models.get_job_by_id(job.id, force_refresh=True)
+            self.assertEqual(job.lsf_host, RUN_CONFIG.get('lsf_submission')['lsf_host'],
+                             msg='The job must be submitted by the queue')
+
+    def test_batch_is_submitted_by_the_queue(self):
+        """
+        Tests that when the queue is enabled, the batch request creates the jobs and prepares their run folders, and the
+        queue submits them
+        """
+        with self.flask_app.app_context():
+            job_specs = [{'job_type': 'TEST', 'params': {**self.get_test_job_params(), 'seconds': str(i + 1)}}
+                         for i in range(2)]
+            response = batch_submission_service.submit_jobs_batch(job_specs)
+            for job_response in response:
+                job = delayed_job_models.get_job_by_id(job_response['job_id'])
+                self.assertEqual(job.status, delayed_job_models.JobStatuses.CREATED,
+                                 msg='The jobs must be created when the request finishes')
+                self.assertTrue(os.path.isfile(job_submission_service.get_job_run_params_file_path(job)),
+                                msg='The run folders must be prepared in the request')
+
+            submission_queue.shutdown(wait=True)
+            for job_response in response:
+                job = delayed_job_models.get_job_by_id(job_response['job_id'], force_refresh=True)
+                self.assertEqual(job.lsf_host, RUN_CONFIG.get('lsf_submission')['lsf_host'],
+                                 msg='The jobs must be submitted by the queue')
+
+    def test_job_is_marked_as_failed_when_the_queue_can_not_submit_it(self):
+        """
+        Tests that if the submission in the queue fails, the job is marked as failed
+        """
+        with self.flask_app.app_context():
+            original_submit_job_to_lsf = job_submission_service.submit_job_to_lsf
+
+            def fail_submission(job, job_submission_script):
+                raise job_submission_service.JobSubmissionError('LSF is not available')
+
+            job_submission_service.submit_job_to_lsf = fail_submission
+            try:
+                submission_result = job_submission_service.submit_job('TEST', {}, {}, 'some_url',
+                                                                      self.get_test_job_params())
+                submission_queue.shutdown(wait=True)
+            finally:
+                job_submission_service.submit_job_to_lsf = original_submit_job_to_lsf
+
+            job = delayed_job_models.get_job_by_id(submission_result['job_id'], force_refresh=True)
+            self.assertEqual(job.status, delayed_job_models.JobStatuses.ERROR,
+                             msg='The job must be marked as failed')
+            self.assertEqual(job.num_failures, 1, msg='The failure must be counted')
+
+    def test_unsubmitted_jobs_are_recovered(self):
+        """
+        Tests that the jobs that were created but not submitted are added again to the queue, and that the ones that
+        lost their run folder are marked as failed
+        """
+        with self.flask_app.app_context():
+            params = self.get_test_job_params()
+            job_to_recover = delayed_job_models.get_or_create('TEST', params, 'some_url')
+            job_submission_service.prepare_run_folder(job_to_recover, {}, {})
+            job_without_run_folder = delayed_job_models.get_or_create('TEST', {**params, 'seconds': 2}, 'some_url')
+
+            long_ago = datetime.datetime.utcnow() - datetime.timedelta(
+                seconds=submission_queue.RECOVERY_MIN_AGE_SECONDS + 1)
+            for job in [job_to_recover, job_without_run_folder]:
+                job.created_at = long_ago
+                delayed_job_models.save_job(job)
+
+            num_recovered = job_submission_service.recover_unsubmitted_jobs()
+            submission_queue.shutdown(wait=True)
+
+            self.assertEqual(num_recovered, 1, msg='Only the job with a run folder can be recovered')
+            job_to_recover = delayed_job_models.get_job_by_id(job_to_recover.id, force_refresh=True)
+            self.assertEqual(job_to_recover.lsf_host, RUN_CONFIG.get('lsf_submission')['lsf_host'],
+                             msg='The recovered job must be submitted')
+
+            job_without_run_folder = delayed_job_models.get_job_by_id(job_without_run_folder.id, force_refresh=True)
+            self.assertEqual(job_without_run_folder.status, delayed_job_models.JobStatuses.ERROR,
+                             msg='The job without a run folder must be marked as failed')
+
+    def test_each_unsubmitted_job_is_recovered_by_only_one_process(self):
+        """
+        Tests that when several processes recover the jobs at the same time, each job is claimed by only one of them
+        """
+        with self.flask_app.app_context():
+            job_to_recover = delayed_job_models.get_or_create('TEST', self.get_test_job_params(), 'some_url')
+            job_submission_service.prepare_run_folder(job_to_recover, {}, {})
+            job_to_recover.created_at = datetime.datetime.utcnow() - datetime.timedelta(
+                seconds=submission_queue.RECOVERY_MIN_AGE_SECONDS + 1)
+            delayed_job_models.save_job(job_to_recover)
+
+            created_before = datetime.datetime.utcnow() - datetime.timedelta(
+                seconds=submission_queue.RECOVERY_MIN_AGE_SECONDS)
+            self.assertTrue(delayed_job_models.claim_job_for_recovery(job_to_recover.id, created_before),
+                            msg='The first process must claim the job')
+            self.assertFalse(delayed_job_models.claim_job_for_recovery(job_to_recover.id, created_before),
+                             msg='The job must not be claimed again by another process')
+            self.assertEqual(job_submission_service.recover_unsubmitted_jobs(), 0,
+                             msg='A job claimed by another process must not be recovered again')
+
+    def test_jobs_claimed_for_resubmission_are_not_taken_as_unsubmitted(self):
+        """
+        Tests that the jobs that were just claimed to be submitted again are not recovered while they are submitted
+        """
+        with self.flask_app.app_context():
+            failed_job = delayed_job_models.get_or_create('TEST', self.get_test_job_params(), 'some_url')
+            failed_job.created_at = datetime.datetime.utcnow() - datetime.timedelta(
+                seconds=submission_queue.RECOVERY_MIN_AGE_SECONDS + 1)
+            failed_job.status = delayed_job_models.JobStatuses.ERROR
+            failed_job.num_failures = 1
+            delayed_job_models.save_job(failed_job)
+
+            self.assertTrue(delayed_job_models.claim_job_for_resubmission(failed_job),
+                            msg='The failed job must be claimed to be submitted again')
+            created_before = datetime.datetime.utcnow() - datetime.timedelta(
+                seconds=submission_queue.RECOVERY_MIN_AGE_SECONDS)
+            jobs_pending_got = delayed_job_models.get_jobs_pending_submission(created_before)
+            self.assertEqual(jobs_pending_got, [], msg='The jobs just claimed must not be taken as unsubmitted')
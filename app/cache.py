@@ -6,3 +6,13 @@ from flask_caching import Cache
 from app.config import RUN_CONFIG
 
 CACHE = Cache(config=RUN_CONFIG['cache_config'])
+
+SHARED_CACHE_TYPES = ['redis', 'memcached']
+
+
+def app_cache_is_shared():
+    """
+    :return: True if the app cache is shared by all the processes (redis or memcached), False otherwise
+    """
+    cache_type = str(RUN_CONFIG.get('cache_config', {}).get('CACHE_TYPE', '')).lower()
+    return any(shared_type in cache_type for shared_type in SHARED_CACHE_TYPES)
@@ -105,6 +105,8 @@ DEFAULT_RATE_LIMIT = {
         'default_for_all_routes': '3 per second',
         'admin_login': '3 per second',
         'job_submission': '10 per minute',
+        # Each request to /status/bulk reads the statuses of up to 100 jobs
+        'bulk_job_status': '1 per second',
     },
     'storage_url': 'memory://'
 
@@ -112,6 +114,11 @@ DEFAULT_RATE_LIMIT = {
 RUN_CONFIG['rate_limit'] = {
     **DEFAULT_RATE_LIMIT,
     **RATE_LIMIT_CONFIG,
+    # The rates that are not in the configuration keep their default value
+    'rates': {
+        **DEFAULT_RATE_LIMIT['rates'],
+        **RATE_LIMIT_CONFIG.get('rates', {}),
+    },
 }
 
 if RUN_CONFIG.get('job_expiration_days') is None:
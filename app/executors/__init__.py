@@ -0,0 +1,43 @@
+"""
+Package with the backends that run the jobs. Each backend is a module that implements the following functions:
+- get_host(): identifier of the place where the jobs run, it is saved in the lsf_host of the jobs.
+- submit_job(job): runs a job for which the run folder is prepared. Saves its lsf_job_id, lsf_host and status.
+- get_jobs_records(lsf_job_ids): returns the status of the jobs given as a list of dicts like the RECORDS of the output
+of bjobs -json -o "id stat start_time finish_time". Returns None if the status could not be checked.
+- cancel_jobs(lsf_job_ids): stops the jobs given.
+The backends use the services that submit and check the jobs, and those services get the backend from this package, so
+this package does not import the backends. They are registered by the app when it is created (see register_backend).
+"""
+from app.config import RUN_CONFIG
+
+LSF_EXECUTOR = 'lsf'
+LOCAL_EXECUTOR = 'local'
+EXECUTOR_TYPE = RUN_CONFIG.get('executor', {}).get('type', LSF_EXECUTOR)
+
+
+# The modules of the backends, by executor type
+BACKENDS = {}
+
+
+class ExecutorError(Exception):
+    """Base class for exceptions in this module."""
+
+
+def register_backend(executor_type, backend):
+    """
+    Registers the module of a backend, so it is used when it is the executor type set in the configuration
+    :param executor_type: type of the executor (LSF_EXECUTOR or LOCAL_EXECUTOR)
+    :param backend: module that implements the functions of the backends
+    """
+    BACKENDS[executor_type] = backend
+
+
+def get_executor():
+    """
+    :return: the module of the backend set in the configuration
+    """
+    backend = BACKENDS.get(EXECUTOR_TYPE)
+    if backend is None:
+        raise ExecutorError(f'executor.type must be one of {sorted(BACKENDS.keys())}, got {EXECUTOR_TYPE}')
+
+    return backend
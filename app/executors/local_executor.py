@@ -0,0 +1,207 @@
+"""
+Backend that runs the jobs as subprocesses in the same machine as the server. It is useful to run the whole system
+without a cluster, for example for load tests, and for jobs that are too small to be sent to LSF. The daemon that
+checks the status of the jobs must run in the same machine.
+The lsf id of the jobs is the pid of the process that runs them. The pids are reused, so the jobs are looked up by it
+only among the jobs of this host that are still being checked. When a job finishes, its exit code is saved in a file
+in its run dir.
+"""
+import os
+import shlex
+import signal
+import subprocess
+from pathlib import Path
+
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+import app.app_logging as app_logging
+
+LOCAL_EXECUTOR_CONFIG = RUN_CONFIG.get('executor', {}).get('local', {})
+HOST_NAME = LOCAL_EXECUTOR_CONFIG.get('host_name', 'localhost')
+# Command that runs the job, it can use the same placeholders as the job submission template
+COMMAND_TEMPLATE = LOCAL_EXECUTOR_CONFIG.get('command_template',
+                                             'singularity exec {DOCKER_IMAGE_URL} /app/run_job.sh {RUN_PARAMS_FILE}')
+EXIT_CODE_FILE_NAME = 'local_job.exit_code'
+
+# Processes started by this server, they are kept to collect their exit status so they do not stay as zombies
+RUNNING_PROCESSES = []
+
+
+def get_host():
+    """
+    :return: the name that identifies the machine where the jobs run
+    """
+    return HOST_NAME
+
+
+def get_exit_code_file_path(job):
+    """
+    :param job: job object for which to get the path
+    :return: the path of the file where the exit code of the job is saved
+    """
+    return Path(job_submission_service.get_job_run_dir(job)).joinpath(EXIT_CODE_FILE_NAME)
+
+
+def get_job_command(job):
+    """
+    :param job: job object for which to get the command
+    :return: the command that runs the job, with its output redirected to the run dir and that saves its exit code
+    when it finishes
+    """
+    run_dir = job_submission_service.get_job_run_dir(job)
+    command = COMMAND_TEMPLATE.format(
+        JOB_ID=job.id,
+        RUN_DIR=run_dir,
+        DOCKER_IMAGE_URL=job.docker_image_url,
+        RUN_PARAMS_FILE=job_submission_service.get_job_run_params_file_path(job)
+    )
+    job_out_path = shlex.quote(str(Path(run_dir).joinpath('job_run.out')))
+    job_err_path = shlex.quote(str(Path(run_dir).joinpath('job_run.err')))
+    exit_code_path = shlex.quote(str(get_exit_code_file_path(job)))
+    # The exit code is written to a temporary file and renamed, so the daemon never reads an incomplete file
+    return f'{command} > {job_out_path} 2> {job_err_path}; ' \
+           f'echo $? > {exit_code_path}.tmp && mv {exit_code_path}.tmp {exit_code_path}'
+
+
+def collect_finished_processes():
+    """
+    Collects the exit status of the processes that finished, so they do not stay as zombies
+    """
+    RUNNING_PROCESSES[:] = [process for process in RUNNING_PROCESSES if process.poll() is None]
+
+
+def submit_job(job):
+    """
+    Starts the process that runs the job
+    :param job: job object to run, its run folder must be prepared
+    """
+    job_command = get_job_command(job)
+    app_logging.debug(f'Going to run job {job.id} locally, command: {job_command}')
+
+    must_run_jobs = RUN_CONFIG.get('run_jobs', True)
+    if not must_run_jobs:
+        app_logging.debug('Not submitting jobs because run_jobs is False')
+        return
+
+    collect_finished_processes()
+    # The exit code of a previous run of the job must not be read as the one of this run
+    try:
+        os.remove(get_exit_code_file_path(job))
+    except FileNotFoundError:
+        pass
+
+    # The job runs in its own session, so it can be stopped with all its subprocesses
+    process = subprocess.Popen(['bash', '-c', job_command], cwd=job_submission_service.get_job_run_dir(job),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    RUNNING_PROCESSES.append(process)
+
+    job.lsf_job_id = process.pid
+    job.lsf_host = get_host()
+    job.status = delayed_job_models.JobStatuses.QUEUED
+    delayed_job_models.save_job(job)
+    app_logging.debug(f'Job {job.id} is running locally with pid {process.pid}')
+
+
+def process_is_running(pid):
+    """
+    :param pid: pid of the process
+    :return: True if there is a process running with the pid given
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_runs_job(pid, job):
+    """
+    Checks that the process is alive and that it is the one that runs the job. A process that finished but whose exit
+    status was not collected yet stays as a zombie, and the pid of a process that finished can be reused by another one.
+    When /proc is not available, it only checks that there is a process with the pid given.
+    :param pid: pid of the process
+    :param job: job object that the process should run
+    :return: True if the process is running the job given
+    """
+    if not Path('/proc/self').is_dir():
+        return process_is_running(pid)
+
+    proc_dir = Path('/proc').joinpath(str(pid))
+
+    try:
+        with open(proc_dir.joinpath('stat'), 'r') as stat_file:
+            # The state comes after the command name, which is between parenthesis and can contain spaces
+            process_state = stat_file.read().rsplit(')', 1)[1].split()[0]
+        with open(proc_dir.joinpath('cmdline'), 'rb') as cmdline_file:
+            command_line = cmdline_file.read().decode(errors='replace')
+    except (FileNotFoundError, ProcessLookupError, IndexError):
+        return False
+    except PermissionError:
+        return process_is_running(pid)
+
+    if process_state == 'Z':
+        return False
+    # The command of the job redirects its output to its run dir, so the run dir is in the command line
+    return str(job_submission_service.get_job_run_dir(job)) in command_line
+
+
+def get_job_record(job, lsf_job_id):
+    """
+    :param job: job object to check
+    :param lsf_job_id: pid of the process that runs the job
+    :return: a record with the status of the job like the ones produced by bjobs
+    """
+    exit_code_path = get_exit_code_file_path(job)
+    if os.path.isfile(exit_code_path):
+        with open(exit_code_path, 'r') as exit_code_file:
+            exit_code = exit_code_file.read().strip()
+        lsf_status = 'DONE' if exit_code == '0' else 'EXIT'
+    elif process_runs_job(int(lsf_job_id), job):
+        lsf_status = 'RUN'
+    else:
+        # The process died without saving its exit code, for example because it was killed
+        lsf_status = 'EXIT'
+
+    return {
+        'JOBID': str(lsf_job_id),
+        'STAT': lsf_status,
+        'START_TIME': '',
+        'FINISH_TIME': ''
+    }
+
+
+def get_jobs_records(lsf_job_ids):
+    """
+    Loads the jobs with only one query and produces their records. The jobs that do not exist anymore, for example
+    because they were deleted while they were being checked, are skipped.
+    :param lsf_job_ids: list of the pids of the jobs to check
+    :return: the list of records with the status of the jobs, like the ones produced by bjobs
+    """
+    # The pids are reused, the jobs must be among the jobs of this host that are still being checked
+    jobs_by_lsf_id = delayed_job_models.get_jobs_to_check_by_lsf_ids(lsf_job_ids, get_host())
+    jobs_records = []
+    for lsf_job_id in lsf_job_ids:
+        job = jobs_by_lsf_id.get(lsf_job_id)
+        if job is None:
+            app_logging.debug(f'The local job with pid {lsf_job_id} does not exist anymore, not checking it')
+            continue
+        jobs_records.append(get_job_record(job, lsf_job_id))
+
+    return jobs_records
+
+
+def cancel_jobs(lsf_job_ids):
+    """
+    Stops the processes of the jobs given and all their subprocesses
+    :param lsf_job_ids: list of the pids of the jobs to stop
+    """
+    for pid in lsf_job_ids:
+        try:
+            os.killpg(int(pid), signal.SIGTERM)
+            app_logging.debug(f'Stopped local job with pid {pid}')
+        except ProcessLookupError:
+            app_logging.debug(f'Local job with pid {pid} was not running')
@@ -0,0 +1,77 @@
+"""
+Backend that runs the jobs in the LSF cluster. The jobs are submitted, checked and killed with scripts that connect to
+the LSF head node with ssh.
+"""
+from app.config import RUN_CONFIG
+from app import ssh_connections
+from app import script_templates
+from app.blueprints.job_submission.services import job_submission_service
+from app.job_status_daemon import daemon
+import app.app_logging as app_logging
+
+
+def get_host():
+    """
+    :return: the LSF host set in the configuration
+    """
+    return RUN_CONFIG.get('lsf_submission')['lsf_host']
+
+
+def submit_job(job):
+    """
+    Submits the job to LSF with the submission script
+    :param job: job object to submit, its run folder must be prepared
+    """
+    job_submission_script = job_submission_service.prepare_job_submission_script(job)
+    job_submission_service.submit_job_to_lsf(job, job_submission_script)
+
+
+def get_jobs_records(lsf_job_ids):
+    """
+    Runs the job status script and returns the records of the jobs from the output of bjobs
+    :param lsf_job_ids: list of the lsf ids of the jobs to check
+    :return: the list of records obtained from bjobs, None if the script was not run or its output could not be parsed
+    """
+    status_script = daemon.prepare_job_status_check_script(lsf_job_ids)
+    must_run_script = RUN_CONFIG.get('run_status_script', True)
+    if not must_run_script:
+        app_logging.debug('Not running script because run_status_script is False')
+        return None
+
+    script_output = daemon.get_status_script_output(status_script)
+
+    json_output = daemon.get_bjobs_json_output(script_output)
+    if json_output is None:
+        return None
+    return json_output['RECORDS']
+
+
+def cancel_jobs(lsf_job_ids):
+    """
+    Kills the jobs in LSF with the kill jobs script
+    :param lsf_job_ids: list of the lsf ids of the jobs to kill
+    """
+    lsf_config = RUN_CONFIG.get('lsf_submission')
+    lsf_user = lsf_config['lsf_user']
+    lsf_host = lsf_config['lsf_host']
+    id_rsa_path = lsf_config['id_rsa_file']
+
+    kill_jobs_script = script_templates.render(
+        script_templates.KILL_JOBS_TEMPLATE,
+        LSF_JOB_IDS=' '.join([str(lsf_job_id) for lsf_job_id in lsf_job_ids]),
+        LSF_USER=lsf_user,
+        LSF_HOST=lsf_host,
+        SSH_CONNECTION_OPTIONS=ssh_connections.get_ssh_connection_options(lsf_user, lsf_host)
+    )
+
+    must_run_jobs = RUN_CONFIG.get('run_jobs', True)
+    if not must_run_jobs:
+        app_logging.debug('Not killing jobs because run_jobs is False')
+        return
+
+    ssh_connections.ensure_lsf_master_connection()
+    kill_process = script_templates.run_script(kill_jobs_script, [id_rsa_path])
+
+    app_logging.debug(f'Kill jobs STD Output: \n {kill_process.stdout}')
+    app_logging.debug(f'Kill jobs STD Error: \n {kill_process.stderr}')
+    app_logging.debug(f'kill jobs return code was: {kill_process.returncode}')
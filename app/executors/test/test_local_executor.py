@@ -0,0 +1,181 @@
+"""
+This Module tests the executor that runs the jobs as local processes
+"""
+import os
+import shutil
+import signal
+import time
+import unittest
+from pathlib import Path
+
+from app import create_app
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app import executors
+from app.executors import local_executor
+from app.job_status_daemon import daemon
+
+
+class TestLocalExecutor(unittest.TestCase):
+    """
+    Class to test the local executor
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        self.run_jobs_was = RUN_CONFIG.get('run_jobs')
+        self.command_template_was = local_executor.COMMAND_TEMPLATE
+        self.executor_type_was = executors.EXECUTOR_TYPE
+        RUN_CONFIG['run_jobs'] = True
+
+    def tearDown(self):
+        RUN_CONFIG['run_jobs'] = self.run_jobs_was
+        local_executor.COMMAND_TEMPLATE = self.command_template_was
+        executors.EXECUTOR_TYPE = self.executor_type_was
+
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+            for dir_path in [job_submission_service.JOBS_RUN_DIR, job_submission_service.JOBS_TMP_DIR,
+                             job_submission_service.JOBS_OUTPUT_DIR]:
+                shutil.rmtree(dir_path, ignore_errors=True)
+
+    @staticmethod
+    def run_job_locally(command_template, seconds=1):
+        """
+        Creates a test job and runs it with the local executor
+        :param command_template: command that the job runs
+        :param seconds: param to make the job different from the others
+        :return: the job object and the process that runs it
+        """
+        local_executor.COMMAND_TEMPLATE = command_template
+        params = {
+            'instruction': 'RUN_NORMALLY',
+            'seconds': seconds,
+            'api_url': 'https://www.ebi.ac.uk/chembl/api/data/similarity/CCCC/80.json'
+        }
+        job = delayed_job_models.get_or_create('TEST', params, 'some_url')
+        job_submission_service.prepare_run_folder(job, {}, {})
+        local_executor.submit_job(job)
+        return job, local_executor.RUNNING_PROCESSES[-1]
+
+    def test_runs_a_job_locally(self):
+        """
+        Tests that a job is run as a local process and that its status is reported as done when it finishes
+        """
+        with self.flask_app.app_context():
+            job, process = self.run_job_locally('echo {JOB_ID}')
+            process.wait()
+
+            self.assertEqual(job.lsf_job_id, process.pid, msg='The lsf id of the job must be the pid')
+            self.assertEqual(job.lsf_host, local_executor.get_host(), msg='The host of the job was not set')
+
+            job_out_path = Path(job_submission_service.get_job_run_dir(job)).joinpath('job_run.out')
+            with open(job_out_path, 'r') as job_out_file:
+                self.assertEqual(job_out_file.read().strip(), job.id, msg='The output of the job was not saved')
+
+            records_got = local_executor.get_jobs_records([job.lsf_job_id])
+            self.assertEqual(records_got[0]['STAT'], 'DONE', msg='The job must be reported as done')
+
+    def test_reports_failed_and_cancelled_jobs(self):
+        """
+        Tests that the jobs that fail or are cancelled are reported as failed
+        """
+        with self.flask_app.app_context():
+            failed_job, failed_process = self.run_job_locally('exit 3', seconds=1)
+            failed_process.wait()
+            records_got = local_executor.get_jobs_records([failed_job.lsf_job_id])
+            self.assertEqual(records_got[0]['STAT'], 'EXIT', msg='The failed job must be reported as failed')
+
+            long_job, long_process = self.run_job_locally('sleep 30', seconds=2)
+            records_got = local_executor.get_jobs_records([long_job.lsf_job_id])
+            self.assertEqual(records_got[0]['STAT'], 'RUN', msg='The job must be reported as running')
+
+            local_executor.cancel_jobs([long_job.lsf_job_id])
+            long_process.wait()
+            records_got = local_executor.get_jobs_records([long_job.lsf_job_id])
+            self.assertEqual(records_got[0]['STAT'], 'EXIT', msg='The cancelled job must be reported as failed')
+
+    def test_reused_pids_do_not_match_the_jobs_that_finished(self):
+        """
+        Tests that when the pid of a job was used before by a job that finished, the status of the job that is running
+        is reported
+        """
+        with self.flask_app.app_context():
+            long_job, long_process = self.run_job_locally('sleep 30', seconds=2)
+            try:
+                old_job, old_process = self.run_job_locally('exit 3', seconds=1)
+                old_process.wait()
+                old_job.lsf_job_id = long_job.lsf_job_id
+                old_job.status = delayed_job_models.JobStatuses.ERROR
+                delayed_job_models.save_job(old_job)
+
+                records_got = local_executor.get_jobs_records([long_job.lsf_job_id])
+                self.assertEqual(records_got[0]['STAT'], 'RUN', msg='The status of the running job must be reported')
+                jobs_got = delayed_job_models.get_jobs_to_check_by_lsf_ids([long_job.lsf_job_id],
+                                                                           local_executor.get_host())
+                self.assertEqual(jobs_got[long_job.lsf_job_id].id, long_job.id,
+                                 msg='The job that finished must not be loaded by the daemon')
+            finally:
+                local_executor.cancel_jobs([long_job.lsf_job_id])
+                long_process.wait()
+
+    def test_skips_the_jobs_that_do_not_exist_anymore(self):
+        """
+        Tests that the records of the jobs that exist are produced when some of the pids do not belong to any job, for
+        example because their jobs were deleted
+        """
+        with self.flask_app.app_context():
+            job, process = self.run_job_locally('echo {JOB_ID}')
+            process.wait()
+
+            records_got = local_executor.get_jobs_records([job.lsf_job_id, job.lsf_job_id + 100000])
+            self.assertEqual(len(records_got), 1, msg='Only the record of the job that exists must be produced')
+            self.assertEqual(records_got[0]['JOBID'], str(job.lsf_job_id), msg='The record of the job is not correct')
+
+    def test_zombie_and_reused_pids_are_not_reported_as_running(self):
+        """
+        Tests that a job whose process is a zombie or whose pid is used by another process is not reported as running
+        """
+        with self.flask_app.app_context():
+            long_job, long_process = self.run_job_locally('sleep 30', seconds=2)
+            try:
+                # The process is not waited for, so it stays as a zombie
+                os.killpg(long_job.lsf_job_id, signal.SIGKILL)
+                stat_path = Path('/proc').joinpath(str(long_job.lsf_job_id), 'stat')
+                for _ in range(50):
+                    if stat_path.read_text().rsplit(')', 1)[1].split()[0] == 'Z':
+                        break
+                    time.sleep(0.1)
+
+                records_got = local_executor.get_jobs_records([long_job.lsf_job_id])
+                self.assertEqual(records_got[0]['STAT'], 'EXIT', msg='A zombie process must not be reported as running')
+            finally:
+                long_process.wait()
+
+            long_job.lsf_job_id = os.getpid()
+            delayed_job_models.save_job(long_job)
+            records_got = local_executor.get_jobs_records([long_job.lsf_job_id])
+            self.assertEqual(records_got[0]['STAT'], 'EXIT',
+                             msg='A process that does not run the job must not be reported as running')
+
+    def test_daemon_checks_the_jobs_of_the_local_executor(self):
+        """
+        Tests that the status daemon updates the status of the jobs run by the local executor
+        """
+        with self.flask_app.app_context():
+            executors.EXECUTOR_TYPE = executors.LOCAL_EXECUTOR
+            job, process = self.run_job_locally('exit 1')
+            process.wait()
+
+            sleep_time_got, jobs_were_checked = daemon.check_jobs_status()
+            self.assertTrue(jobs_were_checked, msg='The jobs should have been checked')
+            status_agent_config = RUN_CONFIG.get('status_agent')
+            self.assertTrue(status_agent_config['min_sleep_time'] <= sleep_time_got <=
+                            status_agent_config['max_sleep_time'],
+                            msg='The sleep time is not in the range configured')
+
+            job_got = delayed_job_models.get_job_by_id(job.id, force_refresh=True)
+            self.assertEqual(job_got.status, delayed_job_models.JobStatuses.ERROR,
+                             msg='The status of the job was not updated')
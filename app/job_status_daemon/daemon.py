@@ -4,20 +4,26 @@ Module that implements the daemon that checks the statuses of jobs in LSF
 import os
 from pathlib import Path
 import socket
+import itertools
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import datetime
-import stat
-import subprocess
 import re
 import json
 import random
 
+from flask import current_app
+
 from app.models import delayed_job_models
 from app.config import RUN_CONFIG
 from app.blueprints.job_submission.services import job_submission_service
+from app.blueprints.job_submission.services import submission_queue
 from app.job_status_daemon import locks
+from app.job_status_daemon import polling_schedule
+from app import ssh_connections
+from app import script_templates
+from app import executors
 from app.job_statistics import statistics_saver
 from app.job_status_daemon.job_statistics import statistics_generator
-import app.app_logging as app_logging
 
 AGENT_RUN_DIR = RUN_CONFIG.get('status_agent_run_dir', str(Path().absolute()) + '/status_agents_run')
 if not os.path.isabs(AGENT_RUN_DIR):
@@ -38,8 +44,7 @@ def check_jobs_status(delete_lock_after_finishing=True):
     :return: (sleeptime, jobs_were_checked) the amount of seconds to wait for the next run and if the jobs
     were checked or not
     """
-    lsf_config = RUN_CONFIG.get('lsf_submission')
-    current_lsf_host = lsf_config['lsf_host']
+    current_lsf_host = executors.get_executor().get_host()
     my_hostname = socket.gethostname()
 
     min_sleep_time = RUN_CONFIG.get('status_agent').get('min_sleep_time')
@@ -58,29 +63,66 @@ def check_jobs_status(delete_lock_after_finishing=True):
         locks.set_lsf_lock(current_lsf_host, my_hostname)
 
     print('Looking for jobs to check...')
-    lsf_job_ids_to_check = get_lsf_job_ids_to_check()
-    print(f'lsf_job_ids_to_check: {lsf_job_ids_to_check}')
+    active_lsf_job_ids = get_lsf_job_ids_to_check()
+    # With the incremental polling, only the jobs that are due are checked in this tick
+    lsf_job_ids_to_check = polling_schedule.get_jobs_due(active_lsf_job_ids)
+    print(f'lsf_job_ids_to_check: {lsf_job_ids_to_check} ({len(active_lsf_job_ids)} jobs are active)')
 
     if len(lsf_job_ids_to_check) == 0:
         locks.delete_lsf_lock(current_lsf_host) if delete_lock_after_finishing else None
         return sleep_time, True
 
-    script_path = prepare_job_status_check_script(lsf_job_ids_to_check)
-    must_run_script = RUN_CONFIG.get('run_status_script', True)
-    if not must_run_script:
-        print('Not running script because run_status_script is False')
-        locks.delete_lsf_lock(current_lsf_host) if delete_lock_after_finishing else None
-        return sleep_time, False
+    jobs_were_checked = True
+    for jobs_records in get_jobs_records_in_chunks(lsf_job_ids_to_check):
+        if jobs_records is None:
+            jobs_were_checked = False
+            continue
 
-    try:
-        script_output = get_status_script_output(script_path)
-        os.remove(script_path)  # Remove the script after running so it doesn't fill up the NFS
-        print(f'deleted script: {script_path}')
-        parse_bjobs_output(script_output)
-        locks.delete_lsf_lock(current_lsf_host) if delete_lock_after_finishing else None
-        return sleep_time, True
-    except JobStatusDaemonError as error:
-        print(error)
+        react_to_bjobs_json_output({'RECORDS': jobs_records})
+        for record in jobs_records:
+            polling_schedule.save_status_seen(int(record['JOBID']), map_lsf_status_to_job_status(record['STAT']))
+
+    locks.delete_lsf_lock(current_lsf_host) if delete_lock_after_finishing else None
+    return sleep_time, jobs_were_checked
+
+def get_jobs_records_in_chunks(lsf_job_ids):
+    """
+    Gets the records of the jobs given from the executor, in chunks of status_agent.bjobs_chunk_size jobs, so the
+    command lines and the outputs of bjobs are bounded. Up to status_agent.max_concurrent_bjobs chunks are requested
+    at the same time, sharing the master ssh connection to the LSF host, and no more chunks are requested until the
+    records obtained are processed.
+    :param lsf_job_ids: list of the lsf ids of the jobs to check
+    :return: a generator of the lists of records of each chunk as they are obtained, None for the chunks that could
+    not be checked
+    """
+    status_agent_config = RUN_CONFIG.get('status_agent')
+    chunk_size = status_agent_config.get('bjobs_chunk_size', 500)
+    max_concurrent_bjobs = status_agent_config.get('max_concurrent_bjobs', 4)
+
+    lsf_job_ids_chunks = iter([lsf_job_ids[chunk_start:chunk_start + chunk_size]
+                               for chunk_start in range(0, len(lsf_job_ids), chunk_size)])
+    get_jobs_records = executors.get_executor().get_jobs_records
+    # Some executors read the jobs from the database, so the chunks are requested in the context of the app
+    flask_app = current_app._get_current_object()
+
+    def request_chunk(lsf_job_ids_chunk):
+        return bjobs_pool.submit(submission_queue.run_in_app_context, flask_app, get_jobs_records, lsf_job_ids_chunk)
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_bjobs, thread_name_prefix='bjobs') as bjobs_pool:
+        pending_chunks = {request_chunk(lsf_job_ids_chunk)
+                          for lsf_job_ids_chunk in itertools.islice(lsf_job_ids_chunks, max_concurrent_bjobs)}
+        while len(pending_chunks) > 0:
+            finished_chunks, pending_chunks = wait(pending_chunks, return_when=FIRST_COMPLETED)
+            for finished_chunk in finished_chunks:
+                try:
+                    yield finished_chunk.result()
+                except JobStatusDaemonError as error:
+                    print(error)
+                    yield None
+
+                next_chunk = next(lsf_job_ids_chunks, None)
+                if next_chunk is not None:
+                    pending_chunks.add(request_chunk(next_chunk))
 
 def get_lsf_job_ids_to_check():
     """
@@ -90,14 +132,13 @@ def get_lsf_job_ids_to_check():
     2. Are not in Error or Finished state.
     """
 
-    lsf_config = RUN_CONFIG.get('lsf_submission')
-    lsf_host = lsf_config['lsf_host']
+    lsf_host = executors.get_executor().get_host()
 
     return delayed_job_models.get_lsf_job_ids_to_check(lsf_host)
 
 def get_check_job_status_script_path():
     """
-    :return: the path to use for creating the job status script
+    :return: the path to use for saving the output of the job status script when it fails
     """
 
     filename = f'{datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}_check_lsf_job_status.sh'
@@ -112,58 +153,46 @@ def prepare_job_status_check_script(lsf_job_ids):
     """
     Prepares the script that will check for the job status to LSF
     :lsf_job_ids: the list of job ids for which check the status
-    :return: the final path of the script that was created
+    :return: the text of the script
     """
+    lsf_config = RUN_CONFIG.get('lsf_submission')
+    lsf_user = lsf_config['lsf_user']
+    lsf_host = lsf_config['lsf_host']
 
-    job_status_script_template_path = os.path.join(Path().absolute(), 'templates', 'get_jobs_status.sh')
-    with open(job_status_script_template_path, 'r') as template_file:
-        job_status_template = template_file.read()
-
-        lsf_config = RUN_CONFIG.get('lsf_submission')
-        lsf_user = lsf_config['lsf_user']
-        lsf_host = lsf_config['lsf_host']
-
-        job_submission_script = job_status_template.format(
-            LSF_JOB_IDS=' '.join([str(lsf_job_id) for lsf_job_id in lsf_job_ids]),
-            LSF_USER=lsf_user,
-            LSF_HOST=lsf_host
-        )
-
-        status_script_path = get_check_job_status_script_path()
-        status_script_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(status_script_path, 'w') as status_script_file:
-            status_script_file.write(job_submission_script)
-
-        print(f'created script: {status_script_path}')
-        # make sure file is executable
-        file_stats = os.stat(status_script_path)
-        os.chmod(status_script_path, file_stats.st_mode | stat.S_IEXEC)
-
-    return status_script_path
+    return script_templates.render(
+        script_templates.GET_JOBS_STATUS_TEMPLATE,
+        LSF_JOB_IDS=' '.join([str(lsf_job_id) for lsf_job_id in lsf_job_ids]),
+        LSF_USER=lsf_user,
+        LSF_HOST=lsf_host,
+        SSH_CONNECTION_OPTIONS=ssh_connections.get_ssh_connection_options(lsf_user, lsf_host)
+    )
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Parsing status script output
 # ----------------------------------------------------------------------------------------------------------------------
-def get_status_script_output(script_path):
+def get_status_script_output(status_script):
     """
     Runs the status script and returns a text with the output obtained, if there is an error raises an exception
-    :param script_path: path of the script
+    :param status_script: text of the script
     :return: the text output of stdout
     """
     lsf_config = RUN_CONFIG.get('lsf_submission')
     id_rsa_path = lsf_config['id_rsa_file']
-    run_command = f'{script_path} {id_rsa_path}'
-    print(f'Going to run job status script, command: {run_command}')
-    status_check_process = subprocess.run(run_command.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    print(f'Going to run job status script')
+    ssh_connections.ensure_lsf_master_connection()
+    status_check_process = script_templates.run_script(status_script, [id_rsa_path])
 
     print(f'Output: \n {status_check_process.stdout}')
     print(f'Error: \n {status_check_process.stderr}')
 
     return_code = status_check_process.returncode
     print(f'script return code was: {return_code}')
+    ssh_connections.react_to_lsf_script_return_code(return_code)
 
     if return_code != 0:
 
+        script_path = get_check_job_status_script_path()
+        script_path.parent.mkdir(parents=True, exist_ok=True)
         status_output_path = f'{script_path}.out'
         status_error_path = f'{script_path}.err'
 
@@ -177,63 +206,112 @@ def get_status_script_output(script_path):
     else:
         return status_check_process.stdout.decode()
 
+
 def parse_bjobs_output(script_output):
     """
     parses the output passed as parameter. Modifies the status of the job in the database accordingly
     :param script_output: string output of the script that requests the status of the job
     """
 
+    json_output = get_bjobs_json_output(script_output)
+    if json_output is not None:
+        react_to_bjobs_json_output(json_output)
+
+def get_bjobs_json_output(script_output):
+    """
+    Reads the json printed by bjobs from the output of the status script
+    :param script_output: string output of the script that requests the status of the job
+    :return: the dict parsed from the output of bjobs, None if it could not be parsed
+    """
     match = re.search(r'START_REMOTE_SSH[\s\S]*FINISH_REMOTE_SSH', script_output)
     bjobs_output_str = re.split(r'(START_REMOTE_SSH\n|\nFINISH_REMOTE_SSH)', match.group(0))[2]
 
     try:
-        json_output = json.loads(bjobs_output_str)
-        react_to_bjobs_json_output(json_output)
+        return json.loads(bjobs_output_str)
     except json.decoder.JSONDecodeError as error:
         print(f'unable to decode output. Will try again later anyway {error}')
+        return None
 
 def react_to_bjobs_json_output(json_output):
     """
-    Reads the dict obtained from the status script output, modifies the jobs accordingly
+    Reads the dict obtained from the status script output, modifies the jobs accordingly. The records are processed
+    in chunks of status_agent.records_chunk_size, the jobs of each chunk are loaded with one query and their changes
+    are committed at once. Each record is processed in a savepoint, a record that fails is ignored without losing the
+    changes of the others. The statistics of the jobs that finished or failed are saved after the chunk is committed.
     :param json_output: dict with the output parsed from running the command
     """
     print(f'Parsing json: {json.dumps(json_output)}')
-    for record in json_output['RECORDS']:
-        lsf_id = record['JOBID']
-        lsf_status = record['STAT']
-        new_status = map_lsf_status_to_job_status(lsf_status)
-        job = delayed_job_models.get_job_by_lsf_id(lsf_id)
-
-        old_status = job.status
-        status_changed = old_status != new_status
-        if not status_changed:
-            continue
-
-        job.status = new_status
-        if new_status == delayed_job_models.JobStatuses.RUNNING:
-
-            parse_job_started_at_time_if_not_set(job, record)
-
-        elif new_status == delayed_job_models.JobStatuses.ERROR:
-
-            # If the job ran too fast, the started at could have not been captured by my previous run.
-            parse_job_started_at_time_if_not_set(job, record)
-            parse_job_finished_at_time_if_not_set(job, record)
-            if job.num_failures is None:
-                job.num_failures = 0
-            job.num_failures += 1
-            save_job_statistics(job)
-
-        elif new_status == delayed_job_models.JobStatuses.FINISHED:
-
-            parse_job_started_at_time_if_not_set(job, record)
-            parse_job_finished_at_time_if_not_set(job, record)
-            set_job_expiration_time(job)
-            save_job_outputs(job)
-            save_job_statistics(job)
-
-        delayed_job_models.save_job(job)
-        print(f'Job {job.id} with lsf id {job.lsf_job_id} new state is {new_status}')
+    records = json_output['RECORDS']
+    chunk_size = RUN_CONFIG.get('status_agent').get('records_chunk_size', 1000)
+    lsf_host = executors.get_executor().get_host()
+    for chunk_start in range(0, len(records), chunk_size):
+        records_chunk = records[chunk_start:chunk_start + chunk_size]
+        jobs_ended = []
+        with delayed_job_models.unit_of_work():
+            jobs_by_lsf_id = delayed_job_models.get_jobs_to_check_by_lsf_ids(
+                [int(record['JOBID']) for record in records_chunk], lsf_host)
+            for record in records_chunk:
+                job = jobs_by_lsf_id.get(int(record['JOBID']))
+                if job is None:
+                    print(f'There is no job with lsf id {record["JOBID"]}, ignoring it')
+                    continue
+
+                try:
+                    with delayed_job_models.savepoint():
+                        job_ended = react_to_bjobs_record(job, record)
+                except Exception as error:
+                    print(f'Unable to process the record of the job {job.id}, ignoring it: {repr(error)}')
+                    continue
+
+                if job_ended:
+                    jobs_ended.append(job)
+
+        for job in jobs_ended:
+            try:
+                save_job_statistics(job)
+            except Exception as error:
+                print(f'Unable to save the statistics of the job {job.id}: {repr(error)}')
+
+def react_to_bjobs_record(job, record):
+    """
+    Modifies the job given according to its record in the output of bjobs. It is saved in the current unit of work.
+    The statistics of the job are not saved, they must be saved once the changes are committed.
+    :param job: job of the record
+    :param record: record of the job obtained from bjobs
+    :return: True if the job has just finished or failed, False otherwise
+    """
+    lsf_status = record['STAT']
+    new_status = map_lsf_status_to_job_status(lsf_status)
+
+    old_status = job.status
+    status_changed = old_status != new_status
+    if not status_changed:
+        return False
+
+    job.status = new_status
+    if new_status == delayed_job_models.JobStatuses.RUNNING:
+
+        parse_job_started_at_time_if_not_set(job, record)
+
+    elif new_status == delayed_job_models.JobStatuses.ERROR:
+
+        # If the job ran too fast, the started at could have not been captured by my previous run.
+        parse_job_started_at_time_if_not_set(job, record)
+        parse_job_finished_at_time_if_not_set(job, record)
+        if job.num_failures is None:
+            job.num_failures = 0
+        job.num_failures += 1
+
+    elif new_status == delayed_job_models.JobStatuses.FINISHED:
+
+        parse_job_started_at_time_if_not_set(job, record)
+        parse_job_finished_at_time_if_not_set(job, record)
+        set_job_expiration_time(job)
+        save_job_outputs(job)
+
+    delayed_job_models.save_job(job)
+    print(f'Job {job.id} with lsf id {job.lsf_job_id} new state is {new_status}')
+    return new_status in [delayed_job_models.JobStatuses.ERROR, delayed_job_models.JobStatuses.FINISHED]
 
 def save_job_statistics(job):
     """
@@ -368,5 +446,3 @@ def get_output_file_url(file_relative_path):
     outputs_base_path = RUN_CONFIG.get('outputs_base_path')
 
     return f'{server_base_path_with_slash}/{outputs_base_path}/{file_relative_path}'
-
-
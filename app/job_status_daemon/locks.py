@@ -32,3 +32,16 @@ def delete_lsf_lock(lsf_host):
     :param lsf_host: lsf host for which to delete the lock
     """
     CACHE.delete(key=lsf_host)
+
+def set_maintenance_task_lock(task_name, lock_owner, seconds_valid):
+    """
+    Creates a lock on the maintenance task given in the name of the owner given, only if it is not locked already
+    :param task_name: name of the maintenance task to lock
+    :param lock_owner: identifier (normally a hostname) of the process that owns the lock
+    :param seconds_valid: time in seconds for which the lock is valid
+    :return: True if the lock was created, False if the task was already locked
+    """
+    lock_dict = {
+        'owner': lock_owner
+    }
+    return CACHE.add(key=f'maintenance_task:{task_name}', value=lock_dict, timeout=seconds_valid)
@@ -0,0 +1,243 @@
+"""
+Module that runs the maintenance tasks of the system in the status daemon process: the deletion of the expired jobs,
+of the run and output dirs that do not belong to any job, of the files of the input files store that are not used by
+any job, of the input files left in the staging and temporary dirs, and of the outputs of the status scripts that
+failed. Each task runs at most once per interval among all the status
+daemons running, with a lock in the app cache, and the files and the expired jobs are deleted at a limited rate to not
+saturate the disks.
+"""
+import os
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app.job_status_daemon import daemon
+from app.job_status_daemon import locks
+import app.app_logging as app_logging
+
+MAINTENANCE_CONFIG = RUN_CONFIG.get('maintenance', {})
+ENABLED = MAINTENANCE_CONFIG.get('enabled', True)
+# How often the scheduler checks if there are tasks to run
+CHECK_INTERVAL_SECONDS = MAINTENANCE_CONFIG.get('check_interval_seconds', 60)
+MAX_DELETIONS_PER_SECOND = MAINTENANCE_CONFIG.get('max_deletions_per_second', 50)
+TASKS_CONFIG = MAINTENANCE_CONFIG.get('tasks', {})
+
+# Number of paths for which the jobs that they belong to are looked for in each query
+PATHS_CHUNK_SIZE = 500
+
+
+def get_task_config(task_name):
+    """
+    :param task_name: name of the task
+    :return: a dict with the configuration of the task, with the default values for the ones not configured
+    """
+    return {
+        'enabled': True,
+        'interval_seconds': 3600,
+        'max_age_seconds': 24 * 3600,
+        'chunk_size': 100,
+        **TASKS_CONFIG.get(task_name, {})
+    }
+
+
+def delete_paths(paths):
+    """
+    Deletes the files and dirs given, at a rate of maintenance.max_deletions_per_second at most
+    :param paths: iterable with the paths to delete
+    :return: the number of paths that were deleted
+    """
+    num_deleted = 0
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+
+        num_deleted += 1
+        time.sleep(1 / MAX_DELETIONS_PER_SECOND)
+
+    return num_deleted
+
+
+def get_paths_older_than(dir_path, max_age_seconds, recursive=False):
+    """
+    :param dir_path: dir in which to look for the paths
+    :param max_age_seconds: the paths modified before this number of seconds ago are returned
+    :param recursive: if True, the files of the subdirs are returned instead of the items of the dir
+    :return: a list with the paths of the dir that were modified before the time given
+    """
+    if not os.path.isdir(dir_path):
+        return []
+
+    min_modification_time = time.time() - max_age_seconds
+    if recursive:
+        paths = [Path(parent_path).joinpath(filename) for parent_path, _, filenames in os.walk(dir_path)
+                 for filename in filenames]
+    else:
+        paths = list(Path(dir_path).iterdir())
+
+    old_paths = []
+    for path in paths:
+        try:
+            if path.stat().st_mtime < min_modification_time:
+                old_paths.append(path)
+        except FileNotFoundError:
+            continue
+
+    return old_paths
+
+
+def delete_expired_jobs(task_config):
+    """
+    Deletes the jobs that expired with their files, in chunks of chunk_size jobs. After each chunk it waits as needed
+    to not delete more than maintenance.max_deletions_per_second jobs per second.
+    :param task_config: configuration of the task
+    :return: the number of jobs that were deleted
+    """
+    start_time = time.monotonic()
+
+    def limit_deletion_rate(num_deleted_so_far):
+        app_logging.info(f'Maintenance task delete_expired_jobs: deleted {num_deleted_so_far} jobs so far')
+        seconds_ahead = num_deleted_so_far / MAX_DELETIONS_PER_SECOND - (time.monotonic() - start_time)
+        if seconds_ahead > 0:
+            time.sleep(seconds_ahead)
+
+    return delayed_job_models.delete_all_expired_jobs(report_progress=limit_deletion_rate,
+                                                      chunk_size=task_config['chunk_size'])
+
+
+def delete_orphan_job_dirs(task_config):
+    """
+    Deletes the run and output dirs that do not belong to any job, for example when the job was deleted but the
+    deletion of its dirs was interrupted. Only the dirs older than max_age_seconds are deleted, so the dirs of the jobs
+    being created are not deleted.
+    :param task_config: configuration of the task
+    :return: the number of dirs that were deleted
+    """
+    candidate_dirs = []
+    for base_dir in [job_submission_service.JOBS_RUN_DIR, job_submission_service.JOBS_OUTPUT_DIR]:
+        # The dirs that start with a dot are the staging dir and the input files store
+        candidate_dirs += [path for path in get_paths_older_than(base_dir, task_config['max_age_seconds'])
+                           if path.is_dir() and not path.name.startswith('.')]
+
+    orphan_dirs = []
+    for chunk_start in range(0, len(candidate_dirs), PATHS_CHUNK_SIZE):
+        dirs_chunk = candidate_dirs[chunk_start:chunk_start + PATHS_CHUNK_SIZE]
+        existing_job_ids = delayed_job_models.get_existing_job_ids([path.name for path in dirs_chunk])
+        orphan_dirs += [path for path in dirs_chunk if path.name not in existing_job_ids]
+
+    return delete_paths(orphan_dirs)
+
+
+def delete_unreferenced_input_files(task_config):
+    """
+    Deletes the files of the input files store that are not used by any job. Only the files older than max_age_seconds
+    are deleted, the submissions update the modification time of the files that they reuse, so a file is not deleted
+    while a job that uses it is being created and it has not been committed yet.
+    :param task_config: configuration of the task
+    :return: the number of files that were deleted
+    """
+    old_paths = get_paths_older_than(job_submission_service.INPUT_FILES_STORE_DIR, task_config['max_age_seconds'],
+                                     recursive=True)
+
+    unreferenced_paths = []
+    for chunk_start in range(0, len(old_paths), PATHS_CHUNK_SIZE):
+        paths_chunk = old_paths[chunk_start:chunk_start + PATHS_CHUNK_SIZE]
+        referenced_paths = delayed_job_models.get_referenced_input_files_paths([str(path) for path in paths_chunk])
+        unreferenced_paths += [path for path in paths_chunk if str(path) not in referenced_paths]
+
+    return delete_paths(unreferenced_paths)
+
+
+def delete_old_staged_input_files(task_config):
+    """
+    Deletes the input files left in the staging and temporary dirs by the submissions that did not finish
+    :param task_config: configuration of the task
+    :return: the number of files and dirs that were deleted
+    """
+    old_paths = []
+    for base_dir in [job_submission_service.JOBS_STAGING_DIR, job_submission_service.JOBS_TMP_DIR]:
+        old_paths += get_paths_older_than(base_dir, task_config['max_age_seconds'])
+
+    return delete_paths(old_paths)
+
+
+def delete_old_status_scripts_outputs(task_config):
+    """
+    Deletes the outputs of the status scripts that failed that are older than max_age_seconds
+    :param task_config: configuration of the task
+    :return: the number of files that were deleted
+    """
+    return delete_paths(get_paths_older_than(daemon.AGENT_RUN_DIR, task_config['max_age_seconds'], recursive=True))
+
+
+TASKS = {
+    'delete_expired_jobs': delete_expired_jobs,
+    'delete_orphan_job_dirs': delete_orphan_job_dirs,
+    'delete_unreferenced_input_files': delete_unreferenced_input_files,
+    'delete_old_staged_input_files': delete_old_staged_input_files,
+    'delete_old_status_scripts_outputs': delete_old_status_scripts_outputs,
+}
+
+
+def run_due_tasks():
+    """
+    Runs the maintenance tasks that have not been run by any status daemon in their interval
+    :return: a dict with the results of the tasks that were run, by the name of the task
+    """
+    if not ENABLED:
+        return {}
+
+    my_hostname = socket.gethostname()
+    results = {}
+    for task_name, task_function in TASKS.items():
+        task_config = get_task_config(task_name)
+        if not task_config['enabled']:
+            continue
+
+        lock_acquired = locks.set_maintenance_task_lock(task_name, my_hostname, task_config['interval_seconds'])
+        if not lock_acquired:
+            continue
+
+        app_logging.info(f'I ({my_hostname}) am running the maintenance task {task_name}')
+        try:
+            results[task_name] = task_function(task_config)
+            app_logging.info(f'Maintenance task {task_name} finished, result: {results[task_name]}')
+        except Exception as error:
+            app_logging.error(f'Maintenance task {task_name} failed, it will be run again in the next interval: '
+                              f'{repr(error)}')
+
+    return results
+
+
+def run_scheduler(flask_app):
+    """
+    Runs the maintenance tasks that are due every maintenance.check_interval_seconds, forever
+    :param flask_app: app in which context to run the tasks
+    """
+    with flask_app.app_context():
+        while True:
+            run_due_tasks()
+            time.sleep(CHECK_INTERVAL_SECONDS)
+
+
+def start_scheduler(flask_app):
+    """
+    Starts the maintenance scheduler in a thread, so the tasks do not delay the checks of the statuses of the jobs
+    :param flask_app: app in which context to run the tasks
+    :return: the thread started, None if the maintenance is disabled
+    """
+    if not ENABLED:
+        return None
+
+    scheduler_thread = threading.Thread(target=run_scheduler, args=(flask_app,), name='maintenance', daemon=True)
+    scheduler_thread.start()
+    return scheduler_thread
@@ -0,0 +1,94 @@
+"""
+Module that keeps the schedule of the incremental polling of the status of the jobs. The status daemon remembers the
+last status seen of each job and when to check it again: the running jobs and the jobs that just changed are checked
+often, and the jobs that stay pending are checked less and less often (exponential backoff). Each tick only the jobs
+that are due are checked, so the work done depends on the jobs that can have changed, not on all the active jobs.
+The schedule is kept in the memory of each daemon, a job that a daemon has not seen yet is always due.
+"""
+import time
+
+from app.config import RUN_CONFIG
+
+INCREMENTAL_POLLING_CONFIG = RUN_CONFIG.get('status_agent', {}).get('incremental_polling', {})
+ENABLED = INCREMENTAL_POLLING_CONFIG.get('enabled', False)
+# Seconds between the checks of the running jobs, 0 to check them every tick
+RUNNING_INTERVAL_SECONDS = INCREMENTAL_POLLING_CONFIG.get('running_interval_seconds', 0)
+# Seconds between the checks of a pending job after its status changed, it grows each time it is seen unchanged
+PENDING_INITIAL_INTERVAL_SECONDS = INCREMENTAL_POLLING_CONFIG.get('pending_initial_interval_seconds', 10)
+BACKOFF_FACTOR = INCREMENTAL_POLLING_CONFIG.get('backoff_factor', 2)
+MAX_INTERVAL_SECONDS = INCREMENTAL_POLLING_CONFIG.get('max_interval_seconds', 600)
+
+RUNNING_STATUS = 'RUNNING'
+
+# The schedule of each job, by its lsf id: a dict with the last status seen, the number of times in a row that it
+# has been seen with that status, and the time (time.monotonic) at which it must be checked again
+JOBS_SCHEDULE = {}
+
+
+def get_interval_seconds(status, times_unchanged):
+    """
+    :param status: last status seen of the job
+    :param times_unchanged: number of times in a row that the job has been seen with that status, after the change
+    :return: the seconds to wait before checking the job again
+    """
+    if status == RUNNING_STATUS:
+        return RUNNING_INTERVAL_SECONDS
+
+    return min(PENDING_INITIAL_INTERVAL_SECONDS * BACKOFF_FACTOR ** times_unchanged, MAX_INTERVAL_SECONDS)
+
+
+def get_jobs_due(lsf_job_ids, now=None):
+    """
+    Returns the jobs that must be checked now. The jobs that are no longer active are forgotten.
+    :param lsf_job_ids: list of the lsf ids of the jobs that are active
+    :param now: current time (time.monotonic), if None the current time is used
+    :return: a list with the lsf ids of the jobs that must be checked, all of them if the incremental polling is
+    disabled
+    """
+    if not ENABLED:
+        return lsf_job_ids
+
+    if now is None:
+        now = time.monotonic()
+
+    active_lsf_job_ids = set(lsf_job_ids)
+    for lsf_job_id in list(JOBS_SCHEDULE.keys()):
+        if lsf_job_id not in active_lsf_job_ids:
+            del JOBS_SCHEDULE[lsf_job_id]
+
+    return [lsf_job_id for lsf_job_id in lsf_job_ids
+            if lsf_job_id not in JOBS_SCHEDULE or JOBS_SCHEDULE[lsf_job_id]['next_check_at'] <= now]
+
+
+def save_status_seen(lsf_job_id, status, now=None):
+    """
+    Saves the status seen of a job and schedules its next check
+    :param lsf_job_id: lsf id of the job
+    :param status: status of the job that was seen (a JobStatuses value or its name)
+    :param now: current time (time.monotonic), if None the current time is used
+    """
+    if not ENABLED:
+        return
+
+    if now is None:
+        now = time.monotonic()
+
+    status = str(status)
+    job_schedule = JOBS_SCHEDULE.get(lsf_job_id)
+    if job_schedule is None or job_schedule['status'] != status:
+        times_unchanged = 0
+    else:
+        times_unchanged = job_schedule['times_unchanged'] + 1
+
+    JOBS_SCHEDULE[lsf_job_id] = {
+        'status': status,
+        'times_unchanged': times_unchanged,
+        'next_check_at': now + get_interval_seconds(status, times_unchanged)
+    }
+
+
+def clear():
+    """
+    Forgets the schedule of all the jobs, so all of them are checked in the next tick
+    """
+    JOBS_SCHEDULE.clear()
@@ -5,11 +5,13 @@ Script that runs the daemon that checks for the job status
 import time
 
 from app.job_status_daemon import daemon
+from app.job_status_daemon import maintenance
 from app import create_app
 
 def run():
 
     flask_app = create_app()
+    maintenance.start_scheduler(flask_app)
     with flask_app.app_context():
         while True:
             sleep_time, jobs_were_checked = daemon.check_jobs_status()
@@ -0,0 +1,189 @@
+"""
+This Module tests the maintenance tasks run by the status daemons
+"""
+import datetime
+import os
+import shutil
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from app import create_app
+from app.cache import CACHE
+from app.models import delayed_job_models
+from app.blueprints.job_submission.services import job_submission_service
+from app.job_status_daemon import daemon
+from app.job_status_daemon import maintenance
+
+
+class TestMaintenance(unittest.TestCase):
+    """
+    Class to test the maintenance tasks run by the status daemons
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.paths_to_clean = []
+
+    def tearDown(self):
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+            for task_name in maintenance.TASKS:
+                CACHE.delete(f'maintenance_task:{task_name}')
+
+        for path in self.paths_to_clean:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def create_test_dir(self, base_dir, dir_name, age_seconds):
+        """
+        Creates a dir with a file inside, that was modified the number of seconds given ago
+        :param base_dir: dir in which to create the dir
+        :param dir_name: name of the dir
+        :param age_seconds: seconds since the dir was modified
+        :return: the path of the dir created
+        """
+        dir_path = Path(base_dir).joinpath(dir_name)
+        os.makedirs(dir_path, exist_ok=True)
+        file_path = dir_path.joinpath('some_file.txt')
+        file_path.write_text('some contents')
+
+        modification_time = time.time() - age_seconds
+        for path in [file_path, dir_path]:
+            os.utime(path, (modification_time, modification_time))
+
+        self.paths_to_clean.append(dir_path)
+        return dir_path
+
+    def test_deletes_the_expired_jobs_only_once_per_interval(self):
+        """
+        Tests that the expired jobs are deleted, and that while the task is locked it is not run again
+        """
+        with self.flask_app.app_context():
+            job_ids = []
+            for days_to_expire in [-1, 1]:
+                job = delayed_job_models.get_or_create('TEST', {'days_to_expire': days_to_expire}, 'some url')
+                job.expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=days_to_expire)
+                delayed_job_models.save_job(job)
+                job_ids.append(job.id)
+            expired_job_id, valid_job_id = job_ids
+
+            results_got = maintenance.run_due_tasks()
+            self.assertEqual(results_got['delete_expired_jobs'], 1, msg='The expired job was not deleted!')
+            self.assertIsNone(delayed_job_models.DelayedJob.query.get(expired_job_id),
+                              msg='The expired job was not deleted!')
+            self.assertIsNotNone(delayed_job_models.DelayedJob.query.get(valid_job_id),
+                                 msg='A job that has not expired was deleted!')
+
+            results_got = maintenance.run_due_tasks()
+            self.assertEqual(results_got, {}, msg='The tasks must be run only once per interval!')
+
+    def test_deletes_the_expired_jobs_in_chunks_at_a_limited_rate(self):
+        """
+        Tests that the expired jobs are deleted in chunks of the size configured, waiting between the chunks to not
+        exceed the maximum deletions per second
+        """
+        with self.flask_app.app_context():
+            for job_number in range(3):
+                job = delayed_job_models.get_or_create('TEST', {'job_number': job_number}, 'some url')
+                job.expires_at = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+                delayed_job_models.save_job(job)
+
+            seconds_waited = []
+            time_was = maintenance.time
+            max_deletions_per_second_was = maintenance.MAX_DELETIONS_PER_SECOND
+            # The clock does not advance, so the task must wait all the time that the deletions must take
+            maintenance.time = SimpleNamespace(monotonic=lambda: 0, sleep=seconds_waited.append)
+            maintenance.MAX_DELETIONS_PER_SECOND = 2
+            try:
+                task_config = {**maintenance.get_task_config('delete_expired_jobs'), 'chunk_size': 1}
+                num_deleted_got = maintenance.delete_expired_jobs(task_config)
+            finally:
+                maintenance.time = time_was
+                maintenance.MAX_DELETIONS_PER_SECOND = max_deletions_per_second_was
+
+            self.assertEqual(num_deleted_got, 3, msg='The expired jobs were not deleted!')
+            self.assertEqual(seconds_waited, [0.5, 1, 1.5], msg='The task must wait after each chunk!')
+
+    def test_deletes_the_old_dirs_that_do_not_belong_to_any_job(self):
+        """
+        Tests that the run and output dirs of jobs that do not exist are deleted, but not the recent ones nor the dirs
+        of the existing jobs
+        """
+        with self.flask_app.app_context():
+            job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some url')
+            one_day_ago = 24 * 3600
+
+            existing_job_dir = self.create_test_dir(job_submission_service.JOBS_RUN_DIR, job.id, one_day_ago)
+            orphan_run_dir = self.create_test_dir(job_submission_service.JOBS_RUN_DIR, 'Job-orphan', one_day_ago)
+            orphan_output_dir = self.create_test_dir(job_submission_service.JOBS_OUTPUT_DIR, 'Job-orphan',
+                                                     one_day_ago)
+            recent_dir = self.create_test_dir(job_submission_service.JOBS_RUN_DIR, 'Job-being-created', 0)
+            input_files_store_dir = self.create_test_dir(job_submission_service.INPUT_FILES_STORE_DIR, 'ab',
+                                                         one_day_ago)
+
+            maintenance.delete_orphan_job_dirs({'max_age_seconds': 3600})
+
+            self.assertFalse(os.path.exists(orphan_run_dir), msg='The orphan run dir was not deleted!')
+            self.assertFalse(os.path.exists(orphan_output_dir), msg='The orphan output dir was not deleted!')
+            self.assertTrue(os.path.exists(existing_job_dir), msg='The dir of an existing job must not be deleted!')
+            self.assertTrue(os.path.exists(recent_dir), msg='A recent dir must not be deleted!')
+            self.assertTrue(os.path.exists(input_files_store_dir), msg='The input files store must not be deleted!')
+
+    def test_deletes_the_old_input_files_of_the_store_that_are_not_used(self):
+        """
+        Tests that the files of the input files store that are not used by any job are deleted, but not the recent ones
+        nor the ones used by a job
+        """
+        with self.flask_app.app_context():
+            job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some url')
+            one_day_ago = 24 * 3600
+
+            old_dir = self.create_test_dir(job_submission_service.INPUT_FILES_STORE_DIR, 'aa', one_day_ago)
+            used_dir = self.create_test_dir(job_submission_service.INPUT_FILES_STORE_DIR, 'ab', one_day_ago)
+            recent_dir = self.create_test_dir(job_submission_service.INPUT_FILES_STORE_DIR, 'ac', 0)
+            used_file_path = used_dir.joinpath('some_file.txt')
+            delayed_job_models.add_input_file_to_job(job, delayed_job_models.InputFile(
+                input_key='input1', internal_path=str(used_file_path), public_url=f'/status/inputs/{job.id}/input1'))
+
+            num_deleted_got = maintenance.delete_unreferenced_input_files({'max_age_seconds': 3600})
+
+            self.assertEqual(num_deleted_got, 1, msg='Only the old file that is not used must be deleted!')
+            self.assertFalse(os.path.exists(old_dir.joinpath('some_file.txt')),
+                             msg='The old file that is not used was not deleted!')
+            self.assertTrue(os.path.exists(used_file_path), msg='A file used by a job must not be deleted!')
+            self.assertTrue(os.path.exists(recent_dir.joinpath('some_file.txt')),
+                            msg='A recent file must not be deleted, a job that uses it could be being created!')
+
+    def test_deletes_the_old_staged_input_files(self):
+        """
+        Tests that the input files left in the staging and temporary dirs are deleted when they are old
+        """
+        with self.flask_app.app_context():
+            old_staged_dir = self.create_test_dir(job_submission_service.JOBS_STAGING_DIR, 'old_upload', 7200)
+            old_tmp_dir = self.create_test_dir(job_submission_service.JOBS_TMP_DIR, 'old_upload', 7200)
+            recent_staged_dir = self.create_test_dir(job_submission_service.JOBS_STAGING_DIR, 'recent_upload', 0)
+
+            num_deleted_got = maintenance.delete_old_staged_input_files({'max_age_seconds': 3600})
+
+            self.assertEqual(num_deleted_got, 2, msg='The old staged input files were not deleted!')
+            self.assertFalse(os.path.exists(old_staged_dir), msg='The old staged input file was not deleted!')
+            self.assertFalse(os.path.exists(old_tmp_dir), msg='The old temporary input file was not deleted!')
+            self.assertTrue(os.path.exists(recent_staged_dir), msg='A submission in progress must not be affected!')
+
+    def test_deletes_the_old_outputs_of_the_status_scripts(self):
+        """
+        Tests that the outputs of the status scripts that failed are deleted when they are old
+        """
+        with self.flask_app.app_context():
+            old_outputs_dir = self.create_test_dir(daemon.AGENT_RUN_DIR, 'some_host', 7200)
+
+            num_deleted_got = maintenance.delete_old_status_scripts_outputs({'max_age_seconds': 3600})
+
+            self.assertEqual(num_deleted_got, 1, msg='The old output of the status script was not deleted!')
+            self.assertEqual(os.listdir(old_outputs_dir), [],
+                             msg='The old output of the status script was not deleted!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+This Module tests the incremental polling of the status of the jobs
+"""
+import unittest
+from types import SimpleNamespace
+
+from app import create_app
+from app.config import RUN_CONFIG
+from app.models import delayed_job_models
+from app.job_status_daemon import daemon
+from app.job_status_daemon import locks
+from app.job_status_daemon import polling_schedule
+from app import executors
+
+
+class TestPollingSchedule(unittest.TestCase):
+    """
+    Class to test the schedule of the incremental polling of the status of the jobs
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.enabled_was = polling_schedule.ENABLED
+        polling_schedule.ENABLED = True
+        polling_schedule.clear()
+
+    def tearDown(self):
+        polling_schedule.ENABLED = self.enabled_was
+        polling_schedule.clear()
+        with self.flask_app.app_context():
+            delayed_job_models.delete_all_jobs()
+
+    def test_pending_jobs_are_checked_with_exponential_backoff(self):
+        """
+        Tests that a job that stays pending is checked less and less often, up to the maximum interval
+        """
+        now = 0
+        intervals_got = []
+        for _ in range(8):
+            polling_schedule.save_status_seen(1, delayed_job_models.JobStatuses.QUEUED, now)
+            next_check_at = polling_schedule.JOBS_SCHEDULE[1]['next_check_at']
+            self.assertEqual(polling_schedule.get_jobs_due([1], next_check_at - 1), [],
+                             msg='The job must not be checked before its interval passes!')
+            self.assertEqual(polling_schedule.get_jobs_due([1], next_check_at), [1],
+                             msg='The job must be checked when its interval passes!')
+            intervals_got.append(next_check_at - now)
+            now = next_check_at
+
+        initial_interval = polling_schedule.PENDING_INITIAL_INTERVAL_SECONDS
+        factor = polling_schedule.BACKOFF_FACTOR
+        intervals_must_be = [min(initial_interval * factor ** times, polling_schedule.MAX_INTERVAL_SECONDS)
+                             for times in range(8)]
+        self.assertEqual(intervals_got, intervals_must_be, msg='The backoff of the pending job is not correct!')
+
+    def test_running_and_new_jobs_are_checked_often(self):
+        """
+        Tests that the jobs not seen yet are always due, that the running jobs are checked often and that a change of
+        status resets the backoff
+        """
+        self.assertEqual(polling_schedule.get_jobs_due([1, 2], 0), [1, 2], msg='The new jobs must be checked!')
+
+        for now in [0, 10, 30]:
+            polling_schedule.save_status_seen(1, delayed_job_models.JobStatuses.QUEUED, now)
+        polling_schedule.save_status_seen(1, delayed_job_models.JobStatuses.RUNNING, 40)
+        self.assertEqual(polling_schedule.get_jobs_due([1], 40 + polling_schedule.RUNNING_INTERVAL_SECONDS), [1],
+                         msg='A running job must be checked often!')
+
+        polling_schedule.save_status_seen(1, delayed_job_models.JobStatuses.QUEUED, 50)
+        self.assertEqual(polling_schedule.JOBS_SCHEDULE[1]['times_unchanged'], 0,
+                         msg='The backoff must start again when the status changes!')
+
+    def test_jobs_that_are_no_longer_active_are_forgotten(self):
+        """
+        Tests that the schedule of the jobs that finished is removed
+        """
+        polling_schedule.save_status_seen(1, delayed_job_models.JobStatuses.QUEUED, 0)
+        polling_schedule.save_status_seen(2, delayed_job_models.JobStatuses.QUEUED, 0)
+
+        polling_schedule.get_jobs_due([2], 0)
+        self.assertEqual(list(polling_schedule.JOBS_SCHEDULE.keys()), [2], msg='The inactive job was not forgotten!')
+
+    def test_daemon_only_checks_the_jobs_that_are_due(self):
+        """
+        Tests that in each tick the daemon only requests the status of the jobs that are due
+        """
+        lsf_host = 'some_lsf_host'
+        chunks_requested = []
+
+        def get_jobs_records(lsf_job_ids):
+            chunks_requested.append(sorted(lsf_job_ids))
+            return [{'JOBID': str(lsf_job_id), 'STAT': 'PEND', 'START_TIME': '', 'FINISH_TIME': ''}
+                    for lsf_job_id in lsf_job_ids]
+
+        get_executor_was = executors.get_executor
+        executors.get_executor = lambda: SimpleNamespace(get_host=lambda: lsf_host,
+                                                         get_jobs_records=get_jobs_records)
+        try:
+            with self.flask_app.app_context():
+                for lsf_job_id in [1, 2]:
+                    delayed_job_models.save_job(delayed_job_models.DelayedJob(
+                        id=f'Job-{lsf_job_id}', type='TEST', status=delayed_job_models.JobStatuses.QUEUED,
+                        lsf_job_id=lsf_job_id, lsf_host=lsf_host, run_environment=RUN_CONFIG.get('run_env')))
+
+                daemon.check_jobs_status()
+                daemon.check_jobs_status()
+
+                # A new job is checked in the next tick, the ones that stay pending wait for their interval
+                delayed_job_models.save_job(delayed_job_models.DelayedJob(
+                    id='Job-3', type='TEST', status=delayed_job_models.JobStatuses.QUEUED, lsf_job_id=3,
+                    lsf_host=lsf_host, run_environment=RUN_CONFIG.get('run_env')))
+                daemon.check_jobs_status()
+        finally:
+            executors.get_executor = get_executor_was
+            locks.delete_lsf_lock(lsf_host)
+
+        self.assertEqual(chunks_requested, [[1, 2], [3]], msg='Only the jobs that are due must be checked!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,18 +5,23 @@ import unittest
 import socket
 from pathlib import Path
 from datetime import datetime, timedelta
-from os import path
 import shutil
 import os
+import threading
+import time
+from types import SimpleNamespace
 
-from sqlalchemy import and_
+from sqlalchemy import and_, event
 
 from app import create_app
+from app.db import DB
 from app.models import delayed_job_models
 from app.config import RUN_CONFIG
 from app.job_status_daemon import daemon
 from app.blueprints.job_submission.services import job_submission_service
 from app.job_status_daemon import locks
+from app import ssh_connections
+from app import executors
 
 
 class TestJobStatusDaemon(unittest.TestCase):
@@ -224,6 +229,45 @@ class TestJobStatusDaemon(unittest.TestCase):
                                  msg='The jobs for which to check the status were not created correctly!')
 
 
+    def test_reads_only_the_lsf_ids_of_the_jobs_to_check(self):
+        """
+        Tests that only the lsf ids of the jobs to check are read, without loading the jobs nor committing, and that
+        the jobs that are being submitted, without an lsf id yet, are not returned
+        """
+        self.create_test_jobs_0()
+
+        with self.flask_app.app_context():
+            lsf_host = RUN_CONFIG.get('lsf_submission')['lsf_host']
+            job_being_submitted = delayed_job_models.DelayedJob(
+                id='Job-being-submitted', type='TEST', status=delayed_job_models.JobStatuses.CREATED,
+                lsf_host=lsf_host, run_environment=RUN_CONFIG.get('run_env'), raw_params='x' * 100000)
+            delayed_job_models.save_job(job_being_submitted)
+            lsf_ids_to_check_must_be = daemon.get_lsf_job_ids_to_check()
+
+            statements_done = []
+            commits_done = []
+
+            def register_query(conn, cursor, statement, *args):
+                statements_done.append(statement)
+
+            def register_commit(conn):
+                commits_done.append(conn)
+
+            event.listen(DB.engine, 'before_cursor_execute', register_query)
+            event.listen(DB.engine, 'commit', register_commit)
+            try:
+                lsf_ids_to_check_got = daemon.get_lsf_job_ids_to_check()
+            finally:
+                event.remove(DB.engine, 'before_cursor_execute', register_query)
+                event.remove(DB.engine, 'commit', register_commit)
+
+            self.assertNotIn(None, lsf_ids_to_check_got, msg='The jobs without lsf id must not be returned!')
+            self.assertEqual(lsf_ids_to_check_got, lsf_ids_to_check_must_be, msg='The lsf ids are not the same!')
+            self.assertEqual(len(statements_done), 1, msg='The lsf ids must be read with only one query!')
+            self.assertTrue(statements_done[0].startswith('SELECT delayed_job.lsf_job_id \nFROM'),
+                            msg='Only the lsf ids must be read!')
+            self.assertEqual(commits_done, [], msg='Reading the lsf ids must not commit!')
+
     def test_produces_a_correct_job_status_check_script_path(self):
         """
         Test that produces a correct path for the job status script
@@ -241,18 +285,33 @@ class TestJobStatusDaemon(unittest.TestCase):
 
     def test_prepares_the_job_status_script(self):
         """
-        Test that the job status script is created and can be executed.
+        Test that the job status script is generated with the ids of the jobs to check.
         """
         self.create_test_jobs_0()
 
         with self.flask_app.app_context():
 
             lsf_ids_to_check = daemon.get_lsf_job_ids_to_check()
-            script_path_got = daemon.prepare_job_status_check_script(lsf_ids_to_check)
-            self.assertTrue(path.isfile(script_path_got), msg='The job status check script has not been created!')
+            script_got = daemon.prepare_job_status_check_script(lsf_ids_to_check)
+            lsf_ids_must_be = ' '.join([str(lsf_id) for lsf_id in lsf_ids_to_check])
+            self.assertIn(f'bjobs -json -o "id stat start_time finish_time" {lsf_ids_must_be}', script_got,
+                          msg='The job status check script was not generated correctly!')
+
+    def test_job_status_script_shares_the_ssh_connection(self):
+        """
+        Test that the ssh command of the job status script uses the master connection to the lsf host
+        """
+        self.create_test_jobs_0()
 
-            self.assertTrue(os.access(script_path_got, os.X_OK),
-                            msg=f'The script file for the job ({script_path_got}) is not executable!')
+        with self.flask_app.app_context():
+
+            lsf_ids_to_check = daemon.get_lsf_job_ids_to_check()
+            script_got = daemon.prepare_job_status_check_script(lsf_ids_to_check)
+
+            lsf_config = RUN_CONFIG.get('lsf_submission')
+            control_path_must_be = ssh_connections.get_control_path(lsf_config['lsf_user'], lsf_config['lsf_host'])
+            self.assertIn(f'-oControlPath={control_path_must_be}', script_got,
+                          msg='The job status script must use the shared ssh connection!')
 
     def load_sample_file(self, file_path):
         """
@@ -423,6 +482,130 @@ class TestJobStatusDaemon(unittest.TestCase):
                 output_url_got = output_file.public_url
                 self.assertIn(output_url_got, output_urls_must_be, msg='The output url was not set correctly')
 
+    def test_jobs_of_the_bjobs_records_are_loaded_with_one_query_and_committed_once(self):
+        """
+        Tests that the jobs of all the records of the output of bjobs are loaded with one query, and that their changes
+        are committed at once
+        """
+        self.create_test_jobs_0()
+
+        with self.flask_app.app_context():
+            # The jobs to check of this host have even lsf ids, the ones of another_host have odd ones
+            lsf_job_ids = [0, 2, 4]
+            records = [{'JOBID': str(lsf_job_id), 'STAT': 'RUN', 'START_TIME': 'Feb 19 11:30',
+                        'FINISH_TIME': 'Feb 19 11:30 L'} for lsf_job_id in lsf_job_ids]
+            records.append({'JOBID': '1000', 'STAT': 'RUN', 'START_TIME': 'Feb 19 11:30',
+                            'FINISH_TIME': 'Feb 19 11:30 L'})
+
+            selects_done = []
+            commits_done = []
+
+            def register_query(conn, cursor, statement, *args):
+                if statement.startswith('SELECT'):
+                    selects_done.append(statement)
+
+            def register_commit(conn):
+                commits_done.append(conn)
+
+            event.listen(DB.engine, 'before_cursor_execute', register_query)
+            event.listen(DB.engine, 'commit', register_commit)
+            try:
+                daemon.react_to_bjobs_json_output({'RECORDS': records})
+            finally:
+                event.remove(DB.engine, 'before_cursor_execute', register_query)
+                event.remove(DB.engine, 'commit', register_commit)
+
+            self.assertEqual(len(selects_done), 1, msg='The jobs must be loaded with only one query!')
+            self.assertEqual(len(commits_done), 1, msg='The changes of the jobs must be committed at once!')
+            for lsf_job_id in lsf_job_ids:
+                job = delayed_job_models.get_job_by_lsf_id(lsf_job_id)
+                self.assertEqual(job.status, delayed_job_models.JobStatuses.RUNNING,
+                                 msg='The status of the job was not changed accordingly!')
+
+    def test_a_record_that_fails_does_not_stop_the_others_and_statistics_are_saved_after_the_commit(self):
+        """
+        Tests that when the processing of a record fails, the changes of the other records of the chunk are committed,
+        and that the statistics of the jobs that ended are saved only after their changes are committed
+        """
+        self.create_test_jobs_0()
+
+        with self.flask_app.app_context():
+            failing_job = delayed_job_models.get_job_by_lsf_id(0)
+            # Its outputs can not be listed when it finishes
+            shutil.rmtree(failing_job.output_dir_path)
+            records = [{'JOBID': str(lsf_job_id), 'STAT': stat, 'START_TIME': 'Feb 19 11:30',
+                        'FINISH_TIME': 'Feb 19 11:30 L'} for lsf_job_id, stat in [(0, 'DONE'), (2, 'DONE'), (4, 'EXIT')]]
+
+            committed_statuses_when_saved = {}
+
+            def save_job_statistics(job):
+                with DB.engine.connect() as connection:
+                    committed_statuses_when_saved[job.lsf_job_id] = str(connection.execute(
+                        delayed_job_models.DelayedJob.__table__.select().where(
+                            delayed_job_models.DelayedJob.id == job.id)).first()['status'])
+
+            save_job_statistics_was = daemon.save_job_statistics
+            daemon.save_job_statistics = save_job_statistics
+            try:
+                daemon.react_to_bjobs_json_output({'RECORDS': records})
+            finally:
+                daemon.save_job_statistics = save_job_statistics_was
+
+            DB.session.expire_all()
+            self.assertEqual(delayed_job_models.get_job_by_lsf_id(0).status, delayed_job_models.JobStatuses.CREATED,
+                             msg='The changes of the record that failed must be rolled back!')
+            self.assertEqual(delayed_job_models.get_job_by_lsf_id(2).status, delayed_job_models.JobStatuses.FINISHED,
+                             msg='The other records must be processed!')
+            self.assertEqual(delayed_job_models.get_job_by_lsf_id(4).status, delayed_job_models.JobStatuses.ERROR,
+                             msg='The other records must be processed!')
+            self.assertEqual(committed_statuses_when_saved, {2: 'FINISHED', 4: 'ERROR'},
+                             msg='The statistics must be saved only for the jobs that ended, after the commit!')
+
+    def test_jobs_records_are_requested_in_concurrent_chunks(self):
+        """
+        Tests that the records of the jobs are requested in chunks of bounded size, with a bounded number of chunks
+        requested at the same time, and that a chunk that fails does not stop the others
+        """
+        lsf_job_ids = list(range(9))
+        chunks_requested = []
+        chunks_in_progress = []
+        max_chunks_in_progress = []
+        chunks_lock = threading.Lock()
+
+        def get_jobs_records(lsf_job_ids_chunk):
+            with chunks_lock:
+                chunks_requested.append(lsf_job_ids_chunk)
+                chunks_in_progress.append(lsf_job_ids_chunk)
+                max_chunks_in_progress.append(len(chunks_in_progress))
+            time.sleep(0.05)
+            with chunks_lock:
+                chunks_in_progress.remove(lsf_job_ids_chunk)
+            if 4 in lsf_job_ids_chunk:
+                raise daemon.JobStatusDaemonError('The status script failed!')
+            return [{'JOBID': str(lsf_job_id), 'STAT': 'RUN'} for lsf_job_id in lsf_job_ids_chunk]
+
+        status_agent_config = RUN_CONFIG.get('status_agent')
+        status_agent_config_was = dict(status_agent_config)
+        get_executor_was = executors.get_executor
+        status_agent_config.update({'bjobs_chunk_size': 2, 'max_concurrent_bjobs': 2})
+        executors.get_executor = lambda: SimpleNamespace(get_jobs_records=get_jobs_records)
+        try:
+            with self.flask_app.app_context():
+                records_chunks_got = list(daemon.get_jobs_records_in_chunks(lsf_job_ids))
+        finally:
+            executors.get_executor = get_executor_was
+            status_agent_config.clear()
+            status_agent_config.update(status_agent_config_was)
+
+        self.assertTrue(all(len(chunk) <= 2 for chunk in chunks_requested), msg='The chunks are too big!')
+        self.assertEqual(sorted(sum(chunks_requested, [])), lsf_job_ids, msg='Each job must be requested once!')
+        self.assertLessEqual(max(max_chunks_in_progress), 2, msg='Too many chunks were requested at the same time!')
+        self.assertEqual(len(records_chunks_got), 5, msg='The records of all the chunks must be returned!')
+        self.assertEqual(records_chunks_got.count(None), 1, msg='The chunk that failed must be returned as None!')
+        lsf_ids_got = sorted(int(record['JOBID']) for chunk in records_chunks_got if chunk is not None
+                             for record in chunk)
+        self.assertEqual(lsf_ids_got, [0, 1, 2, 3, 6, 7, 8], msg='The records of the chunks are not correct!')
+
     def test_daemon_creates_lock_when_checking_lsf(self):
         """
         Tests that the daemon creates a lock while checking LSF
@@ -470,5 +653,3 @@ class TestJobStatusDaemon(unittest.TestCase):
 
             lock_got = locks.get_lock_for_lsf_host(current_lsf_host)
             self.assertIsNone(lock_got, msg='The LSF lock was not deleted!')
-
-
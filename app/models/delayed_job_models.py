@@ -5,17 +5,46 @@ import base64
 import datetime
 import hashlib
 import json
+import os
 import shutil
 import copy
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from enum import Enum
 
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, inspect, literal_column, null, select, union_all
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
 
-from enum import Enum
 from app.db import DB
 from app.models import utils
+from app.models import job_configs_cache
+from app.models import job_status_cache
+from app.models import job_status_broker
 from app.config import RUN_CONFIG
+import app.app_logging as app_logging
 
 DAYS_TO_LIVE = 7  # Days for which the results are kept
+JOB_DELETION_CONFIG = RUN_CONFIG.get('job_deletion', {})
+
+# Read only copies of the configurations of the job types, they are the ones kept in the job configs cache
+JobConfigValues = namedtuple('JobConfigValues', ['job_type', 'docker_image_url', 'docker_registry_username',
+                                                 'docker_registry_password', 'requirements_script_path'])
+CustomJobConfigValue = namedtuple('CustomJobConfigValue', ['job_type', 'key', 'value'])
+
+# Properties of the jobs that are safe to be public
+PUBLIC_PROPERTIES = ['id', 'type', 'status', 'status_log', 'progress', 'created_at', 'started_at', 'finished_at',
+                     'raw_params', 'expires_at', 'api_initial_url', 'docker_image_url', 'timezone', 'num_failures',
+                     'status_description']
+
+# Condition of the jobs whose status is checked by the status daemons. It is used as a literal, so the databases can
+# match it with the condition of the partial index of those jobs.
+JOBS_TO_CHECK_CONDITION = "status NOT IN ('ERROR', 'FINISHED')"
+
+# Keeps, per thread, whether the changes are being grouped in a unit of work (see unit_of_work)
+UNIT_OF_WORK_STATE = threading.local()
 
 
 # pylint: disable=no-member,too-few-public-methods
@@ -130,6 +159,15 @@ class DelayedJob(DB.Model):
     input_files = DB.relationship('InputFile', backref='delayed_job', lazy=True, cascade='all, delete-orphan')
     output_files = DB.relationship('OutputFile', backref='delayed_job', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Used by the status daemons to find the jobs to check (see get_lsf_job_ids_to_check). Where the database
+        # supports it, only the jobs that are not finished are indexed, so it does not grow with the cached jobs.
+        DB.Index('ix_delayed_job_jobs_to_check', 'lsf_host', 'run_environment', 'status',
+                 postgresql_where=DB.text(JOBS_TO_CHECK_CONDITION), sqlite_where=DB.text(JOBS_TO_CHECK_CONDITION)),
+        # Used to find the jobs of the records of bjobs (see get_jobs_to_check_by_lsf_ids)
+        DB.Index('ix_delayed_job_lsf_job_id', 'lsf_job_id'),
+    )
+
     def __repr__(self):
         return f'<DelayedJob ${self.id} ${self.type} ${self.status}>'
 
@@ -138,12 +176,7 @@ class DelayedJob(DB.Model):
         Returns a dictionary representation of the object with all the fields that are safe to be public
         :param server_base_url: url to use as base for building the output files urls
         """
-        plain_properties = {key: str(getattr(self, key)) for key in ['id', 'type', 'status', 'status_log', 'progress',
-                                                                     'created_at', 'started_at', 'finished_at',
-                                                                     'raw_params',
-                                                                     'expires_at', 'api_initial_url',
-                                                                     'docker_image_url',
-                                                                     'timezone', 'num_failures', 'status_description']}
+        plain_properties = {key: str(getattr(self, key)) for key in PUBLIC_PROPERTIES}
 
         input_files_urls = utils.get_input_files_dict(self.input_files, server_base_url)
         output_files_urls = utils.get_output_files_dict(self.output_files, server_base_url)
@@ -211,16 +244,115 @@ def generate_job_id(job_type, job_params, docker_image_url, input_files_hashes={
 
 def get_job_config(job_type):
     """
-    returns the job config for the job whose type is received as parameter
+    returns the job config for the job whose type is received as parameter. It is read from the job configs cache.
     :param job_type: type of job for which get the config
-    :return: config object corresponding to the type given
+    :return: read only copy (JobConfigValues) of the config corresponding to the type given
     """
-    job_config = DefaultJobConfig.query.filter_by(job_type=job_type).first()
+    job_config = job_configs_cache.get((job_type, 'default'), lambda: load_job_config(job_type))
     if job_config is None:
         raise JobConfigNotFoundError(f'No configuration was found for {job_type} jobs')
     return job_config
 
 
+def load_job_config(job_type):
+    """
+    :param job_type: type of job for which load the config
+    :return: read only copy (JobConfigValues) of the config in the database, None if it does not exist
+    """
+    job_config = DefaultJobConfig.query.filter_by(job_type=job_type).first()
+    if job_config is None:
+        return None
+
+    return JobConfigValues(
+        job_type=job_config.job_type,
+        docker_image_url=job_config.docker_image_url,
+        docker_registry_username=job_config.docker_registry_username,
+        docker_registry_password=job_config.docker_registry_password,
+        requirements_script_path=job_config.requirements_script_path
+    )
+
+
+def invalidate_job_configs_cache(job_type=None):
+    """
+    Makes the configs of the job type given to be read again from the database, it must be called after changing them
+    :param job_type: job type for which to invalidate the configs, None to invalidate all of them
+    :return: the number of configs that were removed from the cache
+    """
+    return job_configs_cache.invalidate(job_type)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Groups in one transaction all the changes done to the jobs inside it. While it is active, the functions of this
+    module that save changes only add them to the session, and they are committed once when it finishes. If there is
+    an error, all the changes are rolled back and the error is raised again. A unit of work inside another one is
+    part of the outer one.
+    """
+    if in_unit_of_work():
+        yield
+        return
+
+    UNIT_OF_WORK_STATE.active = True
+    UNIT_OF_WORK_STATE.changed_job_ids = set()
+    try:
+        yield
+        DB.session.commit()
+        notify_jobs_changed(UNIT_OF_WORK_STATE.changed_job_ids)
+    except Exception:
+        DB.session.rollback()
+        raise
+    finally:
+        UNIT_OF_WORK_STATE.active = False
+        UNIT_OF_WORK_STATE.changed_job_ids = set()
+
+
+@contextmanager
+def savepoint():
+    """
+    Groups the changes done inside it in a savepoint of the current transaction. If there is an error, only those
+    changes are rolled back and the error is raised again, the changes done before in the transaction are kept.
+    """
+    nested_transaction = DB.session.begin_nested()
+    try:
+        yield
+        nested_transaction.commit()
+    except Exception:
+        nested_transaction.rollback()
+        raise
+
+
+def in_unit_of_work():
+    """
+    :return: True if the changes are being grouped in a unit of work in this thread, False otherwise
+    """
+    return getattr(UNIT_OF_WORK_STATE, 'active', False)
+
+
+def commit_changes(*changed_job_ids):
+    """
+    Commits the changes in the session, unless they are grouped in a unit of work. In that case they will be committed
+    when it finishes. The jobs changed are notified after the changes are committed (see notify_jobs_changed).
+    :param changed_job_ids: ids of the jobs that were changed
+    """
+    if in_unit_of_work():
+        UNIT_OF_WORK_STATE.changed_job_ids.update(changed_job_ids)
+        return
+
+    DB.session.commit()
+    notify_jobs_changed(changed_job_ids)
+
+
+def notify_jobs_changed(job_ids):
+    """
+    Removes the cached statuses of the jobs given and wakes up the requests waiting for them to change. It must be
+    called after the changes are committed.
+    :param job_ids: iterable with the ids of the jobs that changed
+    """
+    job_status_cache.invalidate(job_ids)
+    job_status_broker.publish_changes(job_ids)
+
+
 def get_or_create(job_type, job_params, docker_image_url, input_files_hashes={}):
     """
     Based on the type and the parameters given, returns a job if it exists, if not it creates it and returns it.
@@ -229,45 +361,176 @@ def get_or_create(job_type, job_params, docker_image_url, input_files_hashes={})
     :param input_files_hashes:
     :return: the job corresponding to those parameters.
     """
+    job, _ = create_job_if_not_exists(job_type, job_params, docker_image_url, input_files_hashes)
+    return job
+
+
+def create_job_if_not_exists(job_type, job_params, docker_image_url, input_files_hashes={}):
+    """
+    Creates the job with the type and the parameters given if it does not exist. The job is inserted with one atomic
+    statement, so when the same job is created at the same time by several workers, only one of them creates it and
+    the others get the existing one.
+    :param job_type: type of job to create
+    :param job_params: parameters of the job
+    :param docker_image_url: image of the container to use
+    :param input_files_hashes: dict with the hashes of the input files
+    :return: a tuple with the job and a boolean that is True if it was created by this call
+    """
     job_id = generate_job_id(job_type, job_params, docker_image_url, input_files_hashes)
+    job_values = {
+        'id': job_id,
+        'type': job_type,
+        'raw_params': json.dumps(job_params, sort_keys=True),
+        'docker_image_url': docker_image_url,
+        'run_environment': RUN_CONFIG.get('run_env')
+    }
+    # A deletion of the same job that is pending in the session must be done before trying to insert it
+    DB.session.flush()
+    job_was_created = insert_job_if_not_exists(job_values)
+    if not job_was_created and delete_job_if_expired(job_id):
+        job_was_created = insert_job_if_not_exists(job_values)
+    commit_changes(job_id)
+
+    job = DelayedJob.query.filter_by(id=job_id).first()
+    return job, job_was_created
+
+
+def insert_job_if_not_exists(job_values):
+    """
+    Inserts a job with one statement that does nothing if a job with the same id already exists. It uses
+    INSERT ... ON CONFLICT DO NOTHING in PostgreSQL, INSERT OR IGNORE in SQLite and INSERT IGNORE in MySQL. In other
+    databases the insert is done in a savepoint that is rolled back if the job already exists.
+    :param job_values: dict with the values of the columns of the job
+    :return: True if the job was inserted, False if it already existed
+    """
+    jobs_table = DelayedJob.__table__
+    dialect_name = DB.engine.dialect.name
+
+    if dialect_name == 'postgresql':
+        insert_statement = postgresql.insert(jobs_table).values(**job_values).on_conflict_do_nothing(
+            index_elements=[jobs_table.c.id]).returning(jobs_table.c.id)
+        return DB.session.execute(insert_statement).first() is not None
+
+    if dialect_name in ['sqlite', 'mysql']:
+        ignore_prefix = 'OR IGNORE' if dialect_name == 'sqlite' else 'IGNORE'
+        insert_statement = jobs_table.insert().prefix_with(ignore_prefix).values(**job_values)
+        return DB.session.execute(insert_statement).rowcount == 1
+
+    savepoint = DB.session.begin_nested()
+    try:
+        DB.session.execute(jobs_table.insert().values(**job_values))
+        savepoint.commit()
+        return True
+    except IntegrityError:
+        savepoint.rollback()
+        return False
+
+
+def delete_job_if_expired(job_id):
+    """
+    Deletes the job with the id given if it expired and the status daemons have not deleted it yet, so a new job
+    with the same id can be created. The changes are not committed.
+    :param job_id: id of the job
+    :return: True if the job was deleted, False otherwise
+    """
+    is_expired = DelayedJob.expires_at < datetime.datetime.utcnow()
+    expired_job = DelayedJob.query.filter(and_(DelayedJob.id == job_id, is_expired)).first()
+    if expired_job is None:
+        return False
+
+    DB.session.delete(expired_job)
+    DB.session.flush()
+    return True
 
-    existing_job = DelayedJob.query.filter_by(id=job_id).first()
-    if existing_job is not None:
-        return existing_job
 
+def claim_job_for_resubmission(job):
+    """
+    Changes the status of a job that must be submitted again to CREATED, only if it has not changed since it was read.
+    It is done with one conditional update, so when several workers decide at the same time to submit again the same
+    job, only one of them claims it. The creation date is set to now, so the recovery of the jobs whose submission did
+    not finish (see claim_job_for_recovery) does not take it while it is being submitted.
+    :param job: job to claim, as it was read
+    :return: True if the job was claimed, False if it was changed by another worker before
+    """
+    claimed_at = datetime.datetime.utcnow()
+    num_claimed = DelayedJob.query.filter_by(id=job.id, status=job.status, num_failures=job.num_failures).update(
+        {DelayedJob.status: JobStatuses.CREATED, DelayedJob.created_at: claimed_at}, synchronize_session=False)
+    commit_changes(job.id)
+    if num_claimed == 0:
+        return False
+
+    job.status = JobStatuses.CREATED
+    job.created_at = claimed_at
+    return True
+
+
+def claim_job_for_recovery(job_id, created_before):
+    """
+    Claims a job whose submission did not finish to submit it again. It is done with one conditional update that sets
+    its creation date to now, so when several server processes recover the jobs at the same time, only one of them
+    claims each job, and the job is not recovered again until it is old enough.
+    :param job_id: id of the job to claim
+    :param created_before: the job is claimed only if it is still in CREATED status and was created before this date
+    :return: True if the job was claimed, False if it was claimed or changed by another worker before
+    """
+    num_claimed = DelayedJob.query.filter(
+        and_(DelayedJob.id == job_id, DelayedJob.status == JobStatuses.CREATED, DelayedJob.created_at < created_before)
+    ).update({DelayedJob.created_at: datetime.datetime.utcnow()}, synchronize_session=False)
+    commit_changes(job_id)
+    return num_claimed == 1
+
+
+def build_job(job_id, job_type, job_params, docker_image_url):
+    """
+    Builds a new job object, it is not added to the database.
+    :param job_id: id of the job
+    :param job_type: type of the job
+    :param job_params: parameters of the job
+    :param docker_image_url: image of the container to use
+    :return: the new job object
+    """
     run_environment = RUN_CONFIG.get('run_env')
-    job = DelayedJob(id=job_id, type=job_type, raw_params=json.dumps(job_params, sort_keys=True),
-                     docker_image_url=docker_image_url, run_environment=run_environment)
+    return DelayedJob(id=job_id, type=job_type, raw_params=json.dumps(job_params, sort_keys=True),
+                      docker_image_url=docker_image_url, run_environment=run_environment)
 
-    DB.session.add(job)
-    DB.session.commit()
-    return job
+
+def get_jobs_by_ids(job_ids):
+    """
+    Returns the jobs with the ids given using only one query. It does not check if they are expired.
+    :param job_ids: list of the ids of the jobs
+    :return: a dict with the jobs found by their id
+    """
+    jobs = DelayedJob.query.filter(DelayedJob.id.in_(job_ids)).all()
+    return {job.id: job for job in jobs}
+
+
+def save_jobs_in_one_transaction(jobs_to_save):
+    """
+    Saves the jobs given in one transaction
+    :param jobs_to_save: list of jobs to update
+    """
+    with unit_of_work():
+        DB.session.add_all(jobs_to_save)
+        commit_changes(*[job.id for job in jobs_to_save])
 
 
 def get_job_by_id(job_id, force_refresh=False):
     """
-    returns a job by its id, if the job was found but expired it deletes it (lazy cache) and raises an error
+    returns a job by its id. The jobs that expired are not returned, they are deleted later by the status daemons
+    (see job_status_daemon.maintenance), so reading a job never writes to the database.
     :param job_id: id of the job
     :param force_refresh: force a refresh on the object
-    :return: job given an id, raises JobNotFoundError if it does not exist
+    :return: job given an id, raises JobNotFoundError if it does not exist or it expired
     """
     if force_refresh:
         DB.session.commit()
         DB.session.expire_all()
 
-    job = DelayedJob.query.filter_by(id=job_id).first()
+    job = DelayedJob.query.filter(and_(DelayedJob.id == job_id, is_not_expired())).first()
 
     if job is None:
         raise JobNotFoundError(f'The job with id {job_id} does not exist!')
 
-    expiration_date = job.expires_at
-    if expiration_date is not None:
-        current_time = datetime.datetime.utcnow()
-        job_expired = expiration_date < current_time
-        if job_expired:
-            delete_job(job)
-            raise JobNotFoundError(f'The job with id {job_id} does not exist!')
-
     if force_refresh:
         DB.session.commit()
         DB.session.expire(job)
@@ -276,6 +539,100 @@ def get_job_by_id(job_id, force_refresh=False):
     return job
 
 
+def is_not_expired():
+    """
+    :return: the condition of the queries that hides the jobs that expired, until the status daemons delete them
+    """
+    return or_(DelayedJob.expires_at.is_(None), DelayedJob.expires_at >= datetime.datetime.utcnow())
+
+
+def get_job_public_dict(job_id, server_base_url='http://0.0.0.0:5000'):
+    """
+    Returns the same dict as DelayedJob.public_dict for the job with the id given, but reading the job and the urls of
+    its files with only one query, without loading the job in the session. It is used to answer the status requests.
+    :param job_id: id of the job
+    :param server_base_url: url to use as base for building the output files urls
+    :return: a dict with the public properties of the job, raises JobNotFoundError if it does not exist or it expired
+    """
+    public_dicts = get_jobs_public_dicts([job_id], server_base_url)
+    if job_id not in public_dicts:
+        raise JobNotFoundError(f'The job with id {job_id} does not exist!')
+
+    return public_dicts[job_id]
+
+
+def get_jobs_public_dicts(job_ids, server_base_url='http://0.0.0.0:5000'):
+    """
+    Returns the same dicts as DelayedJob.public_dict for the jobs with the ids given. The jobs and the urls of their
+    files are read with only one query, without loading the jobs in the session. Nothing is written to the database.
+    :param job_ids: list of the ids of the jobs
+    :param server_base_url: url to use as base for building the output files urls
+    :return: a dict with the public properties of the jobs found by their id, the ones that expired are not returned
+    """
+    jobs_table = DelayedJob.__table__
+    input_files_table = InputFile.__table__
+    output_files_table = OutputFile.__table__
+
+    job_files = union_all(
+        select([input_files_table.c.job_id, literal_column("'input'").label('file_kind'),
+                input_files_table.c.id.label('file_id'), input_files_table.c.input_key,
+                input_files_table.c.public_url]).where(input_files_table.c.job_id.in_(job_ids)),
+        select([output_files_table.c.job_id, literal_column("'output'"), output_files_table.c.id, null(),
+                output_files_table.c.public_url]).where(output_files_table.c.job_id.in_(job_ids))
+    ).alias('job_files')
+
+    status_query = select(
+        [jobs_table.c[key] for key in PUBLIC_PROPERTIES] + [job_files.c.file_kind, job_files.c.input_key,
+                                                            job_files.c.public_url]
+    ).select_from(
+        jobs_table.outerjoin(job_files, job_files.c.job_id == jobs_table.c.id)
+    ).where(
+        and_(jobs_table.c.id.in_(job_ids), is_not_expired())
+    ).order_by(jobs_table.c.id, job_files.c.file_kind, job_files.c.file_id)
+
+    rows_by_job_id = {}
+    for row in DB.session.execute(status_query):
+        rows_by_job_id.setdefault(row['id'], []).append(row)
+
+    public_dicts = {}
+    for job_id, rows in rows_by_job_id.items():
+        input_files = [row for row in rows if row['file_kind'] == 'input']
+        output_files = [row for row in rows if row['file_kind'] == 'output']
+        public_dicts[job_id] = {
+            **{key: str(rows[0][key]) for key in PUBLIC_PROPERTIES},
+            'input_files_urls': utils.get_input_files_dict(input_files, server_base_url),
+            'output_files_urls': utils.get_output_files_dict(output_files, server_base_url)
+        }
+
+    return public_dicts
+
+
+def get_job_status_version(job_id):
+    """
+    Returns a version of the status of the job computed from its public properties in the database. It is used to see
+    the changes of the jobs done by other processes when the app cache is not shared by them (see job_status_broker).
+    :param job_id: id of the job
+    :return: a text that changes when any public property of the job changes, raises JobNotFoundError if the job does
+    not exist or it expired
+    """
+    jobs_table = DelayedJob.__table__
+    version_query = select([jobs_table.c[key] for key in PUBLIC_PROPERTIES]).where(
+        and_(jobs_table.c.id == job_id, is_not_expired()))
+    job_row = DB.session.execute(version_query).first()
+    if job_row is None:
+        raise JobNotFoundError(f'The job with id {job_id} does not exist!')
+
+    return hashlib.sha256(json.dumps([str(value) for value in job_row]).encode('utf-8')).hexdigest()
+
+
+def job_exists(job_id):
+    """
+    :param job_id: id of the job
+    :return: True if the job exists and it has not expired, False otherwise
+    """
+    return DB.session.query(DelayedJob.id).filter(and_(DelayedJob.id == job_id, is_not_expired())).first() is not None
+
+
 def get_job_input_file(job_id, input_key):
     """
     :param job_id: job id that owns the input file
@@ -285,8 +642,8 @@ def get_job_input_file(job_id, input_key):
     belongs_to_job_id = InputFile.job_id == job_id
     input_key_is_this_one = InputFile.input_key == input_key
 
-    input_file = InputFile.query.filter(
-        and_(belongs_to_job_id, input_key_is_this_one)
+    input_file = InputFile.query.join(DelayedJob).filter(
+        and_(belongs_to_job_id, input_key_is_this_one, is_not_expired())
     ).first()
 
     if input_file is None:
@@ -306,6 +663,59 @@ def get_job_by_lsf_id(lsf_job_id):
     return job
 
 
+def get_job_to_check_by_lsf_id(lsf_job_id, lsf_host):
+    """
+    :param lsf_job_id: id of the job in the lsf cluster
+    :param lsf_host: lsf host where the job was submitted
+    :return: the job with the lsf id given among the jobs to check of the host (see get_jobs_to_check_condition),
+    raises JobNotFoundError if it does not exist
+    """
+    jobs_by_lsf_id = get_jobs_to_check_by_lsf_ids([lsf_job_id], lsf_host)
+    job = jobs_by_lsf_id.get(lsf_job_id)
+    if job is None:
+        raise JobNotFoundError()
+    return job
+
+
+def get_jobs_to_check_by_lsf_ids(lsf_job_ids, lsf_host):
+    """
+    Loads the jobs with the lsf ids given with only one query. Only the jobs to check of the host are loaded (see
+    get_jobs_to_check_condition), the lsf ids can be reused by other hosts and by the jobs that already finished, for
+    example the pids of the local executor. If several jobs still have the same lsf id, the last one created is
+    returned.
+    :param lsf_job_ids: list of ids of jobs in the lsf cluster
+    :param lsf_host: lsf host where the jobs were submitted
+    :return: a dict with the jobs found by their lsf id
+    """
+    if len(lsf_job_ids) == 0:
+        return {}
+
+    jobs_query = DelayedJob.query.filter(
+        and_(DelayedJob.lsf_job_id.in_(lsf_job_ids), get_jobs_to_check_condition(lsf_host))
+    ).order_by(DelayedJob.created_at)
+    return {job.lsf_job_id: job for job in jobs_query}
+
+
+def create_missing_indexes():
+    """
+    Creates the indexes of the tables that do not exist in the database. DB.create_all only creates the indexes of the
+    tables it creates, this is used to add the new indexes to the tables of an existing database. It can be run
+    several times.
+    :return: a list with the names of the indexes that were created
+    """
+    inspector = inspect(DB.engine)
+    indexes_created = []
+    for table in DB.metadata.sorted_tables:
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda table_index: table_index.name):
+            if index.name in existing_indexes:
+                continue
+            index.create(bind=DB.engine)
+            indexes_created.append(index.name)
+
+    return indexes_created
+
+
 def generate_default_job_configs():
     """
     Generates a default set of job configurations, useful for testing.
@@ -371,11 +781,9 @@ def get_docker_image_url(job_type):
     :param job_type: job type for which to get the image url
     :return: the url of the docker image to use for this type of job
     """
-    docker_image = DefaultJobConfig.query.filter_by(job_type=job_type).first()
-
-    if docker_image is not None:
-        return docker_image.docker_image_url
-    else:
+    try:
+        return get_job_config(job_type).docker_image_url
+    except JobConfigNotFoundError:
         raise DockerImageNotSet(f'There is no image container url set for jobs of type {job_type}')
 
 
@@ -410,7 +818,7 @@ def update_job_progress(job_id, progress, status_log, status_description):
     if status_description is not None:
         job.status_description = status_description
 
-    DB.session.commit()
+    commit_changes(job_id)
     return job
 
 
@@ -422,7 +830,7 @@ def add_input_file_to_job(job, input_file):
     """
     job.input_files.append(input_file)
     DB.session.add(input_file)
-    DB.session.commit()
+    commit_changes(job.id)
 
 
 def add_output_file_to_job(job, output_file):
@@ -433,94 +841,170 @@ def add_output_file_to_job(job, output_file):
     """
     job.output_files.append(output_file)
     DB.session.add(output_file)
-    DB.session.commit()
+    commit_changes(job.id)
 
 
 def save_job(job):
     """
-    Saves a job to the database, making sure to commit its current status.
+    Saves a job to the database, making sure to commit its current status. Inside a unit of work, it is committed when
+    the unit of work finishes.
     :param job: job to save.
     """
     DB.session.add(job)
-    DB.session.commit()
+    commit_changes(job.id)
 
 
 def delete_job(job):
     """
-    Deletes a job from the database, making sure to commit the changes.
+    Deletes a job from the database, making sure to commit the changes. Inside a unit of work, they are committed when
+    the unit of work finishes.
     :param job: job to delete.
     """
+    job_id = job.id
     DB.session.delete(job)
-    DB.session.commit()
+    commit_changes(job_id)
 
 
 def delete_all_jobs():
     """
     Deletes all jobs in the database.
     """
+    job_ids = [job_id for job_id, in DB.session.query(DelayedJob.id)]
     DelayedJob.query.filter_by().delete()
-    DB.session.commit()
+    commit_changes(*job_ids)
 
 
-def delete_all_expired_jobs():
+def get_referenced_input_files_paths(input_files_paths):
     """
-    Deletes all the jobs that have expired
+    :param input_files_paths: list of paths of files of the input files store
+    :return: a set with the paths of the list given that are used by any job, expired or not. The input files store is
+    content addressed, so several jobs can share the same input file.
+    """
+    return {internal_path for internal_path, in DB.session.query(InputFile.internal_path).filter(
+        InputFile.internal_path.in_(input_files_paths)).distinct()}
+
+
+def log_deletion_progress(num_deleted_so_far):
+    """
+    Logs the progress of a deletion of jobs
+    :param num_deleted_so_far: number of jobs deleted so far
+    """
+    app_logging.info(f'Deleted {num_deleted_so_far} jobs so far')
+
+
+def delete_jobs_and_their_files(jobs_condition, report_progress=None, chunk_size=None):
+    """
+    Deletes the jobs that meet the condition given with their run and output dirs. The files of the input files store
+    that are no longer used are deleted later by a maintenance task (see maintenance.delete_unreferenced_input_files),
+    so they are not deleted while a submission that has not committed its job yet reuses them. The jobs are deleted in
+    chunks of job_deletion.chunk_size, with set based deletes of the jobs and their files, and one commit per chunk.
+    The rows of each chunk are locked until they are deleted, so a job can not be created again with the same id, and
+    the same dirs, while its dirs are being deleted. The dirs of each chunk are deleted in parallel by
+    job_deletion.max_dir_deletion_threads threads, before the rows of the chunk are deleted, so if the deletion is
+    interrupted, running it again deletes the jobs that were left and their dirs.
+    :param jobs_condition: condition of the query of the jobs to delete
+    :param report_progress: function called after each chunk with the number of jobs deleted so far, if None the
+    progress is logged. The next chunk is not deleted until it returns, so it can also limit the deletion rate.
+    :param chunk_size: number of jobs deleted in each chunk, if None job_deletion.chunk_size is used
     :return: the number of jobs that were deleted.
     """
-    now = datetime.datetime.utcnow()
-    jobs_to_delete = DelayedJob.query.filter(DelayedJob.expires_at < now)
+    if report_progress is None:
+        report_progress = log_deletion_progress
+
+    if chunk_size is None:
+        chunk_size = JOB_DELETION_CONFIG.get('chunk_size', 1000)
+    max_dir_deletion_threads = JOB_DELETION_CONFIG.get('max_dir_deletion_threads', 8)
+
     num_deleted = 0
-    for job in jobs_to_delete:
-        run_dir_path = job.run_dir_path
-        output_dir_path = job.output_dir_path
-        delete_job(job)
-        shutil.rmtree(run_dir_path, ignore_errors=True)
-        shutil.rmtree(output_dir_path, ignore_errors=True)
-        num_deleted += 1
+    with ThreadPoolExecutor(max_workers=max_dir_deletion_threads) as dirs_deleter:
+        while True:
+            # The rows stay locked until the chunk is committed, the submissions that want to create or submit again
+            # any of these jobs wait until they are deleted
+            jobs_chunk = DB.session.query(DelayedJob.id, DelayedJob.run_dir_path, DelayedJob.output_dir_path).filter(
+                jobs_condition).order_by(DelayedJob.id).limit(chunk_size).with_for_update().all()
+            if len(jobs_chunk) == 0:
+                break
+
+            job_ids = [job_id for job_id, _, _ in jobs_chunk]
+            dirs_paths = [dir_path for _, run_dir_path, output_dir_path in jobs_chunk
+                          for dir_path in [run_dir_path, output_dir_path] if dir_path is not None]
+            # list() waits for all the dirs of the chunk, so the rows are only deleted after their dirs
+            list(dirs_deleter.map(lambda dir_path: shutil.rmtree(dir_path, ignore_errors=True), dirs_paths))
+
+            InputFile.query.filter(InputFile.job_id.in_(job_ids)).delete(synchronize_session=False)
+            OutputFile.query.filter(OutputFile.job_id.in_(job_ids)).delete(synchronize_session=False)
+            num_deleted += DelayedJob.query.filter(DelayedJob.id.in_(job_ids)).delete(synchronize_session=False)
+            commit_changes(*job_ids)
+            report_progress(num_deleted)
 
     return num_deleted
 
 
-def delete_all_jobs_by_type(job_type):
+def get_existing_job_ids(job_ids):
+    """
+    :param job_ids: list of ids of jobs
+    :return: a set with the ids of the list given that belong to existing jobs, expired or not
+    """
+    return {job_id for job_id, in DB.session.query(DelayedJob.id).filter(DelayedJob.id.in_(job_ids))}
+
+
+def delete_all_expired_jobs(report_progress=None, chunk_size=None):
     """
     Deletes all the jobs that have expired
+    :param report_progress: function called with the number of jobs deleted so far, see delete_jobs_and_their_files
+    :param chunk_size: number of jobs deleted in each chunk, see delete_jobs_and_their_files
     :return: the number of jobs that were deleted.
     """
-    jobs_to_delete = DelayedJob.query.filter_by(type=job_type)
-    num_deleted = 0
-    for job in jobs_to_delete:
-        run_dir_path = job.run_dir_path
-        output_dir_path = job.output_dir_path
-        delete_job(job)
-        shutil.rmtree(run_dir_path, ignore_errors=True)
-        shutil.rmtree(output_dir_path, ignore_errors=True)
-        num_deleted += 1
+    return delete_jobs_and_their_files(DelayedJob.expires_at < datetime.datetime.utcnow(), report_progress,
+                                       chunk_size)
+
+
+def delete_expired_jobs_by_ids(job_ids):
+    """
+    Deletes with their files the jobs with the ids given that have expired, so they can be created again
+    :param job_ids: list of the ids of the jobs
+    :return: the number of jobs that were deleted.
+    """
+    is_expired = DelayedJob.expires_at < datetime.datetime.utcnow()
+    return delete_jobs_and_their_files(and_(DelayedJob.id.in_(job_ids), is_expired),
+                                       report_progress=lambda num_deleted_so_far: None)
 
-    return num_deleted
+
+def delete_all_jobs_by_type(job_type, report_progress=None):
+    """
+    Deletes all the jobs of the type given
+    :param job_type: type of the jobs to delete
+    :param report_progress: function called with the number of jobs deleted so far, see delete_jobs_and_their_files
+    :return: the number of jobs that were deleted.
+    """
+    return delete_jobs_and_their_files(DelayedJob.type == job_type, report_progress)
 
 
 def get_custom_config_values(job_type):
     """
     :param job_type: type of the job for which to get the custom configs
-    :return: the objects representing the key-value pairs of the custom config of a job type
+    :return: read only copies (CustomJobConfigValue) of the key-value pairs of the custom config of a job type. They
+    are read from the job configs cache.
     """
-    return CustomJobConfig.query.filter_by(job_type=job_type)
+    return job_configs_cache.get((job_type, 'custom'), lambda: load_custom_config_values(job_type))
 
 
-def get_lsf_job_ids_to_check(lsf_host):
+def load_custom_config_values(job_type):
     """
-    :param lsf_host: lsf host for which to return the jobs to check
-    :return: a list of LSF job IDs for which it is necessary check the status in the LSF cluster. The jobs that are
-    checked are the ones that:
-    1. Were submitted to the same LSF cluster that I am running with (defined in configuration)
-    2. Are not in Error or Finished state.
+    :param job_type: type of the job for which to load the custom configs
+    :return: a tuple with read only copies (CustomJobConfigValue) of the custom configs in the database
     """
+    return tuple(CustomJobConfigValue(job_type=config.job_type, key=config.key, value=config.value)
+                 for config in CustomJobConfig.query.filter_by(job_type=job_type))
 
-    DB.session.commit()
 
-    status_is_not_error_or_finished = DelayedJob.status.notin_(
-        [JobStatuses.ERROR, JobStatuses.FINISHED]
-    )
+def get_jobs_to_check_condition(lsf_host):
+    """
+    :param lsf_host: lsf host for which to return the condition
+    :return: the condition of the jobs of the host that the status daemons must check, it matches the partial index
+    ix_delayed_job_jobs_to_check
+    """
+    status_is_not_error_or_finished = DB.text(JOBS_TO_CHECK_CONDITION)
 
     lsf_host_is_my_host = DelayedJob.lsf_host == lsf_host
 
@@ -528,17 +1012,40 @@ def get_lsf_job_ids_to_check(lsf_host):
     run_environment_is_my_current_environment = \
         DelayedJob.run_environment == current_run_environment
 
-    job_to_check_status = DelayedJob.query.filter(
-        and_(lsf_host_is_my_host, status_is_not_error_or_finished, run_environment_is_my_current_environment)
-    )
+    lsf_job_id_is_set = DelayedJob.lsf_job_id.isnot(None)
 
-    # Make sure there are no None value. This can happen when the server has created a job and is submitting it, and the
-    # same time the daemon asks for jobs to check. This makes the daemon crash.
-    ids = [job.lsf_job_id for job in job_to_check_status if job.lsf_job_id is not None]
+    return and_(lsf_host_is_my_host, status_is_not_error_or_finished, run_environment_is_my_current_environment,
+                lsf_job_id_is_set)
+
+
+def get_lsf_job_ids_to_check(lsf_host):
+    """
+    :param lsf_host: lsf host for which to return the jobs to check
+    :return: a list of LSF job IDs for which it is necessary check the status in the LSF cluster. The jobs that are
+    checked are the ones that:
+    1. Were submitted to the same LSF cluster that I am running with (defined in configuration)
+    2. Are not in Error or Finished state.
+    3. Have an LSF job ID. A job does not have it while the server is submitting it.
+    Only the LSF job IDs are read, with a connection outside of the session, so they are read from the last committed
+    state of the database without committing the session.
+    """
+    lsf_job_ids_query = select([DelayedJob.lsf_job_id]).where(get_jobs_to_check_condition(lsf_host))
+
+    with DB.engine.connect() as connection:
+        return [lsf_job_id for lsf_job_id, in connection.execute(lsf_job_ids_query)]
 
-    DB.session.commit()
 
-    return ids
+def get_jobs_pending_submission(created_before):
+    """
+    :param created_before: only the jobs created before this date are returned
+    :return: the jobs of the current run environment that were created but whose submission to LSF did not finish
+    """
+    current_run_environment = RUN_CONFIG.get('run_env')
+    return DelayedJob.query.filter(
+        and_(DelayedJob.status == JobStatuses.CREATED,
+             DelayedJob.created_at < created_before,
+             DelayedJob.run_environment == current_run_environment)
+    ).all()
 
 
 def add_output_to_job(job, internal_path, public_url):
@@ -0,0 +1,136 @@
+"""
+Module that keeps in memory the configurations of the job types, so the submission of the jobs does not query them
+from the database every time. The values expire after a time, so the changes done in the database by other processes
+are eventually seen, and they can be invalidated explicitly when the configuration is changed.
+Each value is saved with the generations of its job type that were current before loading it, and it is only used while
+they do not change. Invalidating increases the generations, so a value loaded before an invalidation is not used after
+it even if it finished loading later. When the app cache is shared by all the processes (redis or memcached), the
+generations are also kept in it, so an invalidation done by one process is seen by all of them.
+"""
+import threading
+import time
+
+from app.cache import CACHE, app_cache_is_shared
+from app.config import RUN_CONFIG
+
+JOB_CONFIGS_CACHE_CONFIG = RUN_CONFIG.get('job_configs_cache', {})
+JOB_CONFIGS_CACHE_ENABLED = JOB_CONFIGS_CACHE_CONFIG.get('enabled', True)
+TTL_SECONDS = JOB_CONFIGS_CACHE_CONFIG.get('ttl_seconds', 300)
+
+GENERATIONS_ARE_SHARED = app_cache_is_shared()
+GENERATION_KEY_PREFIX = 'job_configs_generation'
+# Key of the generation that is increased when all the job types are invalidated
+ALL_JOB_TYPES_KEY = '__all__'
+
+# The keys are tuples that start with the job type, the values are tuples (expiration_time, generations, value)
+CACHED_VALUES = {}
+# Generations of this process, by job type or ALL_JOB_TYPES_KEY. They are increased by the invalidations done here
+LOCAL_GENERATIONS = {}
+CACHE_STATS = {
+    'hits': 0,
+    'misses': 0,
+    'invalidations': 0
+}
+CACHE_LOCK = threading.Lock()
+
+
+def get_generation_key(generation_name):
+    """
+    :param generation_name: job type or ALL_JOB_TYPES_KEY
+    :return: the key of the generation in the app cache
+    """
+    return f'{GENERATION_KEY_PREFIX}:{generation_name}'
+
+
+def get_generations(job_type):
+    """
+    :param job_type: job type for which to get the generations
+    :return: a tuple with the current generations that apply to the values of the job type given
+    """
+    generation_names = [ALL_JOB_TYPES_KEY, job_type]
+    local_generations = tuple(LOCAL_GENERATIONS.get(name, 0) for name in generation_names)
+    if not GENERATIONS_ARE_SHARED:
+        return local_generations
+
+    shared_generations = CACHE.get_many(*[get_generation_key(name) for name in generation_names])
+    return local_generations + tuple(generation or 0 for generation in shared_generations)
+
+
+def get(key, load_value):
+    """
+    Returns the value saved for the key given. If it is not saved, it expired or its job type was invalidated, it is
+    loaded and saved.
+    :param key: tuple that identifies the value, its first element must be the job type
+    :param load_value: function that loads the value, if it returns None the value is not saved
+    :return: the value for the key
+    """
+    if not JOB_CONFIGS_CACHE_ENABLED:
+        return load_value()
+
+    now = time.monotonic()
+    # The generations are read before loading the value, so if it is invalidated while it is loaded it is not used
+    generations = get_generations(key[0])
+    with CACHE_LOCK:
+        cached_value = CACHED_VALUES.get(key)
+        if cached_value is not None and cached_value[0] > now and cached_value[1] == generations:
+            CACHE_STATS['hits'] += 1
+            return cached_value[2]
+        CACHE_STATS['misses'] += 1
+
+    # The value is loaded outside of the lock so the other threads are not blocked by the query
+    value = load_value()
+    if value is not None:
+        with CACHE_LOCK:
+            CACHED_VALUES[key] = (now + TTL_SECONDS, generations, value)
+
+    return value
+
+
+def invalidate(job_type=None):
+    """
+    Removes the values saved for the job type given, or all the values if no job type is given. The generation of the
+    job type is increased, so the values that were being loaded are not used and, if the app cache is shared, the
+    other processes load the values again.
+    :param job_type: job type for which to remove the values, None to remove all of them
+    :return: the number of values removed from this process
+    """
+    generation_name = ALL_JOB_TYPES_KEY if job_type is None else job_type
+    with CACHE_LOCK:
+        LOCAL_GENERATIONS[generation_name] = LOCAL_GENERATIONS.get(generation_name, 0) + 1
+        keys_to_remove = [key for key in CACHED_VALUES if job_type is None or key[0] == job_type]
+        for key in keys_to_remove:
+            del CACHED_VALUES[key]
+        CACHE_STATS['invalidations'] += 1
+
+    if GENERATIONS_ARE_SHARED:
+        generation_key = get_generation_key(generation_name)
+        # The generations never expire, memcached can not increase a key that does not exist
+        CACHE.add(generation_key, 0, timeout=0)
+        CACHE.cache.inc(generation_key)
+
+    return len(keys_to_remove)
+
+
+def clear():
+    """
+    Removes all the values and resets the counters, it is called when the app is created
+    """
+    with CACHE_LOCK:
+        CACHED_VALUES.clear()
+        LOCAL_GENERATIONS.clear()
+        for stat_name in CACHE_STATS:
+            CACHE_STATS[stat_name] = 0
+
+
+def get_stats():
+    """
+    :return: a dict with the counters of the cache and the number of values saved
+    """
+    with CACHE_LOCK:
+        return {
+            **CACHE_STATS,
+            'num_cached_values': len(CACHED_VALUES),
+            'ttl_seconds': TTL_SECONDS,
+            'enabled': JOB_CONFIGS_CACHE_ENABLED,
+            'invalidations_are_shared': GENERATIONS_ARE_SHARED
+        }
@@ -0,0 +1,112 @@
+"""
+Module that lets the status requests wait until a job changes, instead of polling the database. Each job has a
+version of its status in the app cache, it gets a new unique value every time that the job changes (see
+delayed_job_models.commit_changes). The waiting requests are woken up at once when the job changes in the same
+process, and they check the version periodically to see the changes done by other processes, for example by the
+status daemon. With an app cache shared by all the processes (redis or memcached) the version is read from the app
+cache and waiting does not query the database. With a cache kept in the memory of each process the changes done by
+the status daemon would never be seen, so the waiting requests read instead a version computed from the job in the
+database (see delayed_job_models.get_job_status_version).
+"""
+import threading
+import time
+import uuid
+
+from app.cache import CACHE, app_cache_is_shared
+from app.config import RUN_CONFIG
+import app.app_logging as app_logging
+
+LONG_POLLING_CONFIG = RUN_CONFIG.get('job_status_long_polling', {})
+MAX_WAIT_SECONDS = LONG_POLLING_CONFIG.get('max_wait_seconds', 30)
+# How often the waiting requests check the changes done by other processes
+CHECK_INTERVAL_SECONDS = LONG_POLLING_CONFIG.get('check_interval_seconds', 1)
+# The versions are kept for a while after the last change of the job, if one is lost, the waiting requests see it as
+# a change and read the status again
+VERSION_TIMEOUT_SECONDS = LONG_POLLING_CONFIG.get('version_timeout_seconds', 24 * 3600)
+
+KEY_PREFIX = 'job_status_version'
+INITIAL_VERSION = '0'
+
+JOBS_CHANGED = threading.Condition()
+# Number of times that changes have been published in this process, a waiting request compares it with the value
+# before reading the version to know if a change was published while it was reading it
+LOCAL_CHANGES = {'num_published': 0}
+
+VERSIONS_ARE_SHARED = app_cache_is_shared()
+if not VERSIONS_ARE_SHARED:
+    app_logging.warning('The versions of the statuses of the jobs are read from the database, they need an app cache '
+                        'shared by all the processes (redis or memcached) to be read from the app cache')
+
+
+def get_key(job_id):
+    """
+    :param job_id: id of the job
+    :return: the key of the version of the status of the job
+    """
+    return f'{KEY_PREFIX}:{job_id}'
+
+
+def get_version(job_id):
+    """
+    :param job_id: id of the job
+    :return: the current version of the status of the job, INITIAL_VERSION if it has not changed since the versions
+    were kept
+    """
+    return CACHE.get(get_key(job_id)) or INITIAL_VERSION
+
+
+def get_versions(job_ids):
+    """
+    :param job_ids: list of the ids of the jobs
+    :return: a dict with the current version of the status of each job, by job id
+    """
+    versions = CACHE.get_many(*[get_key(job_id) for job_id in job_ids])
+    return {job_id: version or INITIAL_VERSION for job_id, version in zip(job_ids, versions)}
+
+
+def publish_changes(job_ids):
+    """
+    Gives new versions to the statuses of the jobs given and wakes up the requests of this process waiting for them.
+    The versions are unique values instead of counters, so no change is lost when several processes publish at the
+    same time.
+    :param job_ids: iterable with the ids of the jobs that changed
+    """
+    new_versions = {get_key(job_id): uuid.uuid4().hex for job_id in job_ids}
+    if len(new_versions) == 0:
+        return
+
+    CACHE.set_many(new_versions, timeout=VERSION_TIMEOUT_SECONDS)
+
+    with JOBS_CHANGED:
+        LOCAL_CHANGES['num_published'] += 1
+        JOBS_CHANGED.notify_all()
+
+
+def wait_for_change(job_id, since_version, wait_seconds, read_version=get_version):
+    """
+    Waits until the version of the status of the job is different from the one given, or until the time given passes
+    :param job_id: id of the job
+    :param since_version: version of the status that the client has
+    :param wait_seconds: maximum time to wait, it is limited to job_status_long_polling.max_wait_seconds. None to
+    wait that time
+    :param read_version: function that returns the current version of the status of a job given its id, by default
+    the version in the app cache
+    :return: the current version of the status of the job
+    """
+    if wait_seconds is None:
+        wait_seconds = MAX_WAIT_SECONDS
+    deadline = time.monotonic() + min(wait_seconds, MAX_WAIT_SECONDS)
+    while True:
+        with JOBS_CHANGED:
+            num_published_before_reading = LOCAL_CHANGES['num_published']
+
+        # The version is read without holding the condition, so the waiting requests do not wait for each other
+        current_version = read_version(job_id)
+        seconds_left = deadline - time.monotonic()
+        if current_version != since_version or seconds_left <= 0:
+            return current_version
+
+        with JOBS_CHANGED:
+            # If a change was published in this process while reading the version, it is read again right away
+            if LOCAL_CHANGES['num_published'] == num_published_before_reading:
+                JOBS_CHANGED.wait(min(seconds_left, CHECK_INTERVAL_SECONDS))
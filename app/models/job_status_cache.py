@@ -0,0 +1,140 @@
+"""
+Module that keeps in the app cache the status responses of the jobs that finished or failed. Those jobs do not change
+until they expire, are submitted again or deleted, so their status does not need to be read from the database every
+time that it is polled. The functions of delayed_job_models that change the jobs remove their cached statuses after
+the changes are committed. Each cached status keeps the version of the status of the job (see job_status_broker) that
+was current before it was read from the database, it is only used while the job keeps that version. This way a status
+read before a change is never served after it, even if it is saved after the change was committed. The cache must be
+shared by all the processes (for example redis), otherwise the changes done by one process would not be seen by the
+others, so it is not enabled with a cache that is kept in the memory of each process.
+"""
+import datetime
+import hashlib
+import json
+
+from app.cache import CACHE, app_cache_is_shared
+from app.config import RUN_CONFIG
+from app.models import job_status_broker
+import app.app_logging as app_logging
+
+JOB_STATUS_CACHE_CONFIG = RUN_CONFIG.get('job_status_cache', {})
+TTL_SECONDS = JOB_STATUS_CACHE_CONFIG.get('ttl_seconds', 3600)
+
+KEY_PREFIX = 'job_status'
+CACHEABLE_STATUSES = ['FINISHED', 'ERROR']
+
+ENABLED = JOB_STATUS_CACHE_CONFIG.get('enabled', False)
+if ENABLED and not app_cache_is_shared():
+    app_logging.warning('The job status cache is disabled, it needs an app cache shared by all the processes '
+                        '(redis or memcached)')
+    ENABLED = False
+
+
+def get_key(job_id):
+    """
+    :param job_id: id of the job
+    :return: the key of the cached statuses of the job
+    """
+    return f'{KEY_PREFIX}:{job_id}'
+
+
+def get_etag(job_status):
+    """
+    :param job_status: dict with the status of a job
+    :return: the entity tag of the status response, it changes when any of its values changes
+    """
+    return hashlib.sha256(json.dumps(job_status, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_versions(job_ids):
+    """
+    Returns the current versions of the statuses of the jobs, they must be read before reading the statuses from the
+    database, to save them with save()
+    :param job_ids: list of the ids of the jobs
+    :return: a dict with the current version of the status of each job, by job id. Empty if the cache is disabled
+    """
+    if not ENABLED or len(job_ids) == 0:
+        return {}
+
+    return job_status_broker.get_versions(job_ids)
+
+
+def get_many(job_ids, server_base_url):
+    """
+    :param job_ids: list of the ids of the jobs
+    :param server_base_url: url used as base for building the files urls of the statuses
+    :return: a dict with the tuples of the cached status and entity tag of the jobs that are cached, by job id
+    """
+    if not ENABLED or len(job_ids) == 0:
+        return {}
+
+    # The entries and the current versions of the jobs are read at once
+    keys = [get_key(job_id) for job_id in job_ids] + [job_status_broker.get_key(job_id) for job_id in job_ids]
+    values = CACHE.get_many(*keys)
+    cached_entries = values[:len(job_ids)]
+    current_versions = values[len(job_ids):]
+
+    cached = {}
+    for job_id, cached_entry, current_version in zip(job_ids, cached_entries, current_versions):
+        if cached_entry is None or cached_entry['version'] != (current_version or job_status_broker.INITIAL_VERSION):
+            continue
+        if server_base_url in cached_entry['statuses']:
+            cached[job_id] = cached_entry['statuses'][server_base_url]
+
+    return cached
+
+
+def get(job_id, server_base_url):
+    """
+    :param job_id: id of the job
+    :param server_base_url: url used as base for building the files urls of the status
+    :return: a tuple with the cached status of the job and its entity tag, None if it is not cached or the job changed
+    after it was cached
+    """
+    return get_many([job_id], server_base_url).get(job_id)
+
+
+def save(job_id, server_base_url, job_status, etag, version):
+    """
+    Saves the status of the job if it finished or failed, it is kept until the job expires at most
+    :param job_id: id of the job
+    :param server_base_url: url used as base for building the files urls of the status
+    :param job_status: dict with the status of the job
+    :param etag: entity tag of the status response
+    :param version: version of the status of the job read before reading the status from the database (see
+    get_versions), the status is not saved if the job has changed since then
+    """
+    if not ENABLED or version is None or job_status['status'] not in CACHEABLE_STATUSES:
+        return
+
+    timeout = TTL_SECONDS
+    if job_status['expires_at'] != str(None):
+        expires_at = datetime.datetime.fromisoformat(job_status['expires_at'])
+        seconds_to_expire = int((expires_at - datetime.datetime.utcnow()).total_seconds())
+        timeout = min(timeout, seconds_to_expire)
+        if timeout < 1:
+            return
+
+    # The statuses built with different base urls are kept together, so all of them are invalidated at once
+    key = get_key(job_id)
+    cached_entry, current_version = CACHE.get_many(key, job_status_broker.get_key(job_id))
+    if (current_version or job_status_broker.INITIAL_VERSION) != version:
+        return
+
+    if cached_entry is None or cached_entry['version'] != version:
+        cached_entry = {'version': version, 'statuses': {}}
+    cached_entry['statuses'][server_base_url] = (job_status, etag)
+    CACHE.set(key, cached_entry, timeout=timeout)
+
+
+def invalidate(job_ids):
+    """
+    Removes the cached statuses of the jobs given
+    :param job_ids: iterable with the ids of the jobs
+    """
+    if not ENABLED:
+        return
+
+    keys = [get_key(job_id) for job_id in job_ids]
+    if len(keys) > 0:
+        CACHE.delete_many(*keys)
@@ -0,0 +1,68 @@
+"""
+Tests for the creation of the indexes of the database
+"""
+import unittest
+
+from sqlalchemy import event, inspect
+
+from app import create_app
+from app.db import DB
+from app.models import delayed_job_models
+
+
+class TestDBIndexes(unittest.TestCase):
+    """
+    Class to test the creation of the indexes of the database
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+
+    def get_index_names(self):
+        """
+        :return: a set with the names of the indexes of the jobs table in the database
+        """
+        return {index['name'] for index in inspect(DB.engine).get_indexes('delayed_job')}
+
+    def test_creates_the_indexes_missing_in_an_existing_database(self):
+        """
+        Tests that the indexes that do not exist are created, and that it can be run again
+        """
+        with self.flask_app.app_context():
+            jobs_table = delayed_job_models.DelayedJob.__table__
+            for index in jobs_table.indexes:
+                index.drop(bind=DB.engine)
+            self.assertEqual(self.get_index_names(), set(), msg='The indexes were not dropped!')
+
+            indexes_created = delayed_job_models.create_missing_indexes()
+            self.assertEqual(sorted(indexes_created), ['ix_delayed_job_jobs_to_check', 'ix_delayed_job_lsf_job_id'],
+                             msg='The missing indexes were not created!')
+            self.assertEqual(self.get_index_names(), {index.name for index in jobs_table.indexes},
+                             msg='The indexes are not in the database!')
+
+            self.assertEqual(delayed_job_models.create_missing_indexes(), [],
+                             msg='The indexes that exist must not be created again!')
+
+    def test_jobs_to_check_are_found_with_the_index(self):
+        """
+        Tests that the query of the jobs to check can use the partial index of the jobs that are not finished
+        """
+        with self.flask_app.app_context():
+            query_plans = []
+
+            def explain_query(conn, cursor, statement, parameters, *args):
+                if 'lsf_host' in statement:
+                    query_plans.append(str(conn.connection.execute(f'EXPLAIN QUERY PLAN {statement}',
+                                                                   parameters).fetchall()))
+
+            event.listen(DB.engine, 'before_cursor_execute', explain_query)
+            try:
+                delayed_job_models.get_lsf_job_ids_to_check('some_host')
+            finally:
+                event.remove(DB.engine, 'before_cursor_execute', explain_query)
+
+            self.assertIn('ix_delayed_job_jobs_to_check', query_plans[0], msg='The index of the jobs was not used!')
+
+
+if __name__ == '__main__':
+    unittest.main()
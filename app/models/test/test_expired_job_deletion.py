@@ -30,8 +30,11 @@ class TestExpiredJobDeletion(unittest.TestCase):
 
         os.makedirs(self.ABS_RUN_DIR_PATH, exist_ok=True)
         os.makedirs(self.ABS_OUT_DIR_PATH, exist_ok=True)
+        self.job_deletion_config_was = dict(delayed_job_models.JOB_DELETION_CONFIG)
 
     def tearDown(self):
+        delayed_job_models.JOB_DELETION_CONFIG.clear()
+        delayed_job_models.JOB_DELETION_CONFIG.update(self.job_deletion_config_was)
 
         with self.flask_app.app_context():
             delayed_job_models.delete_all_jobs()
@@ -117,3 +120,48 @@ class TestExpiredJobDeletion(unittest.TestCase):
             num_deleted_must_be = 2
             self.assertEqual(num_deleted_must_be, num_deleted_got,
                              msg='The number of deleted jobs was not calculated correctly')
+
+    def test_deletes_expired_jobs_in_chunks_and_reports_the_progress(self):
+        """
+        Tests that the expired jobs and their files are deleted in chunks, and that the progress is reported
+        """
+        with self.flask_app.app_context():
+            expired_time = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            for _ in range(5):
+                self.simulate_finished_job(expired_time)
+
+            progress_got = []
+            delayed_job_models.JOB_DELETION_CONFIG['chunk_size'] = 2
+            num_deleted_got = delayed_job_models.delete_all_expired_jobs(report_progress=progress_got.append)
+
+            self.assertEqual(num_deleted_got, 5, msg='The expired jobs were not deleted!')
+            self.assertEqual(progress_got, [2, 4, 5], msg='The progress was not reported after each chunk!')
+            self.assertEqual(delayed_job_models.OutputFile.query.count(), 0,
+                             msg='The output files of the jobs were not deleted!')
+            self.assertEqual(len(os.listdir(self.ABS_RUN_DIR_PATH)), 0, msg='Some expired run dirs were not deleted!')
+            self.assertEqual(len(os.listdir(self.ABS_OUT_DIR_PATH)), 0,
+                             msg='Some expired output dirs were not deleted!')
+
+    def test_an_interrupted_deletion_can_be_resumed(self):
+        """
+        Tests that if the deletion is interrupted, running it again deletes the jobs that were left
+        """
+        with self.flask_app.app_context():
+            expired_time = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            for _ in range(4):
+                self.simulate_finished_job(expired_time)
+
+            def interrupt_deletion(num_deleted_so_far):
+                raise KeyboardInterrupt()
+
+            delayed_job_models.JOB_DELETION_CONFIG['chunk_size'] = 3
+            with self.assertRaises(KeyboardInterrupt):
+                delayed_job_models.delete_all_expired_jobs(report_progress=interrupt_deletion)
+            self.assertEqual(delayed_job_models.DelayedJob.query.count(), 1,
+                             msg='The first chunk must have been deleted!')
+
+            num_deleted_got = delayed_job_models.delete_all_expired_jobs()
+
+            self.assertEqual(num_deleted_got, 1, msg='The jobs left were not deleted!')
+            self.assertEqual(delayed_job_models.DelayedJob.query.count(), 0, msg='The jobs left were not deleted!')
+            self.assertEqual(len(os.listdir(self.ABS_RUN_DIR_PATH)), 0, msg='Some expired run dirs were not deleted!')
@@ -0,0 +1,148 @@
+"""
+Tests for the cache of the configurations of the job types
+"""
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from app.cache import CACHE
+from app.db import DB
+from app.models import delayed_job_models
+from app.models import job_configs_cache
+
+
+class TestJobConfigsCache(unittest.TestCase):
+    """
+    Class to test the cache of the configurations of the job types
+    """
+
+    def setUp(self):
+        self.flask_app = create_app()
+        self.client = self.flask_app.test_client()
+        self.ttl_seconds_was = job_configs_cache.TTL_SECONDS
+        self.generations_are_shared_was = job_configs_cache.GENERATIONS_ARE_SHARED
+
+    def tearDown(self):
+        job_configs_cache.TTL_SECONDS = self.ttl_seconds_was
+        job_configs_cache.GENERATIONS_ARE_SHARED = self.generations_are_shared_was
+        with self.flask_app.app_context():
+            CACHE.clear()
+
+    def count_queries(self, func):
+        """
+        Runs the function given and counts the queries done to the database while it runs
+        :param func: function to run
+        :return: the number of queries done
+        """
+        queries_done = []
+
+        def register_query(*args):
+            queries_done.append(args)
+
+        event.listen(DB.engine, 'before_cursor_execute', register_query)
+        try:
+            func()
+        finally:
+            event.remove(DB.engine, 'before_cursor_execute', register_query)
+
+        return len(queries_done)
+
+    def read_job_type_configs(self):
+        """
+        Reads all the configurations that the submission of a DOWNLOAD job needs
+        """
+        delayed_job_models.get_docker_image_url('DOWNLOAD')
+        delayed_job_models.get_job_config('DOWNLOAD')
+        delayed_job_models.get_custom_config_values('DOWNLOAD')
+
+    def test_configs_are_not_queried_when_they_are_cached(self):
+        """
+        Tests that once the configs are cached, reading them does not query the database
+        """
+        with self.flask_app.app_context():
+            num_queries_first_time = self.count_queries(self.read_job_type_configs)
+            num_queries_second_time = self.count_queries(self.read_job_type_configs)
+
+            self.assertEqual(num_queries_first_time, 2, msg='The configs must be loaded the first time!')
+            self.assertEqual(num_queries_second_time, 0, msg='The cached configs must not be queried!')
+
+            stats_got = job_configs_cache.get_stats()
+            self.assertEqual(stats_got['misses'], 2, msg='The misses were not counted correctly!')
+            self.assertEqual(stats_got['hits'], 4, msg='The hits were not counted correctly!')
+
+    def test_configs_are_read_again_after_invalidating_them(self):
+        """
+        Tests that after invalidating the configs of a job type, the changes done in the database are seen
+        """
+        with self.flask_app.app_context():
+            docker_image_url_was = delayed_job_models.get_docker_image_url('DOWNLOAD')
+
+            job_config = delayed_job_models.DefaultJobConfig.query.filter_by(job_type='DOWNLOAD').first()
+            job_config.docker_image_url = 'some_new_url'
+            DB.session.commit()
+
+            self.assertEqual(delayed_job_models.get_docker_image_url('DOWNLOAD'), docker_image_url_was,
+                             msg='The cached config must be used until it is invalidated!')
+
+            delayed_job_models.invalidate_job_configs_cache('DOWNLOAD')
+            self.assertEqual(delayed_job_models.get_docker_image_url('DOWNLOAD'), 'some_new_url',
+                             msg='The config must be read again after invalidating it!')
+
+    def test_configs_are_read_again_when_they_expire(self):
+        """
+        Tests that the configs are read again from the database when they expire
+        """
+        with self.flask_app.app_context():
+            job_configs_cache.TTL_SECONDS = 0
+            self.read_job_type_configs()
+            num_queries_got = self.count_queries(self.read_job_type_configs)
+            self.assertEqual(num_queries_got, 3, msg='The expired configs must be loaded again!')
+
+    def test_missing_configs_are_not_cached(self):
+        """
+        Tests that a job type without config raises an error and that the error is not cached
+        """
+        with self.flask_app.app_context():
+            with self.assertRaises(delayed_job_models.JobConfigNotFoundError,
+                                   msg='A job type without config must raise an error!'):
+                delayed_job_models.get_job_config('UNKNOWN_TYPE')
+
+            self.assertEqual(job_configs_cache.get_stats()['num_cached_values'], 0,
+                             msg='A missing config must not be cached!')
+
+    def test_a_value_loaded_while_it_is_invalidated_is_not_used(self):
+        """
+        Tests that a value that started loading before an invalidation is not used after it
+        """
+        with self.flask_app.app_context():
+            values_loaded = []
+
+            def load_old_value_and_invalidate():
+                values_loaded.append('old_value')
+                job_configs_cache.invalidate('SOME_TYPE')
+                return 'old_value'
+
+            job_configs_cache.get(('SOME_TYPE', 'default'), load_old_value_and_invalidate)
+            value_got = job_configs_cache.get(('SOME_TYPE', 'default'), lambda: 'new_value')
+            self.assertEqual(value_got, 'new_value', msg='A value loaded before the invalidation must not be used!')
+
+    def test_invalidations_done_by_other_processes_are_seen(self):
+        """
+        Tests that when the app cache is shared, the invalidations done by other processes are seen
+        """
+        with self.flask_app.app_context():
+            job_configs_cache.GENERATIONS_ARE_SHARED = True
+            docker_image_url_was = delayed_job_models.get_docker_image_url('DOWNLOAD')
+
+            job_config = delayed_job_models.DefaultJobConfig.query.filter_by(job_type='DOWNLOAD').first()
+            job_config.docker_image_url = 'some_new_url'
+            DB.session.commit()
+            self.assertEqual(delayed_job_models.get_docker_image_url('DOWNLOAD'), docker_image_url_was,
+                             msg='The cached config must be used until it is invalidated!')
+
+            # Another process only changes the generation in the shared cache
+            generation_key = job_configs_cache.get_generation_key('DOWNLOAD')
+            CACHE.set(generation_key, 1, timeout=0)
+            self.assertEqual(delayed_job_models.get_docker_image_url('DOWNLOAD'), 'some_new_url',
+                             msg='The config must be read again after another process invalidated it!')
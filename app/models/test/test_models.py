@@ -8,7 +8,10 @@ import json
 import unittest
 from pathlib import Path
 
+from sqlalchemy import event
+
 from app import create_app
+from app.db import DB
 from app.models import delayed_job_models
 
 
@@ -128,6 +131,45 @@ class TestModels(unittest.TestCase):
             self.assertEqual(job_0.id, job_1.id, msg='A job with the same params was created twice!')
             self.assertEqual(job_1.status, status_must_be, msg='A job with the same params was created twice!')
 
+    def test_a_job_is_inserted_only_by_the_first_worker(self):
+        """
+        Tests that when the same job is created by several workers, only the first one inserts it and the others get
+        the existing job
+        """
+        with self.flask_app.app_context():
+            params = {'seconds': 1}
+            job_0, job_0_was_created = delayed_job_models.create_job_if_not_exists('TEST', params, 'some_url')
+            job_1, job_1_was_created = delayed_job_models.create_job_if_not_exists('TEST', params, 'some_url')
+
+            self.assertTrue(job_0_was_created, msg='The first worker must create the job!')
+            self.assertFalse(job_1_was_created, msg='The job must not be created twice!')
+            self.assertEqual(job_0.id, job_1.id, msg='The existing job must be returned!')
+            self.assertEqual(job_1.status, delayed_job_models.JobStatuses.CREATED,
+                             msg='The defaults of the job were not set!')
+
+    def test_a_job_is_claimed_for_resubmission_only_once(self):
+        """
+        Tests that when several workers want to submit again the same job, only one of them claims it
+        """
+        with self.flask_app.app_context():
+            job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some_url')
+            job.status = delayed_job_models.JobStatuses.ERROR
+            job.num_failures = 1
+            delayed_job_models.save_job(job)
+
+            # What another worker read before the job was claimed
+            job_read_by_other_worker = delayed_job_models.DelayedJob(id=job.id,
+                                                                     status=delayed_job_models.JobStatuses.ERROR,
+                                                                     num_failures=1)
+
+            self.assertTrue(delayed_job_models.claim_job_for_resubmission(job),
+                            msg='The first worker must claim the job!')
+            self.assertFalse(delayed_job_models.claim_job_for_resubmission(job_read_by_other_worker),
+                             msg='The job must not be claimed twice!')
+
+            job_got = delayed_job_models.get_job_by_id(job.id, force_refresh=True)
+            self.assertEqual(job_got.status, delayed_job_models.JobStatuses.CREATED, msg='The job was not claimed!')
+
     def test_2_jobs_with_the_same_params_are_actually_the_same_job(self):
         """
         test that when getting a job with some params, they point the exactly to the same job
@@ -155,7 +197,7 @@ class TestModels(unittest.TestCase):
 
     def test_does_not_return_an_expired_job(self):
         """
-        Tests that when getting a job by id, it is not returned and it is deleted if has is expired
+        Tests that when getting a job by id, it is not returned if it has expired, but it is not deleted when reading it
         """
         with self.flask_app.app_context():
             job_type = 'SIMILARITY'
@@ -181,7 +223,49 @@ class TestModels(unittest.TestCase):
                 delayed_job_models.get_job_by_id(id_got)
 
             job_got = delayed_job_models.DelayedJob.query.filter_by(id=id_got).first()
-            self.assertIsNone(job_got, msg='The job must have been deleted!')
+            self.assertIsNotNone(job_got, msg='The job must be deleted by the status daemons, not when reading it!')
+
+    def test_changes_in_a_unit_of_work_are_committed_once(self):
+        """
+        Tests that the changes done inside a unit of work are committed only once, when it finishes
+        """
+        with self.flask_app.app_context():
+            commits_done = []
+
+            def register_commit(*args):
+                commits_done.append(args)
+
+            event.listen(DB.session, 'after_commit', register_commit)
+            try:
+                with delayed_job_models.unit_of_work():
+                    job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some_url')
+                    job.status = delayed_job_models.JobStatuses.QUEUED
+                    delayed_job_models.save_job(job)
+                    delayed_job_models.add_input_file_to_job(job, delayed_job_models.InputFile(
+                        input_key='input1', internal_path='some_path'))
+            finally:
+                event.remove(DB.session, 'after_commit', register_commit)
+
+            self.assertEqual(len(commits_done), 1, msg='The changes must be committed only once!')
+            job_got = delayed_job_models.get_job_by_id(job.id, force_refresh=True)
+            self.assertEqual(job_got.status, delayed_job_models.JobStatuses.QUEUED, msg='The job was not saved!')
+            self.assertEqual(len(job_got.input_files), 1, msg='The input file was not saved!')
+
+    def test_changes_in_a_unit_of_work_are_rolled_back_on_errors(self):
+        """
+        Tests that if there is an error in a unit of work, none of its changes are saved
+        """
+        with self.flask_app.app_context():
+            job_id = None
+            with self.assertRaises(RuntimeError, msg='The error must be raised again!'):
+                with delayed_job_models.unit_of_work():
+                    job = delayed_job_models.get_or_create('TEST', {'seconds': 1}, 'some_url')
+                    job_id = job.id
+                    raise RuntimeError('Something went wrong')
+
+            self.assertFalse(delayed_job_models.in_unit_of_work(), msg='The unit of work must finish!')
+            with self.assertRaises(delayed_job_models.JobNotFoundError, msg='The job must not be saved!'):
+                delayed_job_models.get_job_by_id(job_id)
 
 
 if __name__ == '__main__':
@@ -37,4 +37,44 @@ def validate_url_params_with(validation_schema):
 
         return wrapped_func
 
-    return wrap
\ No newline at end of file
+    return wrap
+
+
+def validate_args_with(validation_schema):
+
+    def wrap(func):
+
+        @wraps(func)
+        def wrapped_func(*args, **kwargs):
+
+            validation_errors = validation_schema().validate(request.args)
+            if validation_errors:
+                abort(400, str(validation_errors))
+
+            return func(*args, **kwargs)
+
+        return wrapped_func
+
+    return wrap
+
+
+def validate_json_with(validation_schema):
+
+    def wrap(func):
+
+        @wraps(func)
+        def wrapped_func(*args, **kwargs):
+
+            json_body = request.get_json(silent=True)
+            if json_body is None:
+                abort(400, 'The body of the request must be a JSON object')
+
+            validation_errors = validation_schema().validate(json_body)
+            if validation_errors:
+                abort(400, str(validation_errors))
+
+            return func(*args, **kwargs)
+
+        return wrapped_func
+
+    return wrap
@@ -0,0 +1,103 @@
+"""
+Module that handles the templates of the scripts that submit, check and kill the jobs. The templates are loaded and
+validated once when the app starts, and the scripts are generated in memory and run by passing them to the standard
+input of bash, so no script files are written.
+"""
+import string
+import subprocess
+from pathlib import Path
+
+from app.config import RUN_CONFIG
+
+TEMPLATES_DIR = RUN_CONFIG.get('templates_dir', str(Path().absolute().joinpath('templates')))
+
+SUBMIT_JOB_TEMPLATE = 'submit_job.sh'
+GET_JOBS_STATUS_TEMPLATE = 'get_jobs_status.sh'
+KILL_JOBS_TEMPLATE = 'kill_jobs.sh'
+
+# Parameters that each template must use, the generation of the scripts provides exactly these ones
+TEMPLATES_PARAMS = {
+    SUBMIT_JOB_TEMPLATE: {'JOB_ID', 'LSF_USER', 'LSF_HOST', 'SSH_CONNECTION_OPTIONS', 'SET_DOCKER_REGISTRY_CREDENTIALS',
+                          'RESOURCES_PARAMS', 'RUN_DIR', 'DOCKER_IMAGE_URL', 'RUN_PARAMS_FILE'},
+    GET_JOBS_STATUS_TEMPLATE: {'LSF_JOB_IDS', 'LSF_USER', 'LSF_HOST', 'SSH_CONNECTION_OPTIONS'},
+    KILL_JOBS_TEMPLATE: {'LSF_JOB_IDS', 'LSF_USER', 'LSF_HOST', 'SSH_CONNECTION_OPTIONS'}
+}
+
+LOADED_TEMPLATES = {}
+
+
+class ScriptTemplateError(Exception):
+    """Base class for exceptions in this module."""
+
+
+def get_template_params(template):
+    """
+    :param template: text of the template
+    :return: the set of the names of the parameters used in the template
+    """
+    return {field_name for _, field_name, _, _ in string.Formatter().parse(template) if field_name is not None}
+
+
+def load_template(template_name):
+    """
+    Reads a template and checks that it uses exactly the parameters that are provided when generating its scripts
+    :param template_name: name of the template file
+    :return: the text of the template
+    """
+    template_path = Path(TEMPLATES_DIR).joinpath(template_name)
+    try:
+        with open(template_path, 'r') as template_file:
+            template = template_file.read()
+    except FileNotFoundError as error:
+        raise ScriptTemplateError(f'The template {template_path} does not exist!') from error
+
+    try:
+        params_got = get_template_params(template)
+    except ValueError as error:
+        raise ScriptTemplateError(f'The template {template_path} is not well formed: {error}') from error
+
+    params_must_be = TEMPLATES_PARAMS[template_name]
+    if params_got != params_must_be:
+        raise ScriptTemplateError(f'The template {template_path} must use the parameters {sorted(params_must_be)}, '
+                                  f'it uses {sorted(params_got)}')
+
+    return template
+
+
+def load_templates():
+    """
+    Loads and validates all the templates, it is called when the app starts
+    """
+    for template_name in TEMPLATES_PARAMS:
+        LOADED_TEMPLATES[template_name] = load_template(template_name)
+
+
+def get_template(template_name):
+    """
+    :param template_name: name of the template file
+    :return: the text of the template, it is loaded if it was not loaded before
+    """
+    if template_name not in LOADED_TEMPLATES:
+        LOADED_TEMPLATES[template_name] = load_template(template_name)
+    return LOADED_TEMPLATES[template_name]
+
+
+def render(template_name, **params):
+    """
+    :param template_name: name of the template file
+    :param params: values of the parameters of the template
+    :return: the text of the script generated from the template
+    """
+    return get_template(template_name).format(**params)
+
+
+def run_script(script, args):
+    """
+    Runs a script by passing it to the standard input of bash
+    :param script: text of the script
+    :param args: list of arguments for the script
+    :return: the completed process, with its stdout and stderr captured
+    """
+    # The callers check the return code themselves
+    return subprocess.run(['bash', '-s', '--', *args], input=script.encode(), stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, check=False)
@@ -0,0 +1,224 @@
+"""
+Module that shares the ssh connections to the LSF cluster between the submission and status scripts. A master
+connection is kept open per lsf user and host with the openssh ControlMaster feature, so the scripts do not do a full
+key exchange each time. If the master connection is not available, the scripts connect normally.
+"""
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from app.config import RUN_CONFIG
+import app.app_logging as app_logging
+
+CONNECTION_SHARING_CONFIG = RUN_CONFIG.get('lsf_submission', {}).get('ssh_connection_sharing', {})
+CONNECTION_SHARING_ENABLED = CONNECTION_SHARING_CONFIG.get('enabled', True)
+# The sockets must be in a local filesystem, they do not work in NFS
+CONTROL_SOCKETS_DIR = CONNECTION_SHARING_CONFIG.get(
+    'control_sockets_dir', str(Path(tempfile.gettempdir()).joinpath('delayed_jobs_ssh_control')))
+# Time that the master connection stays open after the last script that used it finished
+CONTROL_PERSIST_SECONDS = CONNECTION_SHARING_CONFIG.get('control_persist_seconds', 600)
+MASTER_CONNECTION_TIMEOUT_SECONDS = CONNECTION_SHARING_CONFIG.get('connection_timeout_seconds', 30)
+# Time during which a master connection that was seen alive is not checked again. If it dies in that time, the scripts
+# connect normally until it is checked again
+LIVENESS_CHECK_INTERVAL_SECONDS = CONNECTION_SHARING_CONFIG.get('liveness_check_interval_seconds', 30)
+# Avoids that several threads of the same process open a master connection at the same time
+MASTER_CONNECTION_LOCK = threading.Lock()
+
+# Return code of ssh when the connection fails, instead of the one of the remote command
+SSH_ERROR_RETURN_CODE = 255
+
+# The last time (time.monotonic) at which each master connection was seen alive, by its control path
+MASTER_CONNECTIONS_SEEN_ALIVE = {}
+
+
+def get_control_path(lsf_user, lsf_host):
+    """
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    :return: the path of the control socket of the master connection to the host given
+    """
+    return str(Path(CONTROL_SOCKETS_DIR).joinpath(f'{lsf_user}@{lsf_host}'))
+
+
+def control_sockets_dir_is_safe():
+    """
+    Creates the dir of the control sockets if it does not exist, and checks that only this user can use it. The dir
+    can be in a path shared by all the users, like /tmp, so if it already existed it must be a real dir owned by this
+    user. If other users can access it, its permissions are fixed.
+    :return: True if the control sockets can be kept in the dir, False otherwise
+    """
+    os.makedirs(CONTROL_SOCKETS_DIR, mode=0o700, exist_ok=True)
+    dir_stat = os.lstat(CONTROL_SOCKETS_DIR)
+    if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.getuid():
+        app_logging.error(f'Not sharing the ssh connections, {CONTROL_SOCKETS_DIR} is not a dir owned by this user')
+        return False
+
+    if stat.S_IMODE(dir_stat.st_mode) != 0o700:
+        app_logging.warning(f'Fixing the permissions of {CONTROL_SOCKETS_DIR}, only its owner must be able to use it')
+        os.chmod(CONTROL_SOCKETS_DIR, 0o700)
+
+    return True
+
+
+def get_ssh_connection_options(lsf_user, lsf_host):
+    """
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    :return: the options to add to the ssh commands of the scripts so they use the master connection. The scripts do
+    not become masters themselves, if the master connection is not available they connect normally.
+    """
+    if not CONNECTION_SHARING_ENABLED:
+        return ''
+    # A socket in a dir that other users can write could belong to a connection opened by them
+    if not control_sockets_dir_is_safe():
+        return ''
+    return f'-oControlPath={get_control_path(lsf_user, lsf_host)}'
+
+
+def get_master_connection_command(lsf_user, lsf_host, id_rsa_path, *args):
+    """
+    :param lsf_user: user to connect with
+    :param lsf_host: host to connect to
+    :param id_rsa_path: path of the identity file
+    :param args: additional arguments for ssh
+    :return: the command to run ssh with the options of the master connection
+    """
+    return ['ssh', f'{lsf_user}@{lsf_host}', '-i', id_rsa_path, '-oStrictHostKeyChecking=no',
+            f'-oControlPath={get_control_path(lsf_user, lsf_host)}', *args]
+
+
+def master_connection_is_alive(lsf_user, lsf_host, id_rsa_path):
+    """
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    :param id_rsa_path: path of the identity file
+    :return: True if the master connection is open and responding, False otherwise
+    """
+    check_command = get_master_connection_command(lsf_user, lsf_host, id_rsa_path, '-O', 'check')
+    check_process = subprocess.run(check_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return check_process.returncode == 0
+
+
+def was_seen_alive_recently(lsf_user, lsf_host):
+    """
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    :return: True if the master connection was seen alive less than LIVENESS_CHECK_INTERVAL_SECONDS ago
+    """
+    last_time_seen_alive = MASTER_CONNECTIONS_SEEN_ALIVE.get(get_control_path(lsf_user, lsf_host))
+    if last_time_seen_alive is None:
+        return False
+    return time.monotonic() - last_time_seen_alive < LIVENESS_CHECK_INTERVAL_SECONDS
+
+
+def save_seen_alive(lsf_user, lsf_host):
+    """
+    Saves that the master connection was seen alive now
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    """
+    MASTER_CONNECTIONS_SEEN_ALIVE[get_control_path(lsf_user, lsf_host)] = time.monotonic()
+
+
+def forget_seen_alive(lsf_user, lsf_host):
+    """
+    Forgets that the master connection was seen alive, so it is checked the next time that it is needed
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    """
+    MASTER_CONNECTIONS_SEEN_ALIVE.pop(get_control_path(lsf_user, lsf_host), None)
+
+
+def delete_stale_control_socket(lsf_user, lsf_host):
+    """
+    Deletes the socket of a master connection that is not listening anymore, so ssh can create a new one in its place
+    :param lsf_user: user of the connection
+    :param lsf_host: host of the connection
+    """
+    control_path = get_control_path(lsf_user, lsf_host)
+    try:
+        os.remove(control_path)
+        app_logging.debug(f'Deleted stale ssh control socket {control_path}')
+    except FileNotFoundError:
+        pass
+
+
+def ensure_master_connection(lsf_user, lsf_host, id_rsa_path):
+    """
+    Makes sure that there is a master connection open to the host, if it died it opens a new one. If the connection
+    can not be opened, the scripts will connect normally. A connection seen alive recently is not checked again, so
+    most of the calls do not run any process nor wait for the lock.
+    :param lsf_user: user to connect with
+    :param lsf_host: host to connect to
+    :param id_rsa_path: path of the identity file
+    :return: True if the master connection is available, False otherwise
+    """
+    if not CONNECTION_SHARING_ENABLED:
+        return False
+
+    if was_seen_alive_recently(lsf_user, lsf_host):
+        return True
+
+    if not control_sockets_dir_is_safe():
+        return False
+
+    with MASTER_CONNECTION_LOCK:
+        # Another thread may have checked it while this one waited for the lock
+        if was_seen_alive_recently(lsf_user, lsf_host):
+            return True
+
+        if master_connection_is_alive(lsf_user, lsf_host, id_rsa_path):
+            save_seen_alive(lsf_user, lsf_host)
+            return True
+
+        forget_seen_alive(lsf_user, lsf_host)
+
+        app_logging.debug(f'Opening ssh master connection to {lsf_user}@{lsf_host}')
+        delete_stale_control_socket(lsf_user, lsf_host)
+        # The master runs a command that does nothing and stays in background because of ControlPersist. If another
+        # process created the socket in the meantime, it just runs the command and exits. The output is not captured
+        # because the master in background would keep the pipes open.
+        master_command = get_master_connection_command(
+            lsf_user, lsf_host, id_rsa_path, '-oControlMaster=yes', f'-oControlPersist={CONTROL_PERSIST_SECONDS}',
+            f'-oConnectTimeout={MASTER_CONNECTION_TIMEOUT_SECONDS}', 'true')
+        try:
+            master_process = subprocess.run(master_command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL, timeout=MASTER_CONNECTION_TIMEOUT_SECONDS * 2,
+                                            check=False)
+        except subprocess.TimeoutExpired:
+            app_logging.error(f'Timeout when opening ssh master connection to {lsf_user}@{lsf_host}')
+            return False
+
+        if master_process.returncode != 0:
+            app_logging.error(f'Could not open ssh master connection to {lsf_user}@{lsf_host}, '
+                              f'return code: {master_process.returncode}')
+            return False
+
+        save_seen_alive(lsf_user, lsf_host)
+        return True
+
+
+def ensure_lsf_master_connection():
+    """
+    Makes sure that there is a master connection open to the lsf host set in the configuration
+    :return: True if the master connection is available, False otherwise
+    """
+    lsf_config = RUN_CONFIG.get('lsf_submission')
+    return ensure_master_connection(lsf_config['lsf_user'], lsf_config['lsf_host'], lsf_config['id_rsa_file'])
+
+
+def react_to_lsf_script_return_code(return_code):
+    """
+    If the script failed because ssh could not connect, forgets that the master connection to the lsf host was seen
+    alive, so it is checked and opened again before the next script
+    :param return_code: return code of the script that connected to the lsf host
+    """
+    if return_code != SSH_ERROR_RETURN_CODE:
+        return
+
+    lsf_config = RUN_CONFIG.get('lsf_submission')
+    forget_seen_alive(lsf_config['lsf_user'], lsf_config['lsf_host'])
@@ -0,0 +1,53 @@
+"""
+This Module tests the loading of the script templates and the running of the scripts generated from them
+"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from app import script_templates
+
+
+class TestScriptTemplates(unittest.TestCase):
+    """
+    Class to test the script templates
+    """
+
+    def setUp(self):
+        self.templates_dir_was = script_templates.TEMPLATES_DIR
+        self.loaded_templates_was = dict(script_templates.LOADED_TEMPLATES)
+
+    def tearDown(self):
+        script_templates.TEMPLATES_DIR = self.templates_dir_was
+        script_templates.LOADED_TEMPLATES.clear()
+        script_templates.LOADED_TEMPLATES.update(self.loaded_templates_was)
+
+    def test_loads_all_the_templates(self):
+        """
+        Tests that all the templates of the repository are loaded and are valid
+        """
+        script_templates.LOADED_TEMPLATES.clear()
+        script_templates.load_templates()
+        self.assertEqual(set(script_templates.LOADED_TEMPLATES.keys()), set(script_templates.TEMPLATES_PARAMS.keys()),
+                         msg='All the templates must be loaded!')
+
+    def test_fails_when_a_template_does_not_use_the_expected_parameters(self):
+        """
+        Tests that a template with parameters that are not provided when generating the scripts is rejected
+        """
+        with tempfile.TemporaryDirectory() as templates_dir:
+            Path(templates_dir).joinpath(script_templates.KILL_JOBS_TEMPLATE).write_text(
+                'ssh {LSF_USER}@{LSF_HOST} {SSH_CONNECTION_OPTIONS} bkill {LSF_JOB_IDS} {UNKNOWN_PARAM}')
+            script_templates.TEMPLATES_DIR = templates_dir
+
+            with self.assertRaises(script_templates.ScriptTemplateError,
+                                   msg='A template with unexpected parameters must be rejected!'):
+                script_templates.load_template(script_templates.KILL_JOBS_TEMPLATE)
+
+    def test_runs_a_script_from_the_standard_input(self):
+        """
+        Tests that a script is run by passing it to bash, receiving its arguments
+        """
+        script_process = script_templates.run_script('#!/usr/bin/env bash\nset -e\necho "got $1"\n', ['some_arg'])
+        self.assertEqual(script_process.returncode, 0, msg='The script must run successfully!')
+        self.assertEqual(script_process.stdout.decode(), 'got some_arg\n', msg='The script did not get its arguments!')
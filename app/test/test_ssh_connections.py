@@ -0,0 +1,111 @@
+"""
+This Module tests the sharing of the ssh connections to the LSF cluster
+"""
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from app import ssh_connections
+from app.config import RUN_CONFIG
+
+
+class TestSSHConnections(unittest.TestCase):
+    """
+    Class to test the sharing of the ssh connections
+    """
+
+    def setUp(self):
+        self.connection_sharing_enabled_was = ssh_connections.CONNECTION_SHARING_ENABLED
+        self.master_connection_is_alive_was = ssh_connections.master_connection_is_alive
+        self.control_sockets_dir_was = ssh_connections.CONTROL_SOCKETS_DIR
+        self.tmp_dir = tempfile.mkdtemp()
+        ssh_connections.CONTROL_SOCKETS_DIR = os.path.join(self.tmp_dir, 'control')
+        ssh_connections.CONNECTION_SHARING_ENABLED = True
+        ssh_connections.MASTER_CONNECTIONS_SEEN_ALIVE.clear()
+
+        self.liveness_checks_done = []
+
+        def register_liveness_check(*args):
+            self.liveness_checks_done.append(args)
+            return True
+
+        ssh_connections.master_connection_is_alive = register_liveness_check
+
+    def tearDown(self):
+        ssh_connections.CONNECTION_SHARING_ENABLED = self.connection_sharing_enabled_was
+        ssh_connections.master_connection_is_alive = self.master_connection_is_alive_was
+        ssh_connections.CONTROL_SOCKETS_DIR = self.control_sockets_dir_was
+        ssh_connections.MASTER_CONNECTIONS_SEEN_ALIVE.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_does_not_check_again_a_master_connection_seen_alive_recently(self):
+        """
+        Tests that the liveness of a master connection is checked only once in the liveness check interval
+        """
+        for _ in range(5):
+            connection_is_available = ssh_connections.ensure_master_connection('lsf_user', 'lsf_host', 'id_rsa')
+            self.assertTrue(connection_is_available, msg='The master connection must be available!')
+
+        self.assertEqual(len(self.liveness_checks_done), 1,
+                         msg='The master connection must be checked only once in the interval!')
+
+        control_path = ssh_connections.get_control_path('lsf_user', 'lsf_host')
+        ssh_connections.MASTER_CONNECTIONS_SEEN_ALIVE[control_path] -= \
+            ssh_connections.LIVENESS_CHECK_INTERVAL_SECONDS
+        ssh_connections.ensure_master_connection('lsf_user', 'lsf_host', 'id_rsa')
+        self.assertEqual(len(self.liveness_checks_done), 2,
+                         msg='The master connection must be checked again after the interval!')
+
+    def test_checks_again_the_master_connection_when_ssh_fails(self):
+        """
+        Tests that the master connection is checked again after a script fails because ssh could not connect
+        """
+        lsf_config = RUN_CONFIG.get('lsf_submission')
+        lsf_user = lsf_config['lsf_user']
+        lsf_host = lsf_config['lsf_host']
+
+        ssh_connections.ensure_master_connection(lsf_user, lsf_host, 'id_rsa')
+        ssh_connections.react_to_lsf_script_return_code(1)
+        ssh_connections.ensure_master_connection(lsf_user, lsf_host, 'id_rsa')
+        self.assertEqual(len(self.liveness_checks_done), 1,
+                         msg='A failure of the remote command must not make the connection be checked again!')
+
+        ssh_connections.react_to_lsf_script_return_code(ssh_connections.SSH_ERROR_RETURN_CODE)
+        ssh_connections.ensure_master_connection(lsf_user, lsf_host, 'id_rsa')
+        self.assertEqual(len(self.liveness_checks_done), 2,
+                         msg='The master connection must be checked again after ssh failed!')
+
+    def test_fixes_the_permissions_of_an_existing_control_sockets_dir(self):
+        """
+        Tests that if the control sockets dir already exists and other users can access it, its permissions are fixed
+        """
+        os.makedirs(ssh_connections.CONTROL_SOCKETS_DIR)
+        os.chmod(ssh_connections.CONTROL_SOCKETS_DIR, 0o777)
+
+        connection_is_available = ssh_connections.ensure_master_connection('lsf_user', 'lsf_host', 'id_rsa')
+        self.assertTrue(connection_is_available, msg='The master connection must be available!')
+        mode_got = stat.S_IMODE(os.stat(ssh_connections.CONTROL_SOCKETS_DIR).st_mode)
+        self.assertEqual(mode_got, 0o700, msg='Only the owner must be able to use the control sockets dir!')
+
+    def test_does_not_share_connections_in_a_control_sockets_dir_of_another_user(self):
+        """
+        Tests that the connections are not shared when the control sockets dir is owned by another user, or is not a
+        real dir
+        """
+        os.symlink(self.tmp_dir, ssh_connections.CONTROL_SOCKETS_DIR)
+
+        connection_is_available = ssh_connections.ensure_master_connection('lsf_user', 'lsf_host', 'id_rsa')
+        self.assertFalse(connection_is_available, msg='The master connection must not be used!')
+        self.assertEqual(ssh_connections.get_ssh_connection_options('lsf_user', 'lsf_host'), '',
+                         msg='The scripts must not use the control sockets dir!')
+        self.assertEqual(len(self.liveness_checks_done), 0, msg='The master connection must not be checked!')
+
+        if os.getuid() != 0:
+            return
+        os.remove(ssh_connections.CONTROL_SOCKETS_DIR)
+        os.makedirs(ssh_connections.CONTROL_SOCKETS_DIR, mode=0o700)
+        os.chown(ssh_connections.CONTROL_SOCKETS_DIR, 12345, 12345)
+        self.assertEqual(ssh_connections.get_ssh_connection_options('lsf_user', 'lsf_host'), '',
+                         msg='The scripts must not use a control sockets dir owned by another user!')
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+    Benchmark of the processing of the output of bjobs by the status daemon. It creates queued jobs and synthetic bjobs
+    records that report them as running, then processes them loading and committing each job separately (the previous
+    behaviour), and loading the jobs with one query and committing them in chunks. It reports the time taken, the
+    queries and the commits done. By default it uses a temporary SQLite file, use --database-uri to use another
+    database. The jobs created are deleted after each mode.
+    Usage:
+    CONFIG_FILE_PATH=<Path to your configuration file> python -m benchmarks.bench_bjobs_records --num-records 10000
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import tempfile
+import time
+from pathlib import Path
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('--num-records', help='number of bjobs records to process', type=int, default=10000)
+PARSER.add_argument('--database-uri', help='database to use instead of a temporary SQLite file')
+ARGS = PARSER.parse_args()
+
+
+def react_to_each_record_separately(json_output):
+    """
+    Processes the records as it was done before, loading each job with its own query and committing it separately
+    :param json_output: dict with the output parsed from bjobs
+    """
+    from app import executors
+    from app.models import delayed_job_models
+    from app.job_status_daemon import daemon
+
+    lsf_host = executors.get_executor().get_host()
+    for record in json_output['RECORDS']:
+        job = delayed_job_models.get_job_to_check_by_lsf_id(int(record['JOBID']), lsf_host)
+        daemon.react_to_bjobs_record(job, record)
+
+
+def create_jobs():
+    """
+    Creates the queued jobs of the benchmark with one insert
+    :return: the bjobs records that report the jobs as running
+    """
+    from app import executors
+    from app.config import RUN_CONFIG
+    from app.db import DB
+    from app.models import delayed_job_models
+
+    now = datetime.datetime.utcnow()
+    DB.session.bulk_insert_mappings(delayed_job_models.DelayedJob, [{
+        'id': f'Job-bench-{lsf_job_id}',
+        'type': 'TEST',
+        'status': delayed_job_models.JobStatuses.QUEUED,
+        'lsf_job_id': lsf_job_id,
+        'lsf_host': executors.get_executor().get_host(),
+        'run_environment': RUN_CONFIG.get('run_env'),
+        'created_at': now,
+    } for lsf_job_id in range(ARGS.num_records)])
+    DB.session.commit()
+
+    return [{'JOBID': str(lsf_job_id), 'STAT': 'RUN', 'START_TIME': 'Feb 19 11:30', 'FINISH_TIME': 'Feb 19 11:30 L'}
+            for lsf_job_id in range(ARGS.num_records)]
+
+
+def run_mode(mode, database_uri):
+    """
+    Processes the bjobs records in the mode given
+    :param mode: 'per_record' or 'batched'
+    :param database_uri: uri of the database to use
+    :return: a tuple with the seconds taken, the queries and the commits done
+    """
+    from sqlalchemy import event
+
+    from app import create_app
+    from app.config import RUN_CONFIG
+    from app.db import DB
+    from app.models import delayed_job_models
+    from app.job_status_daemon import daemon
+
+    RUN_CONFIG['sql_alchemy']['database_uri'] = database_uri
+    flask_app = create_app()
+
+    queries_done = []
+    commits_done = []
+
+    def register_query(*args):
+        queries_done.append(args)
+
+    def register_commit(conn):
+        commits_done.append(conn)
+
+    with flask_app.app_context():
+        records = create_jobs()
+        react_to_records = react_to_each_record_separately if mode == 'per_record' \
+            else daemon.react_to_bjobs_json_output
+
+        event.listen(DB.engine, 'before_cursor_execute', register_query)
+        event.listen(DB.engine, 'commit', register_commit)
+        # The daemon prints every change, it is not part of what is measured
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            react_to_records({'RECORDS': records})
+            seconds_taken = time.perf_counter() - start_time
+        event.remove(DB.engine, 'before_cursor_execute', register_query)
+        event.remove(DB.engine, 'commit', register_commit)
+
+        num_running = delayed_job_models.DelayedJob.query.filter_by(
+            status=delayed_job_models.JobStatuses.RUNNING).count()
+        assert num_running == ARGS.num_records, f'Only {num_running} jobs were changed to running!'
+        delayed_job_models.delete_all_jobs()
+
+    return seconds_taken, len(queries_done), len(commits_done)
+
+
+def run():
+    """
+    Runs the benchmark
+    """
+    from app.config import RUN_CONFIG
+
+    print(f'Benchmarking the processing of {ARGS.num_records} bjobs records')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = []
+        for mode in ['per_record', 'batched']:
+            if ARGS.database_uri is None:
+                database_uri = f'sqlite:///{Path(tmp_dir).joinpath(f"{mode}.db")}'
+                RUN_CONFIG['sql_alchemy']['create_tables'] = True
+                RUN_CONFIG['generate_default_config'] = True
+            else:
+                database_uri = ARGS.database_uri
+            results.append((mode, *run_mode(mode, database_uri)))
+
+    print(f'{"mode":<15}{"seconds":>10}{"records/s":>12}{"queries":>10}{"commits":>10}')
+    for mode, seconds_taken, num_queries, num_commits in results:
+        print(f'{mode:<15}{seconds_taken:>10.2f}{ARGS.num_records / seconds_taken:>12.1f}{num_queries:>10}'
+              f'{num_commits:>10}')
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+    Benchmark that compares the peak memory and the time taken to save and hash an uploaded input file. It compares
+    the previous implementation (save the file, then read it completely into memory to hash it) with the chunked one.
+    Each implementation runs in a separate process so the peak RSS of one does not affect the other.
+    Usage:
+    CONFIG_FILE_PATH=<Path to your configuration file> python -m benchmarks.bench_input_files_hashing --size-mb 512
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('--size-mb', help='size in megabytes of the input file to hash', type=int, default=256)
+PARSER.add_argument('--implementation', help='runs only one of the implementations (used internally)',
+                    choices=['previous', 'chunked'])
+PARSER.add_argument('--input-path', help='path of the input file to use (used internally)')
+ARGS = PARSER.parse_args()
+
+
+def save_and_hash_previous(parameter, dest_path):
+    """
+    Previous implementation: saves the file and then reads it fully into memory to hash it
+    :param parameter: the uploaded file
+    :param dest_path: where to save the file
+    :return: the hash of the file
+    """
+    parameter.save(str(dest_path))
+    with open(dest_path, 'rb') as input_file:
+        file_bytes = input_file.read()
+        return hashlib.sha256(file_bytes).hexdigest()
+
+
+def run_implementation(implementation, input_path):
+    """
+    Runs one of the implementations and prints a json with the results
+    :param implementation: name of the implementation to run
+    :param input_path: path of the file that simulates the upload
+    """
+    from app.blueprints.job_submission.services import job_submission_service
+
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with tempfile.TemporaryDirectory() as tmp_dir, open(input_path, 'rb') as upload_stream:
+        parameter = FileStorage(stream=upload_stream, filename='input.sdf')
+        dest_path = Path(tmp_dir).joinpath('input.sdf')
+
+        start_time = time.perf_counter()
+        if implementation == 'previous':
+            file_hash = save_and_hash_previous(parameter, dest_path)
+        else:
+            file_hash = job_submission_service.save_input_file_and_get_hash(parameter, dest_path)
+        seconds_taken = time.perf_counter() - start_time
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'implementation': implementation,
+        'hash': file_hash,
+        'seconds_taken': seconds_taken,
+        'peak_rss_mb': peak_rss_kb / 1024,
+        'rss_increase_mb': (peak_rss_kb - baseline_rss_kb) / 1024
+    }))
+
+
+def create_input_file(dir_path, size_mb):
+    """
+    Creates a file of the size given to simulate an uploaded input
+    :param dir_path: directory where to create the file
+    :param size_mb: size of the file in megabytes
+    :return: the path of the file created
+    """
+    input_path = Path(dir_path).joinpath('benchmark_input.sdf')
+    one_mb = os.urandom(1024 * 1024)
+    with open(input_path, 'wb') as input_file:
+        for _ in range(size_mb):
+            input_file.write(one_mb)
+
+    return input_path
+
+
+def run():
+    """
+    Runs the benchmark
+    """
+    if ARGS.implementation is not None:
+        run_implementation(ARGS.implementation, ARGS.input_path)
+        return
+
+    print(f'Benchmarking the saving and hashing of a {ARGS.size_mb} MB input file')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = create_input_file(tmp_dir, ARGS.size_mb)
+
+        results = []
+        for implementation in ['previous', 'chunked']:
+            command = [sys.executable, '-m', 'benchmarks.bench_input_files_hashing',
+                       '--implementation', implementation, '--input-path', str(input_path)]
+            process = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+            results.append(json.loads(process.stdout.decode().strip().split('\n')[-1]))
+
+    hashes = {result['hash'] for result in results}
+    assert len(hashes) == 1, 'Both implementations must produce the same hash!'
+
+    print(f'{"implementation":<15}{"seconds":>10}{"peak RSS (MB)":>16}{"RSS increase (MB)":>20}')
+    for result in results:
+        print(f'{result["implementation"]:<15}{result["seconds_taken"]:>10.3f}{result["peak_rss_mb"]:>16.1f}'
+              f'{result["rss_increase_mb"]:>20.1f}')
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+    Load test of the job status endpoint. It creates jobs with input and output files, then requests their status from
+    several threads with the flask test client, and reports the requests per second, the latency and the queries done
+    per request. It compares reading the status with one query with loading and refreshing the job with the ORM (the
+    previous behaviour). By default it uses a temporary SQLite file, use --database-uri to use another database. The
+    jobs created are deleted after each mode.
+    Usage:
+    CONFIG_FILE_PATH=<Path to your configuration file> python -m benchmarks.bench_job_status_requests \
+    --num-jobs 100 --num-requests 5000 --num-threads 8
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('--num-jobs', help='number of jobs to create', type=int, default=100)
+PARSER.add_argument('--num-requests', help='number of status requests to do in each mode', type=int, default=5000)
+PARSER.add_argument('--num-threads', help='number of threads doing the requests', type=int, default=8)
+PARSER.add_argument('--database-uri', help='database to use instead of a temporary SQLite file')
+ARGS = PARSER.parse_args()
+
+
+def get_job_status_with_orm(job_id, server_base_url='http://0.0.0.0:5000'):
+    """
+    Reads the status of a job as it was done before, loading and refreshing the job with the ORM
+    :param job_id: id of the job
+    :param server_base_url: url to use as base for building the output files urls
+    :return: a dict with the public properties of the job
+    """
+    from app.models import delayed_job_models
+
+    job = delayed_job_models.get_job_by_id(job_id, force_refresh=True)
+    return job.public_dict(server_base_url)
+
+
+def create_jobs():
+    """
+    Creates the jobs of the benchmark, each one with 2 input files and 3 output files
+    :return: the ids of the jobs created
+    """
+    from app.models import delayed_job_models
+
+    job_ids = []
+    for job_number in range(ARGS.num_jobs):
+        with delayed_job_models.unit_of_work():
+            job = delayed_job_models.get_or_create('TEST', {'job_number': job_number}, 'some_url')
+            for input_key in ['input1', 'input2']:
+                delayed_job_models.add_input_file_to_job(job, delayed_job_models.InputFile(
+                    input_key=input_key, internal_path=f'/tmp/{job.id}/{input_key}.txt',
+                    public_url=f'/status/inputs/{job.id}/{input_key}'))
+            for output_name in ['results.json', 'results.csv', 'summary.txt']:
+                delayed_job_models.add_output_to_job(job, f'/tmp/{job.id}/{output_name}',
+                                                     f'/outputs/{job.id}/{output_name}')
+        job_ids.append(job.id)
+
+    return job_ids
+
+
+def run_mode(mode, database_uri):
+    """
+    Requests the status of the jobs in the mode given
+    :param mode: 'orm_refresh' or 'single_query'
+    :param database_uri: uri of the database to use
+    :return: a tuple with the requests per second, the median and 95th percentile latencies in milliseconds and the
+    queries per request
+    """
+    from sqlalchemy import event
+
+    from app import create_app
+    from app.config import RUN_CONFIG
+    from app.db import DB
+    from app.models import delayed_job_models
+    from app.rate_limiter import RATE_LIMITER
+
+    RUN_CONFIG['sql_alchemy']['database_uri'] = database_uri
+
+    get_job_public_dict_was = delayed_job_models.get_job_public_dict
+    if mode == 'orm_refresh':
+        delayed_job_models.get_job_public_dict = get_job_status_with_orm
+
+    flask_app = create_app()
+    RATE_LIMITER.enabled = False
+    with flask_app.app_context():
+        job_ids = create_jobs()
+
+    queries_done = []
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def register_query(*args):
+        queries_done.append(args)
+
+    def request_statuses(thread_number):
+        client = flask_app.test_client()
+        thread_latencies = []
+        for request_number in range(thread_number, ARGS.num_requests, ARGS.num_threads):
+            job_id = job_ids[request_number % len(job_ids)]
+            request_start = time.perf_counter()
+            response = client.get(f'/status/{job_id}')
+            thread_latencies.append(time.perf_counter() - request_start)
+            assert response.status_code == 200, f'The status of {job_id} could not be read!'
+        with latencies_lock:
+            latencies.extend(thread_latencies)
+
+    try:
+        with flask_app.app_context():
+            event.listen(DB.engine, 'before_cursor_execute', register_query)
+            threads = [threading.Thread(target=request_statuses, args=(thread_number,))
+                       for thread_number in range(ARGS.num_threads)]
+            start_time = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            seconds_taken = time.perf_counter() - start_time
+            event.remove(DB.engine, 'before_cursor_execute', register_query)
+
+            delayed_job_models.delete_all_jobs()
+    finally:
+        delayed_job_models.get_job_public_dict = get_job_public_dict_was
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    p95_latency_ms = latencies_ms[int(len(latencies_ms) * 0.95) - 1]
+    return ARGS.num_requests / seconds_taken, statistics.median(latencies_ms), p95_latency_ms, \
+        len(queries_done) / ARGS.num_requests
+
+
+def run():
+    """
+    Runs the benchmark
+    """
+    from app.config import RUN_CONFIG
+
+    print(f'Benchmarking {ARGS.num_requests} status requests of {ARGS.num_jobs} jobs from {ARGS.num_threads} threads')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = []
+        for mode in ['orm_refresh', 'single_query']:
+            if ARGS.database_uri is None:
+                database_uri = f'sqlite:///{Path(tmp_dir).joinpath(f"{mode}.db")}'
+                RUN_CONFIG['sql_alchemy']['create_tables'] = True
+                RUN_CONFIG['generate_default_config'] = True
+            else:
+                database_uri = ARGS.database_uri
+            results.append((mode, *run_mode(mode, database_uri)))
+
+    print(f'{"mode":<15}{"requests/s":>12}{"p50 ms":>10}{"p95 ms":>10}{"queries/request":>18}')
+    for mode, requests_per_second, p50_latency_ms, p95_latency_ms, queries_per_request in results:
+        print(f'{mode:<15}{requests_per_second:>12.1f}{p50_latency_ms:>10.2f}{p95_latency_ms:>10.2f}'
+              f'{queries_per_request:>18.1f}')
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+    Benchmark of the cost of a tick of the status daemon against the size of the jobs table. For each table size it
+    fills the table with finished jobs and a fixed number of jobs in progress, then measures the queries of a tick:
+    finding the lsf ids of the jobs to check, and loading those jobs by their lsf ids. It compares a database without
+    the indexes of the jobs table (the previous schema) with one that has them. By default it uses temporary SQLite
+    files, use --database-uri-without-indexes and --database-uri-with-indexes to use other (empty) databases.
+    Usage:
+    CONFIG_FILE_PATH=<Path to your configuration file> python -m benchmarks.bench_jobs_to_check_scaling \
+    --table-sizes 10000 100000 1000000 --num-jobs-in-progress 1000
+"""
+import argparse
+import datetime
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('--table-sizes', help='numbers of jobs in the table to measure', type=int, nargs='+',
+                    default=[10000, 100000, 1000000])
+PARSER.add_argument('--num-jobs-in-progress', help='number of jobs that are not finished', type=int, default=1000)
+PARSER.add_argument('--num-ticks', help='number of ticks measured for each table size', type=int, default=20)
+PARSER.add_argument('--database-uri-without-indexes', help='database to use instead of a temporary SQLite file')
+PARSER.add_argument('--database-uri-with-indexes', help='database to use instead of a temporary SQLite file')
+ARGS = PARSER.parse_args()
+
+LSF_HOST = 'bench_host'
+INSERT_CHUNK_SIZE = 10000
+
+
+def insert_jobs(first_job_number, last_job_number):
+    """
+    Inserts finished jobs in the table, the last ARGS.num_jobs_in_progress job numbers are running jobs
+    :param first_job_number: number of the first job to insert
+    :param last_job_number: number of the last job to insert (not included)
+    """
+    from app.config import RUN_CONFIG
+    from app.db import DB
+    from app.models import delayed_job_models
+
+    jobs_table = delayed_job_models.DelayedJob.__table__
+    now = datetime.datetime.utcnow()
+    for chunk_start in range(first_job_number, last_job_number, INSERT_CHUNK_SIZE):
+        chunk_end = min(chunk_start + INSERT_CHUNK_SIZE, last_job_number)
+        DB.session.execute(jobs_table.insert(), [{
+            'id': f'Job-bench-{job_number}',
+            'type': 'TEST',
+            'status': 'RUNNING' if job_number < ARGS.num_jobs_in_progress else 'FINISHED',
+            'lsf_job_id': job_number,
+            'lsf_host': LSF_HOST,
+            'run_environment': RUN_CONFIG.get('run_env'),
+            'created_at': now,
+        } for job_number in range(chunk_start, chunk_end)])
+        DB.session.commit()
+
+
+def measure_ticks():
+    """
+    Measures the queries of the ticks of the status daemon
+    :return: a tuple with the median milliseconds taken to find the jobs to check, and to load them
+    """
+    from app.db import DB
+    from app.models import delayed_job_models
+
+    find_times = []
+    load_times = []
+    for _ in range(ARGS.num_ticks):
+        start_time = time.perf_counter()
+        lsf_job_ids = delayed_job_models.get_lsf_job_ids_to_check(LSF_HOST)
+        find_times.append(time.perf_counter() - start_time)
+        assert len(lsf_job_ids) == ARGS.num_jobs_in_progress, f'{len(lsf_job_ids)} jobs to check were found!'
+
+        start_time = time.perf_counter()
+        jobs_by_lsf_id = delayed_job_models.get_jobs_to_check_by_lsf_ids(lsf_job_ids, LSF_HOST)
+        load_times.append(time.perf_counter() - start_time)
+        assert len(jobs_by_lsf_id) == ARGS.num_jobs_in_progress, f'{len(jobs_by_lsf_id)} jobs were loaded!'
+        DB.session.expunge_all()
+
+    return statistics.median(find_times) * 1000, statistics.median(load_times) * 1000
+
+
+def run_mode(mode, database_uri):
+    """
+    Measures the ticks for all the table sizes in the mode given
+    :param mode: 'without_indexes' or 'with_indexes'
+    :param database_uri: uri of the database to use
+    :return: a list of tuples with the table size and the median milliseconds to find and load the jobs
+    """
+    from app import create_app
+    from app.config import RUN_CONFIG
+    from app.db import DB
+    from app.models import delayed_job_models
+
+    RUN_CONFIG['sql_alchemy']['database_uri'] = database_uri
+    flask_app = create_app()
+
+    results = []
+    with flask_app.app_context():
+        if mode == 'without_indexes':
+            for index in delayed_job_models.DelayedJob.__table__.indexes:
+                index.drop(bind=DB.engine)
+
+        num_jobs_inserted = 0
+        for table_size in sorted(ARGS.table_sizes):
+            insert_jobs(num_jobs_inserted, table_size)
+            num_jobs_inserted = table_size
+            results.append((table_size, *measure_ticks()))
+            print(f'{mode}: measured {table_size} jobs')
+
+        delayed_job_models.delete_all_jobs()
+        if mode == 'without_indexes':
+            delayed_job_models.create_missing_indexes()
+
+    return results
+
+
+def run():
+    """
+    Runs the benchmark
+    """
+    from app.config import RUN_CONFIG
+
+    print(f'Benchmarking the ticks of the status daemon with {ARGS.num_jobs_in_progress} jobs in progress')
+    database_uris = {
+        'without_indexes': ARGS.database_uri_without_indexes,
+        'with_indexes': ARGS.database_uri_with_indexes,
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for mode, database_uri in database_uris.items():
+            if database_uri is None:
+                database_uri = f'sqlite:///{Path(tmp_dir).joinpath(f"{mode}.db")}'
+                RUN_CONFIG['sql_alchemy']['create_tables'] = True
+                RUN_CONFIG['generate_default_config'] = True
+            results[mode] = run_mode(mode, database_uri)
+
+    print(f'{"table size":>12}{"mode":>18}{"find ms":>10}{"load ms":>10}{"tick ms":>10}')
+    for mode_results in zip(*results.values()):
+        for mode, (table_size, find_ms, load_ms) in zip(results.keys(), mode_results):
+            print(f'{table_size:>12}{mode:>18}{find_ms:>10.2f}{load_ms:>10.2f}{find_ms + load_ms:>10.2f}')
+
+
+if __name__ == "__main__":
+    run()
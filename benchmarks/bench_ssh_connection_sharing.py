@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+    Benchmark that compares the latency of submitting jobs with the submission script with and without sharing the ssh
+    connection to the LSF host. By default, it starts a local sshd as a stand in of the LSF head node, the bsub
+    command is replaced by a shell function that prints what bsub prints.
+    Usage:
+    CONFIG_FILE_PATH=<Path to your configuration file> python -m benchmarks.bench_ssh_connection_sharing \
+    --num-submissions 50 --sshd-path /usr/sbin/sshd
+    To use a real host instead of the local sshd:
+    CONFIG_FILE_PATH=<Path to your configuration file> python -m benchmarks.bench_ssh_connection_sharing \
+    --lsf-user <user> --lsf-host <host> --identity-file <path to the private key>
+"""
+import argparse
+import getpass
+import os
+import socket
+import statistics
+import stat
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('--num-submissions', help='number of submissions to do in each mode', type=int, default=20)
+PARSER.add_argument('--sshd-path', help='path of the sshd binary for the local stand in', default='/usr/sbin/sshd')
+PARSER.add_argument('--port', help='port for the local sshd', type=int, default=2222)
+PARSER.add_argument('--lsf-user', help='user of a real host to use instead of the local sshd')
+PARSER.add_argument('--lsf-host', help='real host to use instead of the local sshd')
+PARSER.add_argument('--identity-file', help='private key for the real host')
+ARGS = PARSER.parse_args()
+
+STAND_IN_HOST_ALIAS = 'delayed-jobs-bench-sshd'
+# Replaces bsub in the remote host, it prints the same output that bsub prints
+FAKE_BSUB = 'bsub() { echo "Job <$RANDOM> is submitted to default queue <normal>."; }\n'
+
+
+def run_command(command):
+    """
+    Runs the command given and fails if it does not succeed
+    :param command: list with the command and its arguments
+    """
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+
+def start_local_sshd(work_dir):
+    """
+    Starts a sshd in localhost that accepts a key generated for the benchmark. It also puts in the PATH a wrapper of
+    ssh that knows how to reach the local sshd, so the scripts and the app can connect to it by its alias.
+    :param work_dir: directory where to put the keys and configuration
+    :return: a tuple (sshd_process, user, host, identity_file)
+    """
+    work_dir = Path(work_dir)
+    host_key_path = work_dir.joinpath('host_key')
+    client_key_path = work_dir.joinpath('client_key')
+    run_command(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', str(host_key_path)])
+    run_command(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', str(client_key_path)])
+
+    sshd_config_path = work_dir.joinpath('sshd_config')
+    sshd_config_path.write_text(
+        f'Port {ARGS.port}\n'
+        f'ListenAddress 127.0.0.1\n'
+        f'HostKey {host_key_path}\n'
+        f'AuthorizedKeysFile {client_key_path}.pub\n'
+        f'PidFile {work_dir.joinpath("sshd.pid")}\n'
+        f'StrictModes no\n'
+        f'UsePAM no\n'
+        f'PasswordAuthentication no\n'
+    )
+    sshd_process = subprocess.Popen([ARGS.sshd_path, '-D', '-e', '-f', str(sshd_config_path)],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', ARGS.port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    ssh_config_path = work_dir.joinpath('ssh_config')
+    ssh_config_path.write_text(
+        f'Host {STAND_IN_HOST_ALIAS}\n'
+        f'  HostName 127.0.0.1\n'
+        f'  Port {ARGS.port}\n'
+        f'  UserKnownHostsFile /dev/null\n'
+        f'  LogLevel ERROR\n'
+    )
+    wrappers_dir = work_dir.joinpath('bin')
+    wrappers_dir.mkdir()
+    ssh_wrapper_path = wrappers_dir.joinpath('ssh')
+    real_ssh_path = subprocess.run(['which', 'ssh'], stdout=subprocess.PIPE, check=True).stdout.decode().strip()
+    ssh_wrapper_path.write_text(f'#!/usr/bin/env bash\nexec {real_ssh_path} -F {ssh_config_path} "$@"\n')
+    os.chmod(ssh_wrapper_path, os.stat(ssh_wrapper_path).st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = f'{wrappers_dir}:{os.environ["PATH"]}'
+
+    return sshd_process, getpass.getuser(), STAND_IN_HOST_ALIAS, str(client_key_path)
+
+
+def time_submissions(script, identity_file, before_submission):
+    """
+    Runs the submission script the number of times requested and measures how long each one takes
+    :param script: text of the submission script
+    :param identity_file: private key to use
+    :param before_submission: function to call before each submission, it is included in the time measured
+    :return: a list with the seconds taken by each submission
+    """
+    from app import script_templates
+
+    seconds_taken = []
+    for _ in range(ARGS.num_submissions):
+        start_time = time.perf_counter()
+        before_submission()
+        submission_process = script_templates.run_script(script, [identity_file])
+        seconds_taken.append(time.perf_counter() - start_time)
+        assert submission_process.returncode == 0, submission_process.stderr.decode()
+        assert 'Job <' in submission_process.stdout.decode(), 'The submission did not print the LSF job id!'
+
+    return seconds_taken
+
+
+def get_submission_script(lsf_user, lsf_host, ssh_connection_options):
+    """
+    Generates a submission script from the job submission template
+    :param lsf_user: user to connect with
+    :param lsf_host: host to connect to
+    :param ssh_connection_options: options to share the ssh connection
+    :return: the text of the script
+    """
+    from app import script_templates
+
+    script = script_templates.render(
+        script_templates.SUBMIT_JOB_TEMPLATE,
+        JOB_ID='BENCHMARK-JOB',
+        LSF_USER=lsf_user,
+        LSF_HOST=lsf_host,
+        SSH_CONNECTION_OPTIONS=ssh_connection_options,
+        SET_DOCKER_REGISTRY_CREDENTIALS=FAKE_BSUB,
+        RESOURCES_PARAMS='',
+        RUN_DIR='/tmp/benchmark_run_dir',
+        DOCKER_IMAGE_URL='docker://benchmark',
+        RUN_PARAMS_FILE='/tmp/benchmark_run_dir/run_params.yml'
+    )
+    return script.replace('set -x\n', '')
+
+
+def print_results(mode, seconds_taken):
+    """
+    Prints the statistics of the latencies of one mode
+    :param mode: name of the mode
+    :param seconds_taken: list with the seconds taken by each submission
+    """
+    milliseconds = sorted(seconds * 1000 for seconds in seconds_taken)
+    p95 = milliseconds[min(len(milliseconds) - 1, int(len(milliseconds) * 0.95))]
+    print(f'{mode:<20}{statistics.mean(milliseconds):>12.1f}{statistics.median(milliseconds):>12.1f}{p95:>12.1f}')
+
+
+def run():
+    """
+    Runs the benchmark
+    """
+    from app import ssh_connections
+    ssh_connections.CONNECTION_SHARING_ENABLED = True
+
+    if ARGS.lsf_host is None and not os.path.isfile(ARGS.sshd_path):
+        print(f'sshd was not found in {ARGS.sshd_path}, use --sshd-path or --lsf-host')
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        sshd_process = None
+        if ARGS.lsf_host is None:
+            sshd_process, lsf_user, lsf_host, identity_file = start_local_sshd(work_dir)
+        else:
+            lsf_user, lsf_host, identity_file = ARGS.lsf_user, ARGS.lsf_host, ARGS.identity_file
+
+        try:
+            print(f'Benchmarking {ARGS.num_submissions} submissions to {lsf_user}@{lsf_host}')
+            script_without_sharing = get_submission_script(lsf_user, lsf_host, '')
+            script_with_sharing = get_submission_script(
+                lsf_user, lsf_host, ssh_connections.get_ssh_connection_options(lsf_user, lsf_host))
+
+            without_sharing = time_submissions(script_without_sharing, identity_file, lambda: None)
+            with_sharing = time_submissions(
+                script_with_sharing, identity_file,
+                lambda: ssh_connections.ensure_master_connection(lsf_user, lsf_host, identity_file))
+
+            print(f'{"mode":<20}{"mean (ms)":>12}{"median (ms)":>12}{"p95 (ms)":>12}')
+            print_results('without sharing', without_sharing)
+            print_results('with sharing', with_sharing)
+        finally:
+            subprocess.run(ssh_connections.get_master_connection_command(lsf_user, lsf_host, identity_file,
+                                                                         '-O', 'exit'),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if sshd_process is not None:
+                sshd_process.terminate()
+                sshd_process.wait()
+
+
+if __name__ == "__main__":
+    run()
@@ -7,7 +7,7 @@ IDENTITY_FILE=$1
 echo "I am going to check the status of the LSF jobs {LSF_JOB_IDS}"
 
 echo 'START_REMOTE_SSH'
-ssh {LSF_USER}@{LSF_HOST} -i $IDENTITY_FILE -oStrictHostKeyChecking=no <<ENDSSH
+ssh {LSF_USER}@{LSF_HOST} -i $IDENTITY_FILE -oStrictHostKeyChecking=no {SSH_CONNECTION_OPTIONS} <<ENDSSH
 bjobs -json -o "id stat start_time finish_time" {LSF_JOB_IDS}
 ENDSSH
 echo 'FINISH_REMOTE_SSH'
\ No newline at end of file
@@ -0,0 +1,11 @@
+#!/usr/bin/env bash
+set -x
+set -e
+
+IDENTITY_FILE=$1
+
+echo "I am going to kill the LSF jobs {LSF_JOB_IDS}"
+
+ssh {LSF_USER}@{LSF_HOST} -i $IDENTITY_FILE -oStrictHostKeyChecking=no {SSH_CONNECTION_OPTIONS} <<ENDSSH
+bkill {LSF_JOB_IDS}
+ENDSSH
\ No newline at end of file
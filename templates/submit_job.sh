@@ -6,7 +6,7 @@ IDENTITY_FILE=$1
 
 echo "I am going to submit the job {JOB_ID}"
 
-ssh {LSF_USER}@{LSF_HOST} -i $IDENTITY_FILE -oStrictHostKeyChecking=no <<ENDSSH
+ssh {LSF_USER}@{LSF_HOST} -i $IDENTITY_FILE -oStrictHostKeyChecking=no {SSH_CONNECTION_OPTIONS} <<ENDSSH
 {SET_DOCKER_REGISTRY_CREDENTIALS}
 export LSB_JOB_REPORT_MAIL=N
 bsub {RESOURCES_PARAMS} -J {JOB_ID} -o {RUN_DIR}/job_run.out -e {RUN_DIR}/job_run.err "singularity exec {DOCKER_IMAGE_URL} /app/run_job.sh {RUN_PARAMS_FILE}"